@@ -0,0 +1,170 @@
+"""
+Load-test client for the prompt server (`stance_detection/prompt_server.py`).
+
+Opens `--concurrency` keep-alive connections to the server and sends `--requests` POST /render calls
+in total, each carrying `--batch_size` prompt requests built from the bundled test tweets. Reports
+throughput (calls and prompts per second) and p50/p99/max call latency, and optionally writes them as
+JSON. With `--spawn_server`, a server is started on the given port for the duration of the test.
+
+Usage:
+    python benchmarks/load_test.py --spawn_server --concurrency 32 --requests 20000
+    python benchmarks/load_test.py --port 8080 --batch_size 16 --shot few_shot --output load.json
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+SERVER_SCRIPT = os.path.join(ROOT_DIR, "stance_detection", "prompt_server.py")
+
+
+def load_requests(dataset_name: str, model_name: str, shot: str) -> list:
+    """
+    Builds prompt requests from the bundled semeval2016 or PStance test tweets.
+    """
+    if dataset_name == "semeval2016":
+        path, delimiter = os.path.join(DATA_DIR, "semeval2016", "test.tsv"), "\t"
+    elif dataset_name == "PStance":
+        path, delimiter = os.path.join(DATA_DIR, "PStance", "raw_test_trump.csv"), ","
+    else:
+        raise ValueError("The load test supports the 'semeval2016' and 'PStance' datasets.")
+
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter=delimiter))
+    return [
+        {"tweet": row["Tweet"], "target": row["Target"], "dataset": dataset_name, "model": model_name, "shot": shot}
+        for row in rows
+    ]
+
+
+async def _post(reader, writer, host: str, body: bytes) -> dict:
+    writer.write(
+        f"POST /render HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    payload = json.loads(await reader.readexactly(length))
+    if b" 200 " not in status_line:
+        raise ValueError(f"Server answered {status_line.decode('latin-1').strip()}: {payload.get('error')}")
+    return payload
+
+
+async def _client(host: str, port: int, bodies: list, latencies: list, counter: list):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while counter[0] > 0:
+            counter[0] -= 1
+            body = bodies[counter[0] % len(bodies)]
+            start = time.perf_counter()
+            await _post(reader, writer, host, body)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load_test(host: str, port: int, requests: list, concurrency: int, total_calls: int, batch_size: int) -> dict:
+    """
+    Sends `total_calls` calls over `concurrency` connections and returns throughput and latency figures.
+    """
+    bodies = []
+    for start in range(0, len(requests), batch_size):
+        batch = requests[start:start + batch_size]
+        bodies.append(json.dumps(batch if batch_size > 1 else batch[0]).encode("utf-8"))
+
+    latencies, counter = [], [total_calls]
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, bodies, latencies, counter) for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+
+    def at(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 3)
+
+    return {
+        "calls": len(latencies),
+        "prompts": len(latencies) * batch_size,
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "seconds": round(seconds, 3),
+        "calls_per_second": round(len(latencies) / seconds, 1),
+        "prompts_per_second": round(len(latencies) * batch_size / seconds, 1),
+        "p50_ms": at(50),
+        "p99_ms": at(99),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def _wait_for_server(host: str, port: int, timeout: float = 30.0):
+    import socket
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise ValueError(f"The prompt server did not start on {host}:{port}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the prompt server on localhost")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Server address")
+    parser.add_argument("--port", type=int, default=8080, help="Server port")
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of concurrent keep-alive connections")
+    parser.add_argument("--requests", type=int, default=20000, help="Total number of POST /render calls")
+    parser.add_argument("--batch_size", type=int, default=1, help="Prompt requests per call")
+    parser.add_argument("--dataset_name", type=str, default="semeval2016", choices=["semeval2016", "PStance"], help="Dataset of the requests")
+    parser.add_argument("--model_name", type=str, default="qwen2", help="Model of the requests")
+    parser.add_argument("--shot", type=str, default="zero_shot", choices=["zero_shot", "few_shot"], help="Shot type of the requests")
+    parser.add_argument("--spawn_server", action="store_true", help="Start a prompt server on --port for the duration of the test")
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn_server:
+        server = subprocess.Popen(
+            [sys.executable, SERVER_SCRIPT, "--host", args.host, "--port", str(args.port), "--data_dir", DATA_DIR,
+             "--seed", "0", "--preload", args.dataset_name, "--preload_models", args.model_name],
+            stdout=subprocess.DEVNULL,
+        )
+    try:
+        _wait_for_server(args.host, args.port)
+        requests = load_requests(args.dataset_name, args.model_name, args.shot)
+        results = asyncio.run(
+            run_load_test(args.host, args.port, requests, args.concurrency, args.requests, args.batch_size)
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(
+        f"{results['calls']} calls ({results['prompts']} prompts) in {results['seconds']:.2f}s: "
+        f"{results['calls_per_second']:,.0f} calls/sec, {results['prompts_per_second']:,.0f} prompts/sec, "
+        f"p50 {results['p50_ms']:.2f}ms, p99 {results['p99_ms']:.2f}ms, max {results['max_ms']:.2f}ms"
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Load test results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Benchmark suite for template rendering and end-to-end prompt generation.
+
+Four groups of benchmarks are run:
+
+    - `templates`: every template function in `prompts.py`, called directly and through its compiled
+      form (`template_compiler.compile_template`), timed per call.
+    - `bundled`: `generate_zero_shot_prompts` and `generate_few_shot_prompts` end to end on the files in `data/`.
+    - `synthetic`: the same generators on semeval2016-shaped inputs scaled to `--synthetic_rows` rows
+      (1M by default), built by repeating the bundled test tweets.
+    - `formats`: `generate_zero_shot_prompts` on a synthetic input of `--format_rows` rows (100k by default)
+      with every output format and, for the `json_min` and `jsonl` formats, every installed JSON encoder.
+      Formats and encoders whose package is not installed are skipped.
+
+Each end-to-end case runs in a fresh Python process, so that its peak RSS is measured on its own. Rows are
+rendered and serialized in chunks (`parallel.render_rows`), so the per-row latency of a case is its share of its
+chunk's render and serialization time (chunk seconds / rows in the chunk) plus the time its own write takes.
+Reading happens while chunks are filled and is not part of the latency, but is part of the throughput.
+Every benchmark reports throughput, p50/p99 latency and, for end-to-end cases, peak RSS and the size of the
+output file.
+
+Results are written as JSON (default: `benchmarks/results/<commit>.json`) together with the commit, Python
+version and machine, and can be compared against an earlier results file with `--compare`.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --groups templates bundled --compare benchmarks/results/abc1234.json
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import array
+import random
+import argparse
+import platform
+import functools
+import importlib.util
+import resource
+import tempfile
+import contextlib
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(ROOT_DIR, "stance_detection")
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+sys.path.insert(0, PACKAGE_DIR)
+
+GROUPS = ("templates", "bundled", "synthetic", "formats")
+
+# Package each output format or JSON encoder needs beyond the standard library
+FORMAT_PACKAGES = {"parquet": "pyarrow", "msgpack": "msgpack", "orjson": "orjson", "msgspec": "msgspec"}
+
+# Test file and candidate of each bundled zero-shot case
+BUNDLED_INPUTS = [
+    ("PStance", "bernie", "PStance/raw_test_bernie.csv"),
+    ("PStance", "biden", "PStance/raw_test_biden.csv"),
+    ("PStance", "trump", "PStance/raw_test_trump.csv"),
+    ("semeval2016", None, "semeval2016/test.tsv"),
+    ("twitter_stance_kemlm", "biden", "twitter_stance_kemlm/biden_stance_test_public.csv"),
+    ("twitter_stance_kemlm", "trump", "twitter_stance_kemlm/trump_stance_test_public.csv"),
+]
+
+
+def percentiles(values) -> dict:
+    """
+    Returns the p50 and p99 of a sequence of latencies in seconds, in microseconds.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50_us": None, "p99_us": None}
+
+    def at(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1e6
+
+    return {"p50_us": round(at(50), 3), "p99_us": round(at(99), 3)}
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of the current process in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def bench_templates(calls: int) -> list:
+    """
+    Times each template function in `prompts.py`, called directly and through its compiled form.
+    """
+    from template_compiler import compile_template
+    from template_registry import get_template, registry
+
+    with open(os.path.join(DATA_DIR, "semeval2016", "test.tsv"), newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    pairs = [(row["Tweet"], row["Target"]) for row in rows]
+    examples = [{"tweet": row["Tweet"], "target": row["Target"], "label": row["Stance"]} for row in rows[:3]]
+
+    results = []
+    for dataset_name, model_name, shot, source in registry.list():
+        if source != "prompts.py":
+            continue
+        function = get_template(dataset_name, model_name, shot)
+        name = registry.function_name(dataset_name, model_name, shot)
+        compiled = compile_template(function, examples if shot == "few_shot" else None)
+        # Both variants are called as `render(tweet, target)` with no wrapper of our own, so they pay the same call cost
+        direct = functools.partial(function, examples=examples) if shot == "few_shot" else function
+
+        for variant, render in (("function", direct), ("compiled", compiled.render)):
+            latencies = array.array("d")
+            clock = time.perf_counter
+            start = clock()
+            for i in range(calls):
+                tweet, target = pairs[i % len(pairs)]
+                call_start = clock()
+                render(tweet, target)
+                latencies.append(clock() - call_start)
+            seconds = clock() - start
+            results.append({
+                "group": "templates",
+                "name": f"{name}[{variant}]",
+                "calls": calls,
+                "seconds": round(seconds, 6),
+                "calls_per_second": round(calls / seconds, 1),
+                **percentiles(latencies),
+            })
+            print(f"{results[-1]['name']:<60} {results[-1]['calls_per_second']:>14,.0f} calls/sec  "
+                  f"p50 {results[-1]['p50_us']:.2f}us  p99 {results[-1]['p99_us']:.2f}us")
+    return results
+
+
+def write_synthetic_dataset(directory: str, rows: int, seed: int = 0) -> str:
+    """
+    Writes a semeval2016-shaped dataset with `rows` test rows to `<directory>/semeval2016`.
+
+    Test tweets are drawn from the bundled test file, each with a row number appended so that no two
+    rows are identical. The bundled train file is reused for the few-shot examples.
+    """
+    dataset_dir = os.path.join(directory, "semeval2016")
+    os.makedirs(dataset_dir, exist_ok=True)
+
+    with open(os.path.join(DATA_DIR, "semeval2016", "train.tsv"), "rb") as source, \
+            open(os.path.join(dataset_dir, "train.tsv"), "wb") as target:
+        target.write(source.read())
+
+    with open(os.path.join(DATA_DIR, "semeval2016", "test.tsv"), newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, delimiter="\t")
+        fieldnames = reader.fieldnames
+        source_rows = list(reader)
+
+    rng = random.Random(seed)
+    with open(os.path.join(dataset_dir, "test.tsv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter="\t")
+        writer.writeheader()
+        for i in range(rows):
+            row = dict(rng.choice(source_rows))
+            row["Tweet"] = f"{row['Tweet']} #{i}"
+            writer.writerow(row)
+    return dataset_dir
+
+
+def run_case(case: dict) -> dict:
+    """
+    Runs one end-to-end case in the current process and returns its measurements.
+    """
+    import output_writers
+    import parallel
+
+    render_shares = array.array("d")
+    write_seconds = array.array("d")
+    clock = time.perf_counter
+    write_serialized = output_writers.PromptWriter.write_serialized
+    render_rows = parallel.render_rows
+
+    def timed_render_rows(*args, **kwargs):
+        start = clock()
+        results = render_rows(*args, **kwargs)
+        if results:
+            render_shares.extend([(clock() - start) / len(results)] * len(results))
+        return results
+
+    def timed_write_serialized(self, text):
+        start = clock()
+        write_serialized(self, text)
+        write_seconds.append(clock() - start)
+
+    # Patched before the generators are imported, since they bind `render_rows` at import time; cases render
+    # in-process, so every chunk goes through the patched function
+    parallel.render_rows = timed_render_rows
+    output_writers.PromptWriter.write_serialized = timed_write_serialized
+
+    from generate_zero_shot_prompts import generate_zero_shot_prompts
+    from generate_few_shot_prompts import generate_few_shot_prompts
+    generate = generate_zero_shot_prompts if case["shot"] == "zero_shot" else generate_few_shot_prompts
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as output_dir, contextlib.redirect_stdout(open(os.devnull, "w")):
+        start = clock()
+        output_file = generate(output_dir=output_dir, **case["arguments"])
+        seconds = clock() - start
+        output_bytes = os.path.getsize(output_file)
+
+    rows = len(write_seconds)
+    latencies = [share + seconds for share, seconds in zip(render_shares, write_seconds)]
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+        **percentiles(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+        "output_bytes": output_bytes,
+    }
+
+
+def run_case_in_subprocess(group: str, name: str, case: dict) -> dict:
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run_case", json.dumps(case)],
+        check=True, capture_output=True, text=True,
+    )
+    result = {"group": group, "name": name, **json.loads(completed.stdout.strip().splitlines()[-1])}
+    print(f"{name:<60} {result['rows']:>9} rows {result['rows_per_second']:>12,.0f} rows/sec  "
+          f"p50 {result['p50_us']:.2f}us  p99 {result['p99_us']:.2f}us  peak RSS {result['peak_rss_mb']} MiB  "
+          f"output {result['output_bytes'] / (1024 * 1024):.1f} MiB")
+    return result
+
+
+def bundled_cases(models: list) -> list:
+    cases = []
+    for model_name in models:
+        for dataset_name, candidate_name, path in BUNDLED_INPUTS:
+            label = f"{dataset_name}_{model_name}" + (f"_{candidate_name}" if candidate_name else "")
+            cases.append((f"zero_shot:{label}", {"shot": "zero_shot", "arguments": {
+                "input_file": os.path.join(DATA_DIR, path), "dataset_name": dataset_name,
+                "model_name": model_name, "candidate_name": candidate_name,
+            }}))
+            cases.append((f"few_shot:{label}", {"shot": "few_shot", "arguments": {
+                "dataset_dir": os.path.join(DATA_DIR, dataset_name), "dataset_name": dataset_name,
+                "model_name": model_name, "candidate_name": candidate_name,
+            }}))
+    return cases
+
+
+def synthetic_cases(models: list, dataset_dir: str, rows: int) -> list:
+    cases = []
+    for model_name in models:
+        cases.append((f"zero_shot:synthetic_{rows}_{model_name}", {"shot": "zero_shot", "arguments": {
+            "input_file": os.path.join(dataset_dir, "test.tsv"), "dataset_name": "semeval2016", "model_name": model_name,
+        }}))
+        cases.append((f"few_shot:synthetic_{rows}_{model_name}", {"shot": "few_shot", "arguments": {
+            "dataset_dir": dataset_dir, "dataset_name": "semeval2016", "model_name": model_name,
+        }}))
+    return cases
+
+
+def format_cases(dataset_dir: str, rows: int) -> list:
+    from output_writers import OUTPUT_FORMATS, JSON_ENCODERS
+
+    cases = []
+    for output_format in OUTPUT_FORMATS:
+        encoders = [name for name in JSON_ENCODERS if name != "auto"] if output_format in ("json_min", "jsonl") else [None]
+        for encoder in encoders:
+            missing = [FORMAT_PACKAGES[name] for name in (output_format, encoder) if name in FORMAT_PACKAGES
+                       and importlib.util.find_spec(FORMAT_PACKAGES[name]) is None]
+            name = f"zero_shot:synthetic_{rows}_{output_format}" + (f"[{encoder}]" if encoder else "")
+            if missing:
+                print(f"{name:<60} skipped ({', '.join(missing)} not installed)")
+                continue
+            arguments = {
+                "input_file": os.path.join(dataset_dir, "test.tsv"), "dataset_name": "semeval2016",
+                "model_name": "qwen2", "output_format": output_format,
+            }
+            if encoder:
+                arguments["json_encoder"] = encoder
+            cases.append((name, {"shot": "zero_shot", "arguments": arguments}))
+    return cases
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, check=True, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: list, baseline_file: str):
+    """
+    Prints the throughput change of every benchmark that also appears in `baseline_file`.
+    """
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(result["group"], result["name"]): result for result in baseline["results"]}
+
+    print(f"\nCompared with {baseline_file} (commit {baseline.get('commit')}):")
+    for result in results:
+        old = previous.get((result["group"], result["name"]))
+        if old is None:
+            continue
+        metric = "calls_per_second" if result["group"] == "templates" else "rows_per_second"
+        if old.get(metric) and result.get(metric):
+            change = (result[metric] / old[metric] - 1) * 100
+            print(f"{result['name']:<60} {old[metric]:>14,.0f} -> {result[metric]:>14,.0f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark template rendering and prompt generation")
+    parser.add_argument("--groups", type=str, nargs="+", default=list(GROUPS), choices=GROUPS, help="Benchmark groups to run")
+    parser.add_argument("--models", type=str, nargs="+", default=["qwen2"], help="Models used for the end-to-end cases")
+    parser.add_argument("--calls", type=int, default=20000, help="Calls per template in the templates group")
+    parser.add_argument("--synthetic_rows", type=int, nargs="+", default=[1000000], help="Row counts of the synthetic inputs")
+    parser.add_argument("--format_rows", type=int, default=100000, help="Row count of the synthetic input of the formats group")
+    parser.add_argument("--output", type=str, default=None, help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", type=str, default=None, help="Earlier results file to compare throughput against")
+    parser.add_argument("--run_case", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return
+
+    results = []
+    if "templates" in args.groups:
+        results.extend(bench_templates(args.calls))
+    if "bundled" in args.groups:
+        for name, case in bundled_cases(args.models):
+            results.append(run_case_in_subprocess("bundled", name, case))
+    if "synthetic" in args.groups:
+        for rows in args.synthetic_rows:
+            with tempfile.TemporaryDirectory() as directory:
+                dataset_dir = write_synthetic_dataset(directory, rows)
+                for name, case in synthetic_cases(args.models, dataset_dir, rows):
+                    results.append(run_case_in_subprocess("synthetic", name, case))
+    if "formats" in args.groups:
+        with tempfile.TemporaryDirectory() as directory:
+            dataset_dir = write_synthetic_dataset(directory, args.format_rows)
+            for name, case in format_cases(dataset_dir, args.format_rows):
+                results.append(run_case_in_subprocess("formats", name, case))
+
+    commit = git_commit()
+    output_file = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }, f, indent=4)
+    print(f"Benchmark results saved to {output_file}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Bulk rendering of prompt columns.
+
+`render_column` renders a whole column of tweets and targets in one call, for use in dataframe and
+Arrow pipelines:
+
+    df["prompt"] = render_column(semeval2016_qwen2_zero_shot_template, df["tweet"], df["target"])
+
+The template is compiled once (see `template_compiler.py`). Arrow inputs (and Arrow-backed pandas
+columns) are rendered by Arrow itself: the compiled template's static segments and the tweet and target
+columns are joined element-wise by `pyarrow.compute.binary_join_element_wise`, so no Python code runs per
+row. Lists, tuples, NumPy arrays and other pandas columns are rendered with one C-level `map` over the
+compiled renderer, without a Python loop body per row.
+
+The result has the same kind as the tweets column: a list, a NumPy object array, a pandas Series with the
+same index, or an Arrow array. A missing tweet or target (None, NaN in pandas, null in Arrow) gives a
+missing prompt. `pyarrow`, `pandas` and `numpy` are only needed for their own input types.
+"""
+
+import sys
+
+from template_compiler import CompiledTemplate, compile_template
+from template_registry import get_template
+
+
+def _is_arrow(column) -> bool:
+    pyarrow = sys.modules.get("pyarrow")
+    return pyarrow is not None and isinstance(column, (pyarrow.Array, pyarrow.ChunkedArray))
+
+
+def _is_pandas(column) -> bool:
+    pandas = sys.modules.get("pandas")
+    return pandas is not None and isinstance(column, pandas.Series)
+
+
+def _is_numpy(column) -> bool:
+    numpy = sys.modules.get("numpy")
+    return numpy is not None and isinstance(column, numpy.ndarray)
+
+
+def _render_values(compiled: CompiledTemplate, tweets: list, targets: list) -> list:
+    render = compiled.render
+    # `None in` is a C-level scan, so columns without missing values pay almost nothing for the check
+    if None in tweets or None in targets:
+        return [
+            None if tweet is None or target is None else render(tweet, target)
+            for tweet, target in zip(tweets, targets)
+        ]
+    return list(map(render, tweets, targets))
+
+
+def _values(column) -> list:
+    """
+    Returns a column's values as a list, with pandas' missing values (NaN, NA) as None.
+    """
+    if _is_pandas(column):
+        missing = column.isna()
+        if missing.any():
+            column = column.astype(object).where(~missing, None)
+        return column.tolist()
+    if hasattr(column, "tolist"):
+        return column.tolist()
+    return list(column)
+
+
+def _render_arrow(compiled: CompiledTemplate, tweets, targets):
+    import pyarrow
+    import pyarrow.compute
+
+    if not compiled.is_compiled:
+        # Templates that transform their inputs cannot be joined by Arrow
+        return pyarrow.array(_render_values(compiled, tweets.to_pylist(), targets.to_pylist()), pyarrow.large_string())
+
+    # Large strings, so that a column of long prompts cannot overflow 32-bit offsets
+    columns = {
+        "tweet": pyarrow.compute.cast(tweets, pyarrow.large_string()),
+        "target": pyarrow.compute.cast(targets, pyarrow.large_string()),
+    }
+    parts = []
+    for i, segment in enumerate(compiled.segments):
+        parts.append(pyarrow.scalar(segment, pyarrow.large_string()))
+        if i < len(compiled.fields):
+            parts.append(columns[compiled.fields[i]])
+    return pyarrow.compute.binary_join_element_wise(*parts, pyarrow.scalar("", pyarrow.large_string()))
+
+
+def _pandas_arrow_array(series):
+    # Arrow-backed string columns (the pandas default with pyarrow installed) are passed to Arrow without copying
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    if "pyarrow" not in str(getattr(series.dtype, "storage", "")) and not str(series.dtype).endswith("[pyarrow]"):
+        return None
+    return pyarrow.chunked_array(pyarrow.array(series.array))
+
+
+def render_column(template, tweets, targets, examples: list = None):
+    """
+    Renders one prompt per (tweet, target) pair of two columns, in one call.
+
+    Args:
+        template (callable | CompiledTemplate): A template function from `prompts.py`, a data template from
+            the registry, or an already compiled template.
+        tweets: Column of tweets: a list or tuple, a NumPy array, a pandas Series, or a pyarrow Array or ChunkedArray.
+        targets: Column of targets of the same length (any of the same kinds).
+        examples (list): Optional. Few-shot examples, as dicts with `tweet`, `target` and `label`, for few-shot templates.
+
+    Returns:
+        The prompts, as the same kind of column as `tweets`: a list, a NumPy object array, a pandas Series
+        with the same index and name "prompt", or a pyarrow large_string Array/ChunkedArray.
+    """
+    if len(tweets) != len(targets):
+        raise ValueError(f"The tweet and target columns have different lengths ({len(tweets)} and {len(targets)}).")
+    compiled = template if isinstance(template, CompiledTemplate) else compile_template(template, examples)
+
+    if _is_arrow(tweets):
+        if not _is_arrow(targets):
+            import pyarrow
+            targets = pyarrow.array(_values(targets), pyarrow.string())
+        return _render_arrow(compiled, tweets, targets)
+
+    if _is_pandas(tweets):
+        import pandas
+        tweet_array = _pandas_arrow_array(tweets)
+        target_array = _pandas_arrow_array(targets) if _is_pandas(targets) else None
+        if tweet_array is not None and target_array is not None:
+            prompts = _render_arrow(compiled, tweet_array, target_array)
+            return pandas.Series(
+                pandas.arrays.ArrowExtensionArray(prompts), index=tweets.index, name="prompt"
+            ).astype(tweets.dtype)
+        prompts = _render_values(compiled, _values(tweets), _values(targets))
+        return pandas.Series(prompts, index=tweets.index, name="prompt", dtype=object)
+
+    if _is_numpy(tweets):
+        import numpy
+        prompts = numpy.empty(len(tweets), dtype=object)
+        prompts[:] = _render_values(compiled, _values(tweets), _values(targets))
+        return prompts
+
+    return _render_values(compiled, _values(tweets), _values(targets))
+
+
+def render_prompts(dataset_name: str, model_name: str, tweets, targets, shot: str = "zero_shot", examples: list = None):
+    """
+    Renders a column of prompts with the registered template of a dataset and model.
+
+    Args:
+        dataset_name (str): Name of the dataset (e.g., "semeval2016").
+        model_name (str): Name of the model (e.g., "qwen2").
+        tweets: Column of tweets (see `render_column`).
+        targets: Column of targets.
+        shot (str): "zero_shot" (default) or "few_shot".
+        examples (list): Few-shot examples; required for "few_shot".
+
+    Returns:
+        The prompts, as the same kind of column as `tweets`.
+    """
+    if shot == "few_shot" and examples is None:
+        raise ValueError("Few-shot rendering requires examples.")
+    return render_column(get_template(dataset_name, model_name, shot), tweets, targets, examples)
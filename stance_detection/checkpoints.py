@@ -0,0 +1,121 @@
+"""
+Checkpoints for resuming interrupted runs.
+
+Rows are streamed to the output as they are rendered, so after a crash the output holds every row written
+before it, plus possibly part of a row. With checkpoints enabled, every `every` rows the output is flushed
+to disk and `<output file>.checkpoint.json` records:
+
+    - `rows`:   the number of rows flushed;
+    - `offset`: the size of the output after those rows, in bytes;
+    - `seed`:   the seed of the run's random draws;
+    - `key`:    what the output depends on (input file digests, template, parameters), as in the manifest
+                of incremental runs (see `incremental.py`).
+
+A resumed run truncates the output to `offset` and continues writing at row `rows`. It draws its few-shot
+examples with the recorded seed, and per-row draws use a generator derived from the seed and the row index
+(`example_sampling.RowRandom`), so the resumed rows are exactly those an uninterrupted run would have written,
+without replaying the draws of the rows before them. A checkpoint whose key does not match the run, or whose
+output is shorter than recorded, is ignored and the output is written from the start. The checkpoint is
+removed once the output is complete.
+
+Resuming appends to the output in place, so it requires an uncompressed `json`, `json_min`, `jsonl` or
+`msgpack` output without a sidecar index or token file.
+"""
+
+import os
+import json
+
+
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_FORMATS = ("json", "json_min", "jsonl", "msgpack")
+
+# Rows between checkpoints when resuming without an explicit interval
+DEFAULT_CHECKPOINT_EVERY = 100000
+
+
+def check_checkpointing(output_format: str, compression: str = None, index: bool = False, tokenized: bool = False,
+                        incremental: bool = False):
+    """
+    Raises a ValueError if an output with these options cannot be checkpointed and resumed.
+    """
+    if output_format not in CHECKPOINT_FORMATS or compression is not None:
+        raise ValueError(
+            f"Checkpoints require an uncompressed {', '.join(CHECKPOINT_FORMATS[:-1])} or {CHECKPOINT_FORMATS[-1]} output."
+        )
+    if index or tokenized or incremental:
+        raise ValueError("Checkpoints cannot be combined with index, tokenized or incremental outputs.")
+
+
+class Checkpoint:
+    """
+    Records how far an output was written, so that an interrupted run can be resumed.
+
+    Args:
+        output_file (str): Path of the output; the checkpoint is `<output_file>.checkpoint.json`.
+        key (dict): What the output depends on. A stored checkpoint is only resumed if its key is the same.
+        every (int): Number of rows between checkpoints (default is `DEFAULT_CHECKPOINT_EVERY`).
+        resume (bool): Whether to load the stored checkpoint, if any (default is False).
+    """
+
+    def __init__(self, output_file: str, key: dict, every: int = None, resume: bool = False):
+        every = every or DEFAULT_CHECKPOINT_EVERY
+        if every < 1:
+            raise ValueError("The checkpoint interval must be at least 1 row.")
+        self.output_file = output_file
+        self.path = output_file + CHECKPOINT_SUFFIX
+        # Round-tripped through JSON, so that it compares equal to a stored key
+        self.key = json.loads(json.dumps(key))
+        self.every = every
+        self.rows = 0
+        self.offset = 0
+        self.seed = None
+        if resume:
+            self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            print(f"No checkpoint for {self.output_file}; starting from the first row")
+            return
+        with open(self.path, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("version") != CHECKPOINT_VERSION or stored.get("key") != self.key:
+            print(f"The checkpoint of {self.output_file} does not match this run; starting from the first row")
+            return
+        if not os.path.isfile(self.output_file) or os.path.getsize(self.output_file) < stored["offset"]:
+            print(f"{self.output_file} is shorter than its checkpoint; starting from the first row")
+            return
+        self.rows, self.offset, self.seed = stored["rows"], stored["offset"], stored["seed"]
+        print(f"Resuming {self.output_file} after {self.rows} rows")
+
+    @property
+    def resume(self) -> tuple:
+        """
+        `(rows, offset)` to continue the output from, for `PromptWriter`, or None to write it from the start.
+        """
+        return (self.rows, self.offset) if self.rows else None
+
+    def update(self, writer):
+        """
+        Saves a checkpoint if `writer` has written a multiple of `every` rows. Called after each row.
+        """
+        if writer.count % self.every == 0:
+            self.save(writer)
+
+    def save(self, writer):
+        self.rows, self.offset = writer.count, writer.checkpoint()
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": CHECKPOINT_VERSION, "key": self.key, "rows": self.rows, "offset": self.offset,
+                 "seed": self.seed},
+                f, ensure_ascii=False, sort_keys=True,
+            )
+        os.replace(temporary_path, self.path)
+
+    def remove(self):
+        """
+        Removes the checkpoint once the output is complete.
+        """
+        if os.path.isfile(self.path):
+            os.remove(self.path)
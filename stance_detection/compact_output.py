@@ -0,0 +1,229 @@
+"""
+Compact, deduplicated storage for generated prompt files.
+
+In the `json` and `jsonl` layouts every row repeats the dataset, model and candidate, and every prompt
+repeats the full instruction text (and, for few-shot prompts, the example block). The `compact` layout
+stores each distinct string once:
+
+    - `constants`: fields with the same value in every row (e.g. dataset, model, candidate).
+    - `strings`: a table of distinct tweets, targets and other string values.
+    - `templates`: distinct prompt layouts, as static text segments and the fields between them
+      (`tweet` or `target`). A prompt is its template's segments joined with the row's tweet and target.
+      Segments are stored as string indices of their paragraphs (text between blank lines), so that
+      instruction blocks and few-shot examples shared by different layouts are stored once.
+    - `fields`: the row fields, in the order they were written.
+    - `columns`: per row, the template index, string indices for tweet/target and string fields, and
+      the plain values of other fields (e.g. `prompt_tokens`).
+
+Layouts are derived from the rendered prompts themselves, by splitting each prompt at its tweet and
+target, so rebuilding a prompt always gives back exactly the prompt that was written, including prompts
+whose tweet was truncated to fit a token budget.
+
+`CompactPromptFile` loads a compact file and rebuilds rows on demand.
+"""
+
+import json
+
+from output_writers import open_text_input, open_text_output
+
+
+COMPACT_FORMAT = "stance-prompts-compact"
+COMPACT_VERSION = 1
+PARAGRAPH_SEPARATOR = "\n\n"
+
+
+def _split_prompt(prompt: str, tweet: str, target: str) -> tuple:
+    """
+    Splits a prompt into static segments around the occurrences of its tweet and target.
+
+    Returns:
+        tuple: `(segments, fields)` with `len(segments) == len(fields) + 1`.
+    """
+    segments, fields = [""], []
+    for i, part in enumerate(prompt.split(tweet) if tweet else [prompt]):
+        if i:
+            fields.append("tweet")
+            segments.append("")
+        for j, piece in enumerate(part.split(target) if target else [part]):
+            if j:
+                fields.append("target")
+                segments.append("")
+            segments[-1] += piece
+    return tuple(segments), tuple(fields)
+
+
+class CompactWriter:
+    """
+    Collects rows and writes them in the compact layout when closed.
+
+    Rows are kept as indices into the string and template tables, so memory grows with the number of
+    distinct strings rather than with the size of the rendered prompts.
+    """
+
+    def __init__(self, path: str, compression: str = None):
+        self.path = path
+        self.compression = compression
+        self.count = 0
+        self._strings = {}
+        self._templates = {}
+        self._columns = {}
+        self._string_columns = set()
+
+    def _string_id(self, value: str) -> int:
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = self._strings[value] = len(self._strings)
+        return string_id
+
+    def write(self, row: dict):
+        self.write_serialized(row)
+
+    def write_serialized(self, row: dict):
+        columns = self._columns
+        tweet, target = row.get("tweet"), row.get("target")
+        if "prompt" in row:
+            layout = _split_prompt(row["prompt"], tweet, target)
+            template_id = self._templates.get(layout)
+            if template_id is None:
+                template_id = self._templates[layout] = len(self._templates)
+            row = {**row, "prompt": template_id}
+
+        for name, value in row.items():
+            column = columns.get(name)
+            if column is None:
+                # Columns missing from earlier rows are padded with None
+                column = columns[name] = [None] * self.count
+            if isinstance(value, str) and name != "prompt":
+                self._string_columns.add(name)
+                value = self._string_id(value)
+            column.append(value)
+        self.count += 1
+        for column in columns.values():
+            if len(column) < self.count:
+                column.append(None)
+
+    def close(self):
+        # Template paragraphs are interned first, so that the string table is complete
+        templates = [
+            {
+                "segments": [
+                    [self._string_id(paragraph) for paragraph in segment.split(PARAGRAPH_SEPARATOR)]
+                    for segment in segments
+                ],
+                "fields": list(fields),
+            }
+            for segments, fields in self._templates
+        ]
+        strings = list(self._strings)
+
+        constants, columns = {}, {}
+        for name, values in self._columns.items():
+            first = values[0] if values else None
+            if name not in ("prompt", "tweet", "target") and all(value == first for value in values):
+                constants[name] = strings[first] if name in self._string_columns and first is not None else first
+            else:
+                columns[name] = values
+
+        document = {
+            "format": COMPACT_FORMAT,
+            "version": COMPACT_VERSION,
+            "count": self.count,
+            "fields": list(self._columns),
+            "constants": constants,
+            "strings": strings,
+            "templates": templates,
+            "string_columns": sorted(name for name in self._string_columns if name in columns),
+            "columns": columns,
+        }
+        with open_text_output(self.path, self.compression) as stream:
+            json.dump(document, stream, ensure_ascii=False, separators=(",", ":"))
+
+    def discard(self):
+        # Nothing is written before the writer is closed
+        pass
+
+
+class CompactPromptFile:
+    """
+    Reads a compact prompt file and rebuilds rows on demand.
+
+    Supports `len()`, indexing with ints (returning a row dict) and slices, and iteration. Rows have the
+    same fields, in the same order, as the rows that were written.
+
+    Args:
+        path (str): Path of the compact file.
+        compression (str): Optional. "gzip" or "zstd".
+    """
+
+    def __init__(self, path: str, compression: str = None):
+        with open_text_input(path, compression) as f:
+            document = json.load(f)
+        if document.get("format") != COMPACT_FORMAT or document.get("version") != COMPACT_VERSION:
+            raise ValueError(f"{path} is not a compact prompt file.")
+
+        self.count = document["count"]
+        self.constants = document["constants"]
+        self.strings = document["strings"]
+        self.templates = document["templates"]
+        self._layouts = {}
+        self.columns = document["columns"]
+        self.string_columns = set(document["string_columns"])
+        self.fields = document["fields"]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def prompt(self, i: int) -> str:
+        """
+        Rebuilds the prompt of row `i`.
+        """
+        i = self._position(i)
+        segments, fields = self._layout(self.columns["prompt"][i])
+        values = {
+            "tweet": self.strings[self.columns["tweet"][i]],
+            "target": self.strings[self.columns["target"][i]],
+        }
+        parts = [segments[0]]
+        for field, segment in zip(fields, segments[1:]):
+            parts.append(values[field])
+            parts.append(segment)
+        return "".join(parts)
+
+    def _layout(self, template_id: int) -> tuple:
+        # Segments are rebuilt from their paragraphs on first use only
+        layout = self._layouts.get(template_id)
+        if layout is None:
+            template = self.templates[template_id]
+            segments = [PARAGRAPH_SEPARATOR.join(self.strings[i] for i in segment) for segment in template["segments"]]
+            layout = self._layouts[template_id] = (segments, template["fields"])
+        return layout
+
+    def _position(self, i: int) -> int:
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("Row index out of range.")
+        return i
+
+    def _row(self, i: int) -> dict:
+        row = {}
+        for name in self.fields:
+            if name in self.constants:
+                row[name] = self.constants[name]
+            elif name == "prompt":
+                row[name] = self.prompt(i)
+            else:
+                value = self.columns[name][i]
+                if name in self.string_columns and value is not None:
+                    value = self.strings[value]
+                row[name] = value
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._row(i) for i in range(*key.indices(self.count))]
+        return self._row(self._position(key))
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self._row(i)
@@ -0,0 +1,182 @@
+"""
+Persistent columnar cache for parsed dataset files.
+
+Parsing a CSV/TSV file with `csv.DictReader` is repeated on every run, although the files in
+`data/` rarely change. `read_table` parses a file once and stores its columns in
+`<dir>/.cache/<file name>.<encoding>.npz`: each column is kept as one UTF-8 blob plus an array of
+byte offsets and a null mask. Later runs load a column by decoding each value's slice of the blob.
+
+A cache entry is keyed by the file's size and modification time (and the delimiter and encoding
+it was parsed with), and is rebuilt automatically when any of them changes. Caching requires
+`numpy`; without it, files are parsed on every call.
+
+Bytes that are not valid in the encoding are kept as lone surrogates ('surrogateescape'), so that a
+few bad rows do not make a whole file unreadable; `ingestion.py` rejects those rows. Values are encoded
+and decoded one by one, since the escaped bytes of adjacent values could otherwise decode together.
+"""
+
+import os
+import csv
+import json
+
+
+CACHE_DIRNAME = ".cache"
+CACHE_VERSION = 3
+
+
+def file_delimiter(path: str) -> str:
+    """
+    Returns the field delimiter of a dataset file based on its extension.
+    """
+    file_extension = os.path.splitext(path)[1].lower()
+    if file_extension == ".tsv":
+        return "\t"
+    if file_extension == ".csv":
+        return ","
+    raise ValueError("Unsupported file format. Only CSV and TSV files are supported.")
+
+
+class Table:
+    """
+    A parsed dataset file held as columns.
+
+    Attributes:
+        fieldnames (list): Column names, in file order.
+        columns (dict): Column name to list of values. Missing values are None, as with `csv.DictReader`;
+            rows that could not be parsed have None in every column.
+    """
+
+    def __init__(self, fieldnames: list, columns: dict):
+        self.fieldnames = fieldnames
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns[self.fieldnames[0]]) if self.fieldnames else 0
+
+    def rows(self):
+        """
+        Yields each row as a dict, like iterating over a `csv.DictReader`.
+        """
+        names = self.fieldnames
+        for values in zip(*(self.columns[name] for name in names)):
+            yield dict(zip(names, values))
+
+
+def parse_table(path: str, delimiter: str, encoding: str = "utf-8") -> Table:
+    """
+    Parses a CSV/TSV file into a `Table`, without using the cache.
+    """
+    with open(path, newline='', encoding=encoding, errors="surrogateescape") as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=delimiter)
+        fieldnames = list(reader.fieldnames or [])
+        columns = {name: [] for name in fieldnames}
+        appenders = [(name, columns[name].append) for name in fieldnames]
+        while True:
+            # `DictReader.line_num` only advances on success, so the underlying reader's is checked
+            line_number = reader.reader.line_num
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                # Rows the parser cannot read are kept as rows of None values, so row numbers stay aligned
+                row = {}
+                if reader.reader.line_num == line_number:
+                    break
+            for name, append in appenders:
+                append(row.get(name))
+    return Table(fieldnames, columns)
+
+
+def cache_path(path: str, encoding: str = "utf-8") -> str:
+    """
+    Returns where the cache of `path` is stored: `<dir>/.cache/<file name>.<encoding>.npz`.
+    """
+    directory, file_name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, CACHE_DIRNAME, f"{file_name}.{encoding}.npz")
+
+
+def _cache_meta(path: str, delimiter: str, encoding: str) -> dict:
+    stat = os.stat(path)
+    return {
+        "version": CACHE_VERSION,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "delimiter": delimiter,
+        "encoding": encoding,
+    }
+
+
+def _save(table: Table, cache_file: str, meta: dict, numpy):
+    arrays = {}
+    for i, name in enumerate(table.fieldnames):
+        values = table.columns[name]
+        encoded = [(value or "").encode("utf-8", "surrogateescape") for value in values]
+        offsets = [0]
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        arrays[f"text_{i}"] = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+        arrays[f"offsets_{i}"] = numpy.asarray(offsets, dtype=numpy.int64)
+        arrays[f"nulls_{i}"] = numpy.asarray([value is None for value in values], dtype=bool)
+
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    temporary_file = cache_file + ".tmp.npz"
+    numpy.savez(temporary_file, meta=numpy.asarray(json.dumps({**meta, "fieldnames": table.fieldnames})), **arrays)
+    os.replace(temporary_file, cache_file)
+
+
+def _load(cache_file: str, meta: dict, numpy):
+    if not os.path.isfile(cache_file):
+        return None
+    with numpy.load(cache_file, allow_pickle=False) as stored:
+        stored_meta = json.loads(str(stored["meta"]))
+        fieldnames = stored_meta.pop("fieldnames")
+        if stored_meta != meta:
+            return None
+
+        columns = {}
+        for i, name in enumerate(fieldnames):
+            blob = stored[f"text_{i}"].tobytes()
+            offsets = stored[f"offsets_{i}"].tolist()
+            values = [blob[start:end].decode("utf-8", "surrogateescape") for start, end in zip(offsets, offsets[1:])]
+            for row in numpy.flatnonzero(stored[f"nulls_{i}"]).tolist():
+                values[row] = None
+            columns[name] = values
+    return Table(fieldnames, columns)
+
+
+def read_table(path: str, delimiter: str, encoding: str = "utf-8", use_cache: bool = True) -> Table:
+    """
+    Reads a CSV/TSV file into a `Table`, through the columnar cache when possible.
+
+    Args:
+        path (str): Path of the dataset file.
+        delimiter (str): Field delimiter ("," or "\\t").
+        encoding (str): Text encoding the file is decoded with.
+        use_cache (bool): Whether to load from and store to the cache (default is True).
+    """
+    numpy = None
+    if use_cache:
+        try:
+            import numpy
+        except ImportError:
+            pass
+    if numpy is None:
+        return parse_table(path, delimiter, encoding)
+
+    meta = _cache_meta(path, delimiter, encoding)
+    cache_file = cache_path(path, encoding)
+    try:
+        table = _load(cache_file, meta, numpy)
+    except (OSError, ValueError, KeyError):
+        # A corrupt or incompatible cache entry is rebuilt like a stale one
+        table = None
+    if table is None:
+        table = parse_table(path, delimiter, encoding)
+        try:
+            _save(table, cache_file, meta, numpy)
+        except OSError:
+            # Read-only data directories still work, just without caching
+            pass
+    return table
+
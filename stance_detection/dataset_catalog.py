@@ -0,0 +1,292 @@
+"""
+Catalog of the dataset files under a data directory.
+
+Looking up a dataset's files by listing its directory and matching substrings repeats the listing on
+every call and can pick the wrong file (e.g. "test" matches "contest.csv"). `DatasetCatalog` scans each
+dataset directory once and describes every CSV/TSV file in it:
+
+    - `split`: "train", "val" or "test", from a whole word of the file name ("dev" and "validation"
+      count as "val").
+    - `candidate`: the candidate the file belongs to, if any. Candidates are the file name words that
+      appear in at least two, but not all, of a dataset's split files, other than split names and numbers
+      (e.g. "bernie" in `raw_val_bernie.csv`).
+    - `delimiter` and `columns`: the field delimiter and the column names of the header, as written in the
+      file (`Tweet` or `tweet`); see `column_mapping`.
+    - `rows`: the number of data rows, when counted (`count_rows=True` or `--count_rows`).
+
+The catalog is stored in `<data_dir>/.catalog.json`. A dataset is rescanned only when its directory's
+modification time changes (a file was added, removed or renamed); a file is described again when its
+size or modification time changes.
+"""
+
+import os
+import re
+import csv
+import json
+import argparse
+
+from dataset_cache import file_delimiter
+
+
+CATALOG_NAME = ".catalog.json"
+CATALOG_VERSION = 1
+
+_SPLIT_WORDS = {"train": "train", "val": "val", "dev": "val", "validation": "val", "test": "test"}
+# Example files are taken from the train split, except for the datasets listed here
+EXAMPLE_SPLITS = {"PStance": "val"}
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_DATA_EXTENSIONS = (".csv", ".tsv")
+
+# Catalogs opened in this process, keyed by absolute data directory
+_CATALOGS = {}
+
+
+def _file_words(file_name: str) -> list:
+    return _WORD_PATTERN.findall(os.path.splitext(file_name)[0].lower())
+
+
+def _read_header(path: str, delimiter: str) -> list:
+    with open(path, newline="", encoding="utf-8", errors="surrogateescape") as csvfile:
+        return next(csv.reader(csvfile, delimiter=delimiter), [])
+
+
+def _count_rows(path: str, delimiter: str) -> int:
+    with open(path, newline="", encoding="utf-8", errors="surrogateescape") as csvfile:
+        reader = csv.reader(csvfile, delimiter=delimiter)
+        next(reader, None)
+        count = 0
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return count
+            except csv.Error:
+                row = None
+            if row != []:
+                count += 1
+
+
+class DatasetCatalog:
+    """
+    Describes the splits, candidates and files of every dataset under `data_dir`.
+
+    Use `open_catalog` to get the catalog of a directory shared by the whole process.
+
+    Args:
+        data_dir (str): Directory holding one sub-directory per dataset.
+        entries (dict): Dataset name to its stored description.
+    """
+
+    def __init__(self, data_dir: str, entries: dict = None):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, CATALOG_NAME)
+        self.entries = entries or {}
+        self._changed = False
+
+    def dataset_names(self) -> list:
+        """
+        Returns the names of the dataset directories, scanning `data_dir` itself.
+        """
+        with os.scandir(self.data_dir) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir() and not entry.name.startswith("."))
+
+    def dataset(self, dataset_name: str) -> dict:
+        """
+        Returns the description of a dataset: `{"candidates": [...], "files": {file name: file description}}`,
+        scanning its directory if it changed since it was cataloged.
+        """
+        dataset_dir = os.path.join(self.data_dir, dataset_name)
+        try:
+            mtime_ns = os.stat(dataset_dir).st_mtime_ns
+        except OSError:
+            raise ValueError(f"Dataset directory {dataset_dir} does not exist.")
+
+        entry = self.entries.get(dataset_name)
+        if entry is None or entry["mtime_ns"] != mtime_ns:
+            entry = self.entries[dataset_name] = self._scan(dataset_dir, mtime_ns, (entry or {}).get("files", {}))
+            self._changed = True
+        return entry
+
+    def _scan(self, dataset_dir: str, mtime_ns: int, previous: dict) -> dict:
+        files = {}
+        with os.scandir(dataset_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(_DATA_EXTENSIONS):
+                    stat = entry.stat()
+                    old = previous.get(entry.name)
+                    if old and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                        files[entry.name] = old
+                    else:
+                        files[entry.name] = self._describe(entry.path, stat)
+
+        # Candidate words appear in at least two, but not all, of the split files
+        word_sets = {name: set(_file_words(name)) for name in files}
+        split_files = [name for name, description in files.items() if description["split"]]
+        counts = {}
+        for name in split_files:
+            for word in word_sets[name]:
+                counts[word] = counts.get(word, 0) + 1
+        candidates = sorted(
+            word for word, count in counts.items()
+            if 2 <= count < len(split_files) and word not in _SPLIT_WORDS and not word.isdigit()
+        )
+        for name, description in files.items():
+            matches = [word for word in candidates if word in word_sets[name]]
+            description["candidate"] = matches[0] if len(matches) == 1 else None
+        return {"mtime_ns": mtime_ns, "candidates": candidates, "files": dict(sorted(files.items()))}
+
+    def _describe(self, path: str, stat) -> dict:
+        splits = {_SPLIT_WORDS[word] for word in _file_words(os.path.basename(path)) if word in _SPLIT_WORDS}
+        delimiter = file_delimiter(path)
+        header = _read_header(path, delimiter)
+        return {
+            "split": splits.pop() if len(splits) == 1 else None,
+            "candidate": None,
+            "delimiter": delimiter,
+            "columns": header,
+            "rows": None,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def describe(self, dataset_name: str, file_name: str, count_rows: bool = False) -> dict:
+        """
+        Returns the description of one file, refreshed if the file changed since it was cataloged.
+
+        Args:
+            dataset_name (str): Name of the dataset directory.
+            file_name (str): Name of the file in it.
+            count_rows (bool): Whether to count the file's rows if they are not known yet (default is False).
+        """
+        files = self.dataset(dataset_name)["files"]
+        path = os.path.join(self.data_dir, dataset_name, file_name)
+        stat = os.stat(path)
+        description = files[file_name]
+        if description["size"] != stat.st_size or description["mtime_ns"] != stat.st_mtime_ns:
+            candidate = description["candidate"]
+            description = files[file_name] = {**self._describe(path, stat), "candidate": candidate}
+            self._changed = True
+        if count_rows and description["rows"] is None:
+            description["rows"] = _count_rows(path, description["delimiter"])
+            self._changed = True
+        return description
+
+    def column_mapping(self, dataset_name: str, file_name: str) -> dict:
+        """
+        Returns a file's columns keyed by lower-case name (e.g. `{"tweet": "Tweet", ...}`).
+        """
+        return {name.lower(): name for name in self.describe(dataset_name, file_name)["columns"]}
+
+    def candidates(self, dataset_name: str) -> list:
+        """
+        Returns the candidates of a dataset; empty for datasets without per-candidate files.
+        """
+        return self.dataset(dataset_name)["candidates"]
+
+    def files(self, dataset_name: str, split: str = None, candidate: str = None) -> list:
+        """
+        Returns the paths of a dataset's files, optionally restricted to a split and a candidate.
+        """
+        paths = []
+        for name, description in self.dataset(dataset_name)["files"].items():
+            if split is not None and description["split"] != split:
+                continue
+            if candidate is not None and description["candidate"] != candidate.lower():
+                continue
+            paths.append(os.path.join(self.data_dir, dataset_name, name))
+        return paths
+
+    def save(self):
+        """
+        Stores the catalog if anything was scanned or described since it was loaded.
+        """
+        if not self._changed:
+            return
+        temporary_path = self.path + ".tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CATALOG_VERSION, "datasets": self.entries}, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(temporary_path, self.path)
+        except OSError:
+            # Read-only data directories still work, just without a stored catalog
+            return
+        self._changed = False
+
+
+def open_catalog(data_dir: str, refresh: bool = False) -> DatasetCatalog:
+    """
+    Returns the catalog of `data_dir`, loading `<data_dir>/.catalog.json` once per process.
+
+    Args:
+        data_dir (str): Directory holding one sub-directory per dataset.
+        refresh (bool): Whether to ignore the stored catalog and rescan every dataset (default is False).
+    """
+    key = os.path.abspath(data_dir)
+    catalog = None if refresh else _CATALOGS.get(key)
+    if catalog is None:
+        entries = {}
+        if not refresh:
+            try:
+                with open(os.path.join(data_dir, CATALOG_NAME), encoding="utf-8") as f:
+                    stored = json.load(f)
+                if stored.get("version") == CATALOG_VERSION:
+                    entries = stored.get("datasets", {})
+            except (OSError, ValueError):
+                pass
+        catalog = _CATALOGS[key] = DatasetCatalog(data_dir, entries)
+    return catalog
+
+
+def find_dataset_files(dataset_dir: str, dataset_name: str, candidate_name: str = None):
+    """
+    Identifies the example (train/validation) and test files of a dataset.
+
+    PStance takes its examples from validation files, and other datasets (twitter_stance_kemlm, semeval2016)
+    from train files. Datasets with per-candidate files are filtered by candidate name.
+
+    Args:
+        dataset_dir (str): Directory containing the dataset files. Its parent directory holds the catalog.
+        dataset_name (str): Name of the dataset (e.g., "PStance").
+        candidate_name (str): Name of the candidate, required for datasets with per-candidate files.
+
+    Returns:
+        tuple: `(example_files, test_files)`, lists of file paths.
+    """
+    data_dir, directory_name = os.path.split(os.path.normpath(dataset_dir))
+    catalog = open_catalog(data_dir or ".")
+    candidates = catalog.candidates(directory_name)
+    if candidates and not candidate_name:
+        raise ValueError(f"Candidate name must be specified for {dataset_name}.")
+
+    candidate = candidate_name if candidates else None
+    example_files = catalog.files(directory_name, EXAMPLE_SPLITS.get(dataset_name, "train"), candidate)
+    test_files = catalog.files(directory_name, "test", candidate)
+    catalog.save()
+
+    if not example_files or not test_files:
+        if candidate:
+            raise ValueError(f"No matching files found for candidate '{candidate_name}' in {dataset_dir}.")
+        raise ValueError(f"Train or test files missing in {dataset_dir} for {dataset_name}.")
+    return example_files, test_files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Catalog the Dataset Files of a Data Directory")
+    parser.add_argument("--data_dir", type=str, default="data", help="Directory holding one sub-directory per dataset")
+    parser.add_argument("--count_rows", action="store_true", help="Count the rows of every file")
+    parser.add_argument("--refresh", action="store_true", help="Rescan every dataset, ignoring the stored catalog")
+
+    args = parser.parse_args()
+
+    catalog = open_catalog(args.data_dir, refresh=args.refresh)
+    for dataset_name in catalog.dataset_names():
+        dataset = catalog.dataset(dataset_name)
+        candidates = ", ".join(dataset["candidates"]) or "-"
+        print(f"{dataset_name} (candidates: {candidates})")
+        for file_name in dataset["files"]:
+            description = catalog.describe(dataset_name, file_name, args.count_rows)
+            rows = description["rows"] if description["rows"] is not None else "?"
+            columns = ", ".join(description["columns"])
+            print(f"    {file_name}: split={description['split'] or '-'} candidate={description['candidate'] or '-'} rows={rows} columns=[{columns}]")
+    catalog.save()
@@ -0,0 +1,194 @@
+"""
+Label-aware sampling of few-shot examples.
+
+A plain `random.sample` of 3 examples often misses a stance label entirely. `LabelBuckets` groups the
+row indices of an example file by label once, and then draws example sets in one of three ways:
+
+    - `random`:     k rows drawn uniformly, ignoring labels (the same draw as `random.sample(rows, k)`).
+    - `balanced`:   the same number of rows from every label; when k is not a multiple of the number of
+                    labels, the labels getting one more row are drawn at random.
+    - `stratified`: rows from each label in proportion to its share of the file (largest remainder).
+
+When a label has fewer rows than its quota, the rest of the quota goes to the other labels. Draws only
+touch the k selected indices (plus the small label buckets), so drawing a new set for every test row
+costs O(k) and never copies the rows themselves. All draws use the `random.Random` instance they are
+given, so a seeded generator makes them reproducible.
+
+Per-row draws can instead be given a `RowRandom`, which gives every row its own generator, seeded from the
+run seed and the row's index. A row's draw then depends only on the seed and its position, not on the rows
+drawn before it, so a run can start at any row (see `checkpoints.py`) and still draw exactly what a full run
+would have.
+
+For per-row variation at a fixed cost, `draw_example_sets` draws a pool of M example sets once, and
+`with_example_sets` assigns each test row one of them, in rotation or at random. Each set's example
+block is then rendered once (see `template_compiler.ExampleSetPool`), however many rows there are.
+"""
+
+import random
+import hashlib
+
+SAMPLING_STRATEGIES = ("random", "balanced", "stratified")
+SET_ASSIGNMENTS = ("rotate", "random")
+
+
+class LabelBuckets:
+    """
+    Row indices of an example file grouped by label.
+
+    Args:
+        labels (list): The label of every row, in file order.
+    """
+
+    def __init__(self, labels: list):
+        self.count = len(labels)
+        buckets = {}
+        for i, label in enumerate(labels):
+            buckets.setdefault(label, []).append(i)
+        # Sorted so that quotas and draws do not depend on which label comes first in the file
+        self.labels = sorted(buckets)
+        self.buckets = {label: buckets[label] for label in self.labels}
+        self._stratified_quotas = {}
+
+    def _fill(self, quotas: dict, k: int) -> dict:
+        # Hands the quota that labels cannot fill to the labels with the most rows left
+        shortfall = 0
+        for label in self.labels:
+            size = len(self.buckets[label])
+            if quotas[label] > size:
+                shortfall += quotas[label] - size
+                quotas[label] = size
+        while shortfall:
+            label = max(self.labels, key=lambda name: len(self.buckets[name]) - quotas[name])
+            quotas[label] += 1
+            shortfall -= 1
+        return quotas
+
+    def quotas(self, k: int, strategy: str, rng) -> dict:
+        """
+        Returns the number of rows to draw from each label.
+        """
+        if strategy == "balanced":
+            share, extra = divmod(k, len(self.labels))
+            quotas = {label: share for label in self.labels}
+            for label in rng.sample(self.labels, extra):
+                quotas[label] += 1
+            return self._fill(quotas, k)
+
+        if strategy == "stratified":
+            # Proportional quotas are the same for every draw, so they are computed once per k
+            if k not in self._stratified_quotas:
+                shares = {label: k * len(self.buckets[label]) / self.count for label in self.labels}
+                quotas = {label: int(share) for label, share in shares.items()}
+                by_remainder = sorted(self.labels, key=lambda label: quotas[label] - shares[label])
+                for label in by_remainder[:k - sum(quotas.values())]:
+                    quotas[label] += 1
+                self._stratified_quotas[k] = self._fill(quotas, k)
+            return dict(self._stratified_quotas[k])
+
+        raise ValueError(f"Unknown sampling strategy '{strategy}'. Choose one of: {', '.join(SAMPLING_STRATEGIES)}.")
+
+    def sample(self, k: int, rng, strategy: str = "random") -> tuple:
+        """
+        Draws the row indices of one example set.
+
+        Args:
+            k (int): Number of examples.
+            rng (random.Random): Random generator used for the draw (or the `random` module).
+            strategy (str): One of `SAMPLING_STRATEGIES` (default is "random").
+
+        Returns:
+            tuple: `k` distinct row indices. Labels are interleaved at random, not grouped.
+        """
+        if k > self.count:
+            raise ValueError(f"Cannot draw {k} examples from {self.count} rows.")
+        if strategy == "random":
+            return tuple(rng.sample(range(self.count), k))
+
+        example_ids = []
+        for label, quota in self.quotas(k, strategy, rng).items():
+            if quota:
+                example_ids.extend(rng.sample(self.buckets[label], quota))
+        rng.shuffle(example_ids)
+        return tuple(example_ids)
+
+    def counts(self) -> dict:
+        """
+        Returns the number of rows per label.
+        """
+        return {label: len(bucket) for label, bucket in self.buckets.items()}
+
+
+class RowRandom:
+    """
+    Per-row random generators derived from a run seed.
+
+    Args:
+        seed (int): The run seed.
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+
+    def row_seed(self, row: int) -> int:
+        """
+        Returns the seed of row `row`'s generator: a hash of the run seed and the row index, so that
+        neighbouring rows get unrelated generators.
+        """
+        digest = hashlib.blake2b(f"{self.seed}:{row}".encode("ascii"), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    def for_row(self, row: int) -> random.Random:
+        return random.Random(self.row_seed(row))
+
+
+def with_sampled_examples(pairs, buckets: LabelBuckets, k: int, strategy: str, rng, start: int = 0):
+    """
+    Draws a new example set for each (tweet, target) pair.
+
+    Args:
+        rng (random.Random | RowRandom): Generator used for all draws in turn, or per-row generators.
+        start (int): Index of the first pair among all the rows, for per-row generators (default is 0).
+
+    Yields:
+        tuple: `(tweet, target, example_ids)`, for use with a `template_compiler.ExamplePool`.
+    """
+    if isinstance(rng, RowRandom):
+        for row, (tweet, target) in enumerate(pairs, start):
+            yield tweet, target, buckets.sample(k, rng.for_row(row), strategy)
+        return
+    for tweet, target in pairs:
+        yield tweet, target, buckets.sample(k, rng, strategy)
+
+
+def draw_example_sets(buckets: LabelBuckets, k: int, count: int, strategy: str, rng) -> list:
+    """
+    Draws a pool of `count` example sets of `k` row indices each.
+    """
+    if count < 1:
+        raise ValueError("The number of example sets must be at least 1.")
+    return [buckets.sample(k, rng, strategy) for _ in range(count)]
+
+
+def with_example_sets(pairs, count: int, assignment: str, rng, start: int = 0):
+    """
+    Assigns each (tweet, target) pair one of `count` example sets: in rotation ("rotate": row i gets set
+    i mod `count`) or drawn independently per row ("random").
+
+    Args:
+        rng (random.Random | RowRandom): Generator used for all draws in turn, or per-row generators.
+        start (int): Index of the first pair among all the rows (default is 0).
+
+    Yields:
+        tuple: `(tweet, target, set_id)`, for use with a `template_compiler.ExampleSetPool`.
+    """
+    if assignment not in SET_ASSIGNMENTS:
+        raise ValueError(f"Unknown example set assignment '{assignment}'. Choose one of: {', '.join(SET_ASSIGNMENTS)}.")
+    if assignment == "rotate":
+        for i, (tweet, target) in enumerate(pairs, start):
+            yield tweet, target, i % count
+    elif isinstance(rng, RowRandom):
+        for row, (tweet, target) in enumerate(pairs, start):
+            yield tweet, target, rng.for_row(row).randrange(count)
+    else:
+        for tweet, target in pairs:
+            yield tweet, target, rng.randrange(count)
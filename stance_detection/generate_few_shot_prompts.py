@@ -1,167 +1,418 @@
 import os
-import csv
-import json
+import functools
+import contextlib
 import random
 import argparse
-from prompts import *  # Import all your prompt functions
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from checkpoints import CHECKPOINT_SUFFIX, Checkpoint, check_checkpointing
+from dataset_cache import file_delimiter
+from dataset_catalog import find_dataset_files, open_catalog
+from example_sampling import (
+    SET_ASSIGNMENTS, LabelBuckets, RowRandom, draw_example_sets, with_example_sets, with_sampled_examples,
+)
+from ingestion import REJECTS_SUFFIX, RejectLog, iter_records
+from incremental import PATCH, SKIP, Manifest, file_digest, merge_rows, output_key, reusable_rows, row_digest
+from output_writers import OUTPUT_FORMATS, COMPRESSIONS, JSON_ENCODERS, PromptWriter, output_filename
+from parallel import WorkerStats, ordered_map, render_rows
+from profiling import RunProfile
+from prompt_ordering import ORDERINGS, order_items
+from template_registry import get_template, print_templates
+from template_compiler import CompiledTemplate, ExamplePool, ExampleSetPool, compile_template
+from retrieval import load_or_build_index, with_similar_examples
+from tokenization import APPROX_TOKENIZER, TokenCounter, TokenHistogram
+from tokenized_output import TOKENS_SUFFIX, TokenizedWriter
 
 
-def generate_few_shot_prompts(dataset_dir: str, output_dir: str, dataset_name: str, model_name: str, candidate_name: str = None, examples_count: int = 3):
+EXAMPLE_SELECTIONS = ("random", "similar", "balanced", "stratified")
+
+# `candidate_name` value selecting every candidate of a dataset
+ALL_CANDIDATES = "all"
+
+
+def generate_few_shot_prompts(dataset_dir: str, output_dir: str, dataset_name: str, model_name: str, candidate_name: str = None, examples_count: int = 3,
+                              output_format: str = "json", compression: str = None, workers: int = 1,
+                              include_shared_prefix: bool = False, count_tokens: bool = False, tokenizer: str = None,
+                              max_tokens: int = None, example_selection: str = "random",
+                              use_cache: bool = False, incremental: bool = False, index: bool = False,
+                              batch_size: int = 1000, per_row_examples: bool = False, seed: int = None,
+                              example_sets: int = None, example_set_assignment: str = "rotate", tokenized: bool = False,
+                              order: str = "input", length_bucket: int = 32, json_encoder: str = "auto",
+                              checkpoint_every: int = None, resume: bool = False, profile: bool = False, profile_stats: str = None, profile_allocations: str = None,
+                              candidate_workers: int = None):
     """
     Generates few-shot prompts using examples from train/validation files and questions from test files.
     Includes candidate name filtering for PStance and twitter_stance_kemlm datasets.
 
+    Files are decoded as UTF-8. Rows that cannot be used (invalid UTF-8, a missing tweet, target or stance, or
+    a malformed line) are skipped and written to `<output name>.rejects.jsonl` next to the output.
+
     Args:
         dataset_dir (str): Directory containing the dataset files.
         output_dir (str): Directory where the output JSON file will be saved.
         dataset_name (str): Name of the dataset to use (e.g., "PStance", "semeval2016", "twitter_stance_kemlm").
         model_name (str): Name of the model to use for generating prompts (e.g., "qwen2").
-        candidate_name (str): Name of the candidate (for PStance or twitter_stance_kemlm datasets). Defaults to None.
+        candidate_name (str | list): Name of the candidate (for PStance or twitter_stance_kemlm datasets). Defaults to None.
+            A list of candidates, or "all" for every candidate of the dataset, generates one output per candidate,
+            with the candidates processed concurrently (see `candidate_workers`).
         examples_count (int): Number of examples to use for few-shot prompts (default is 3).
+        output_format (str): "json" for a single indented JSON array (default), "json_min" for the same array
+            without indentation, "jsonl" for one compact JSON object per line, "compact" for a deduplicated document
+            that stores repeated metadata and prompt text once (see `compact_output.py`), "parquet" for a Parquet
+            table (requires pyarrow), or "msgpack" for one MessagePack map per row (requires msgpack). Rows are
+            streamed to disk as they are rendered, except with "compact". `output_writers.read_rows` reads any of them.
+        compression (str): Optional. "gzip" or "zstd" to compress the output file, or the column chunks of a
+            Parquet file.
+        workers (int): Number of worker processes used to render rows (default is 1). The output
+            is byte-identical to a single-process run.
+        include_shared_prefix (bool): Whether to add a `shared_prefix` field to each row, holding the prompt
+            text before the tweet. It is identical for all rows with the same target and can be cached once
+            by the inference server (default is False).
+        count_tokens (bool): Whether to record `prompt_tokens` for each row and print a token histogram (default is False).
+        tokenizer (str): Optional. Tokenizer used for counting: a `tokenizer.json` file, a Hugging Face model directory/id,
+            or "approx". Defaults to the tokenizer of the model family, loaded offline from the local cache.
+        max_tokens (int): Optional. Token budget per prompt; implies `count_tokens`. Prompts over budget drop
+            few-shot examples, then truncate the tweet, and record `examples_used` and `tweet_truncated`.
+        example_selection (str): "random" (default) to draw examples uniformly, "balanced" to draw the same number
+            of examples from every stance label, "stratified" to draw them in proportion to the label frequencies
+            (see `example_sampling.py`), or "similar" to give each test row the `examples_count` most similar examples
+            with the same target, using a TF-IDF index stored in `<dataset_dir>/.index/`. Rows with their own examples
+            record their `example_ids`.
+        use_cache (bool): Whether to read the dataset files through the parsed-dataset cache in `<dataset_dir>/.cache/`,
+            which is rebuilt automatically when a file changes (default is False).
+        incremental (bool): Whether to skip the output if nothing it depends on (input files, template, examples and
+            parameters) changed since the last run, and to render only new or changed rows when only the test files
+            changed. What each output was generated from is recorded in `<output_dir>/manifest.json` (default is False).
+        index (bool): Whether to write a `<output_file>.idx` byte-offset index next to the output, so that rows
+            can be read directly with `prompt_index.IndexedPromptFile`. Requires the uncompressed "jsonl" format
+            (default is False).
+        batch_size (int): Number of rows rendered per batch (and sent to a worker at a time) (default is 1000).
+        per_row_examples (bool): Whether to draw a new example set for every test row instead of one set for all
+            rows, with the "random", "balanced" or "stratified" selection (default is False).
+        seed (int): Optional. Seed for drawing examples, making the output reproducible. Per-row draws (`per_row_examples`
+            and "random" set assignment) use a generator derived from the seed and the row index, so each row's examples
+            depend only on the seed and its position. Without it, draws use the global `random` state.
+        example_sets (int): Optional. Number of example sets to draw once, with the "random", "balanced" or
+            "stratified" selection, and share between the test rows. Each set's example block is rendered once,
+            so per-row variation costs no more than a single set. Rows record their `example_set` and `example_ids`.
+        example_set_assignment (str): How rows are assigned an example set: "rotate" (default; row i gets set
+            i mod `example_sets`) or "random".
+        tokenized (bool): Whether to also write the token ids of every prompt to `<output name>.tokens.npz`, with the
+            tokens of the text shared by all prompts of a target stored once (see `tokenized_output.py`). Uses the
+            `tokenizer` of `count_tokens`, which must not be "approx"; requires numpy (default is False).
+        order (str): Order of the output rows: "input" (default), "prefix" to group rows by the prompt text
+            before the tweet, so that batched inference reuses its prefix cache, or "prefix_length" to also sort
+            each group by length bucket, to reduce padding (see `prompt_ordering.py`). Reordered rows record
+            `row_index`, their position in the input-ordered output.
+        length_bucket (int): Width, in characters of tweet, of the length buckets of "prefix_length" (default is 32).
+        json_encoder (str): JSON encoder of the "json_min" and "jsonl" formats: "auto" (default; the fastest
+            installed), "json" (standard library), "orjson" or "msgspec". All write the same rows.
+        checkpoint_every (int): Optional. Number of rows between checkpoints: the output is flushed to disk and
+            `<output_file>.checkpoint.json` records the rows written and the seed (see `checkpoints.py`). A run
+            without a `seed` draws one from the global `random` state. Requires an uncompressed "json", "json_min",
+            "jsonl" or "msgpack" output, without `index`, `tokenized` or `incremental`.
+        resume (bool): Whether to continue the output from its last checkpoint, if it has one that matches this
+            run; implies checkpoints, every 100,000 rows unless `checkpoint_every` is given (default is False).
+        profile (bool): Whether to time the stages of the run (read, sample, render, serialize, write), count its
+            rows and measure its peak memory, print them, and return them (default is False; see `profiling.py`).
+        profile_stats (str): Optional. Path of a cProfile dump of the run; implies `profile`.
+        profile_allocations (str): Optional. Path of a tracemalloc report of the largest allocation sites; implies
+            `profile`. Tracing allocations slows the run down considerably.
+        candidate_workers (int): Optional. Number of candidates generated at the same time, each in its own process,
+            when `candidate_name` is a list or "all" (default: all of them, up to the number of CPUs).
+
+    Returns:
+        str: The output file, or with `profile`, a dict with the `output_file`, `total_seconds`, the seconds per
+        stage (`stages`), row counts (`rows`) and `peak_memory_mb`. A list of these, one per candidate, for a
+        list of candidates or "all".
     """
-    # Dynamically construct the function name
-    function_name = f"{dataset_name}_{model_name}_few_shot_template"
+    if candidate_name == ALL_CANDIDATES or isinstance(candidate_name, (list, tuple)):
+        # Nothing else is defined yet, so these are exactly the call's arguments
+        arguments = dict(locals())
+        return _generate_for_candidates(arguments)
+
+    if example_selection not in EXAMPLE_SELECTIONS:
+        raise ValueError(f"Unknown example selection '{example_selection}'. Choose one of: {', '.join(EXAMPLE_SELECTIONS)}.")
+    if order not in ORDERINGS:
+        raise ValueError(f"Unknown ordering '{order}'. Choose one of: {', '.join(ORDERINGS)}.")
+    if example_sets is not None:
+        if example_selection == "similar" or per_row_examples:
+            raise ValueError("Example sets cannot be combined with 'similar' selection or per-row examples.")
+        if example_set_assignment not in SET_ASSIGNMENTS:
+            raise ValueError(f"Unknown example set assignment '{example_set_assignment}'. Choose one of: {', '.join(SET_ASSIGNMENTS)}.")
+    checkpointing = bool(checkpoint_every or resume)
+    if checkpointing:
+        check_checkpointing(output_format, compression, index, tokenized, incremental)
+
+    profile_run = RunProfile(profile, profile_stats, profile_allocations)
+    profile_run.start()
+
+    # Look up the template for this dataset and model
+    prompt_function = get_template(dataset_name, model_name, "few_shot")
 
-    # Check if the function exists and get the reference
-    try:
-        prompt_function = globals()[function_name]
-    except KeyError:
-        raise ValueError(f"Function '{function_name}' does not exist. Ensure it is imported correctly.")
+    # Count tokens in batches per chunk of rows when requested; tokenized output uses the same tokenizer
+    counting = bool(count_tokens or max_tokens)
+    token_counter = TokenCounter(model_name, tokenizer) if counting or tokenized else None
+    if tokenized and token_counter.tokenizer == APPROX_TOKENIZER:
+        raise ValueError(f"Tokenized output requires a real tokenizer, not the '{APPROX_TOKENIZER}' estimate.")
 
     # Identify example and test files based on dataset
-    if dataset_name in ["PStance", "twitter_stance_kemlm"]:
-        if not candidate_name:
-            raise ValueError(f"Candidate name must be specified for {dataset_name}.")
-
-        example_files = [
-            os.path.join(dataset_dir, f) for f in os.listdir(dataset_dir)
-            if ("val" if dataset_name == "PStance" else "train") in f.lower() and
-            (candidate_name.lower() in f.lower() if candidate_name else True)
-        ]
+    example_files, test_files = find_dataset_files(dataset_dir, dataset_name, candidate_name)
 
-        test_files = [
-            os.path.join(dataset_dir, f) for f in os.listdir(dataset_dir)
-            if "test" in f.lower() and
-            (candidate_name.lower() in f.lower() if candidate_name else True)
-        ]
+    manifest = Manifest(output_dir) if incremental else None
+
+    # Determine subdirectory based on the type of prompt
+    output_dir = os.path.join(output_dir, "few_shot")
 
-        if not example_files or not test_files:
-            raise ValueError(f"No matching files found for candidate '{candidate_name}' in {dataset_dir}.")
+    # Construct output file name dynamically
+    if dataset_name == "semeval2016":
+        output_name = f"{output_dir}/{dataset_name}_{model_name}_few_shot_prompts"
     else:
-        # Handle other datasets like semeval2016
-        example_files = [os.path.join(dataset_dir, f) for f in os.listdir(dataset_dir) if "train" in f.lower()]
-        test_files = [os.path.join(dataset_dir, f) for f in os.listdir(dataset_dir) if "test" in f.lower()]
-
-        if not example_files or not test_files:
-            raise ValueError(f"Train or test files missing in {dataset_dir} for {dataset_name}.")
-
-    # Select random examples for few-shot prompts
-    examples = []
-    for example_file in example_files:
-        # Determine the delimiter based on file extension
-        file_extension = os.path.splitext(example_file)[1].lower()
-        if file_extension == ".tsv":
-            delimiter = "\t"
-        elif file_extension == ".csv":
-            delimiter = ","
-        else:
-            raise ValueError("Unsupported file format. Only CSV and TSV files are supported.")
-
-        with open(example_file, newline='', encoding="unicode_escape") as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=delimiter)
-            field_mapping = {key.lower(): key for key in reader.fieldnames}
-            tweet_col = field_mapping.get("tweet")
-            target_col = field_mapping.get("target")
-            label_col = field_mapping.get("stance")
-
-            if not tweet_col or not target_col or not label_col:
-                raise ValueError(f"{example_file} must contain 'tweet', 'target', and 'stance' columns.")
-
-            rows = [row for row in reader]
-            if len(rows) < examples_count:
-                raise ValueError(f"{example_file} must have at least {examples_count} rows.")
-
-            # Randomly sample examples
-            selected_rows = random.sample(rows, examples_count)
-            examples.extend([
-                {
-                    "tweet": row[tweet_col],
-                    "target": row[target_col],
-                    "label": row[label_col],
-                }
-                for row in selected_rows
-            ])
-        break  # Use only the first matching file for examples
-
-    # Generate prompts from test files
-    prompts = []
-    for test_file in test_files:
-        # Determine the delimiter based on file extension
-        file_extension = os.path.splitext(test_file)[1].lower()
-        if file_extension == ".tsv":
-            delimiter = "\t"
-        elif file_extension == ".csv":
-            delimiter = ","
-        else:
-            raise ValueError("Unsupported file format. Only CSV and TSV files are supported.")
+        output_name = f"{output_dir}/{dataset_name}_{model_name}_{candidate_name}_few_shot_prompts"
+    output_file = output_filename(output_name, output_format, compression)
+    with RejectLog(output_name + REJECTS_SUFFIX) as rejects:
+        # Everything the output depends on besides the input files and the drawn examples
+        params = dict(
+            dataset=dataset_name, model=model_name, candidate=candidate_name, examples_count=examples_count,
+            example_selection=example_selection, output_format=output_format, compression=compression,
+            shared_prefix=include_shared_prefix, tokenizer=token_counter.tokenizer if token_counter else None,
+            max_tokens=max_tokens, index=index, tokenized=tokenized,
+            order=order, length_bucket=length_bucket, per_row_examples=per_row_examples, seed=seed,
+            example_set_assignment=example_set_assignment,
+        )
+        if incremental or checkpointing:
+            inputs = {path: file_digest(path) for path in [example_files[0]] + test_files}
 
-        with open(test_file, newline='', encoding="unicode_escape") as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=delimiter)
-            field_mapping = {key.lower(): key for key in reader.fieldnames}
-            tweet_col = field_mapping.get("tweet")
-            target_col = field_mapping.get("target")
+        checkpoint = None
+        if checkpointing:
+            checkpoint = Checkpoint(
+                output_file, {"inputs": inputs, **output_key(prompt_function, example_sets=example_sets, **params)},
+                checkpoint_every, resume,
+            )
+            # A resumed run repeats the draws of the interrupted one, so an unseeded run draws its seed up front
+            if seed is None:
+                seed = checkpoint.seed if checkpoint.seed is not None else random.getrandbits(32)
+            checkpoint.seed = seed
 
-            if not tweet_col or not target_col:
-                raise ValueError(f"{test_file} must contain 'tweet' and 'target' columns.")
+        # Seeded draws come from their own generator, and per-row draws from one per row; otherwise from the global
+        # random state as before
+        rng = random.Random(seed) if seed is not None else random
+        row_rng = RowRandom(seed) if seed is not None else rng
 
-            for row in reader:
-                tweet = row.get(tweet_col)
-                target = row.get(target_col)
+        # Select examples for few-shot prompts
+        with profile_run.stage("sample"):
+            examples = []
+            for example_file in example_files:
+                records = iter_records(example_file, file_delimiter(example_file), ("tweet", "target", "stance"), rejects, use_cache)
+                rows = [
+                    {"tweet": tweet, "target": target, "label": label}
+                    for tweet, target, label in profile_run.timed("read", records)
+                ]
+                if len(rows) < examples_count:
+                    raise ValueError(f"{example_file} must have at least {examples_count} rows.")
 
-                if not tweet or not target:
-                    raise ValueError("Invalid data: Missing tweet or target in a row.")
+                if example_selection == "similar":
+                    # Keep every row as a candidate; each test row gets its most similar examples
+                    examples.extend(rows)
+                    similarity_index = load_or_build_index(
+                        example_file, [row["tweet"] for row in rows], [row["target"] for row in rows]
+                    )
+                else:
+                    # Group the rows by stance label once; draws then only touch the selected indices
+                    label_buckets = LabelBuckets([row["label"] for row in rows])
+                    if per_row_examples:
+                        examples.extend(rows)
+                    elif example_sets is not None:
+                        examples.extend(rows)
+                        example_pool = draw_example_sets(label_buckets, examples_count, example_sets, example_selection, rng)
+                    else:
+                        examples.extend(rows[i] for i in label_buckets.sample(examples_count, rng, example_selection))
+                break  # Use only the first matching file for examples
 
-                # Generate the prompt
-                prompt = prompt_function(tweet, target, examples)
+        if incremental:
+            key = output_key(
+                prompt_function, examples,
+                example_sets=[list(ids) for ids in example_pool] if example_sets is not None else None, **params
+            )
+            action, old_rows = manifest.plan(output_file, inputs, key)
+            if action == SKIP:
+                rejects.discard()
+                print(f"{output_file} is up to date")
+                profile_run.report(output_file)
+                return profile_run.result(output_file)
 
-                # Add to the prompts list with metadata
-                prompts.append({
-                    "dataset": dataset_name,
-                    "model": model_name,
-                    "candidate": candidate_name,
-                    "tweet": tweet,
-                    "target": target,
-                    "prompt": prompt,
-                })
+        def iter_test_pairs():
+            for test_file in test_files:
+                yield from iter_records(test_file, file_delimiter(test_file), ("tweet", "target"), rejects, use_cache)
 
-    # Determine subdirectory based on the type of prompt
-    prompt_type = "zero_shot" if "zero_shot" in function_name else "few_shot"
-    output_dir = os.path.join(output_dir, prompt_type)
+        # Rows already written before the checkpoint are skipped; in input order, before their examples are drawn
+        ordered = order != "input"
+        skip = checkpoint.rows if checkpoint else 0
+        start = 0 if ordered else skip
+        test_pairs = profile_run.timed("read", itertools.islice(iter_test_pairs(), start, None))
+        if example_selection == "similar":
+            template = ExamplePool(prompt_function, examples)
+            items = profile_run.timed("sample", with_similar_examples(test_pairs, similarity_index, examples_count))
+        elif example_sets is not None:
+            template = ExampleSetPool(prompt_function, examples, example_pool)
+            items = profile_run.timed(
+                "sample", with_example_sets(test_pairs, example_sets, example_set_assignment, row_rng, start)
+            )
+        elif per_row_examples:
+            template = ExamplePool(prompt_function, examples)
+            items = profile_run.timed(
+                "sample", with_sampled_examples(test_pairs, label_buckets, examples_count, example_selection, row_rng, start)
+            )
+        else:
+            template = compile_template(prompt_function, examples)
+            items = test_pairs
 
-    # Ensure the output directory exists
-    os.makedirs(output_dir, exist_ok=True)
+        # Reordering needs all rows up front; each row then records its position in input order
+        if ordered:
+            with profile_run.stage("order"):
+                items = order_items(items, template, order, length_bucket)[skip:]
 
-    # Construct output file name dynamically
-    if dataset_name == "semeval2016":
-        output_file = f"{output_dir}/{dataset_name}_{model_name}_few_shot_prompts.json"
-    else:
-        output_file = f"{output_dir}/{dataset_name}_{model_name}_{candidate_name}_few_shot_prompts.json"
+        if incremental:
+            # Reuse unchanged rows of the previous output; it is read before being overwritten
+            items = list(items)
+            digests = [row_digest(item[1], item[0]) for item in items] if ordered else [row_digest(item) for item in items]
+            reusable = {}
+            # Reused rows carry no token ids, so tokenized outputs are always rendered in full
+            if action == PATCH and not tokenized:
+                reusable = reusable_rows(output_file, output_format, compression, old_rows,
+                                         len(examples) if isinstance(template, CompiledTemplate) else examples_count,
+                                         json_encoder=json_encoder)
+
+        # Generate prompts from test files and stream them to the output file
+        token_writer = TokenizedWriter(output_name + TOKENS_SUFFIX, token_counter) if tokenized else contextlib.nullcontext()
+        with profile_run.stage("write"), PromptWriter(
+            output_file, output_format, compression, index, json_encoder, checkpoint.resume if checkpoint else None,
+            in_place=checkpointing,
+        ) as writer, token_writer:
+            # Render and serialize each prompt with its metadata, in worker processes if requested
+            render = functools.partial(
+                render_rows,
+                template,
+                {"dataset": dataset_name, "model": model_name, "candidate": candidate_name},
+                writer.serialize,
+                include_shared_prefix,
+                token_counter if counting else None,
+                max_tokens,
+                token_encoder=token_counter if tokenized else None,
+                indexed=ordered,
+            )
+            stats = WorkerStats()
+            histogram = TokenHistogram()
+            render_map = functools.partial(ordered_map, render, workers=workers, chunk_size=batch_size, stats=stats)
+            results = merge_rows(items, digests, reusable, render_map) if incremental else render_map(items)
+            results = profile_run.timed("render", results)
+            for serialized, token_info, *row_tokens in results:
+                writer.write_serialized(serialized)
+                if token_info is not None:
+                    histogram.add(*token_info)
+                if row_tokens:
+                    token_writer.write(*row_tokens)
+                if checkpoint:
+                    checkpoint.update(writer)
 
-    # Write the prompts to a JSON file
-    with open(output_file, "w", encoding="utf-8") as jsonfile:
-        json.dump(prompts, jsonfile, indent=4, ensure_ascii=False)
+        if checkpoint:
+            checkpoint.remove()
+    rejects.report(output_file)
+    profile_run.add_worker_stats(stats, workers)
+    profile_run.count(written=writer.count, rendered=sum(stats.rows.values()), rejected=rejects.total)
+    if workers > 1:
+        stats.report()
+    if counting:
+        histogram.report(output_file)
+    if incremental:
+        manifest.record(output_file, inputs, key, digests)
+        manifest.save()
+        rendered = sum(stats.rows.values())
+        if rendered < len(items):
+            print(f"Reused {len(items) - rendered} unchanged rows of the previous output and rendered {rendered}")
 
     print(f"Few-shot prompts successfully generated and saved to {output_file}")
+    profile_run.report(output_file)
+    return profile_run.result(output_file)
+
+
+def _generate_for_candidates(arguments: dict) -> list:
+    """
+    Runs `generate_few_shot_prompts` for each requested candidate, in parallel processes.
+
+    The dataset directory is cataloged once, here; each process then loads its candidate's examples once
+    and writes its own output file.
+    """
+    dataset_dir, candidate_names = arguments["dataset_dir"], arguments["candidate_name"]
+    data_dir, directory_name = os.path.split(os.path.normpath(dataset_dir))
+    catalog = open_catalog(data_dir or ".")
+    available = catalog.candidates(directory_name)
+    catalog.save()
+
+    if candidate_names == ALL_CANDIDATES:
+        # Datasets without per-candidate files have a single output
+        candidate_names = available or [None]
+    else:
+        unknown = [name for name in candidate_names if name.lower() not in available]
+        if unknown:
+            raise ValueError(
+                f"Unknown candidates for {arguments['dataset_name']}: {', '.join(unknown)}. "
+                f"Available: {', '.join(available) or 'none'}."
+            )
+    if len(candidate_names) == 1:
+        return [generate_few_shot_prompts(**{**arguments, "candidate_name": candidate_names[0]})]
+
+    workers = arguments["candidate_workers"] or min(len(candidate_names), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(generate_few_shot_prompts, **{**arguments, "candidate_name": name})
+            for name in candidate_names
+        ]
+        return [future.result() for future in futures]
 
 
 if __name__ == "__main__":
+    # Handle --list_templates before the required arguments are enforced
+    list_parser = argparse.ArgumentParser(add_help=False)
+    list_parser.add_argument("--list_templates", "--list-templates", action="store_true")
+    if list_parser.parse_known_args()[0].list_templates:
+        print_templates("few_shot")
+        raise SystemExit(0)
+
     parser = argparse.ArgumentParser(description="Generate Few-Shot Prompts")
     parser.add_argument("--dataset_dir", type=str, required=True, help="Directory containing the dataset files")
     parser.add_argument("--output_dir", type=str, required=True, help="Directory where the output JSON will be saved")
     parser.add_argument("--dataset_name", type=str, required=True, help="Name of the dataset (e.g., 'PStance')")
     parser.add_argument("--model_name", type=str, required=True, help="Name of the model (e.g., 'qwen2')")
-    parser.add_argument("--candidate_name", type=str, default=None, help="Candidate name (e.g., 'bernie')")
+    parser.add_argument("--candidate_name", type=str, nargs="+", default=None, help=f"Candidate name (e.g., 'bernie'), several names, or '{ALL_CANDIDATES}' for every candidate")
+    parser.add_argument("--candidate_workers", type=int, default=None, help="Number of candidates generated at the same time (default: all)")
     parser.add_argument("--examples_count", type=int, default=3, help="Number of examples to use for few-shot prompts")
+    parser.add_argument("--output_format", "--format", type=str, default="json", choices=OUTPUT_FORMATS, help="Output layout: indented or minified JSON array, streaming JSON lines, deduplicated compact document, Parquet table or MessagePack stream")
+    parser.add_argument("--json_encoder", type=str, default="auto", choices=JSON_ENCODERS, help="JSON encoder of the json_min and jsonl formats (default: the fastest installed)")
+    parser.add_argument("--compression", type=str, default=None, choices=COMPRESSIONS, help="Optional output compression")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes used to render prompts")
+    parser.add_argument("--shared_prefix", action="store_true", help="Add the prompt text shared by all rows with the same target to each row")
+    parser.add_argument("--count_tokens", action="store_true", help="Record prompt_tokens for each row and print a token histogram")
+    parser.add_argument("--tokenizer", type=str, default=None, help=f"tokenizer.json file, Hugging Face model directory/id, or '{APPROX_TOKENIZER}' (default: the model family's tokenizer)")
+    parser.add_argument("--max_tokens", type=int, default=None, help="Token budget per prompt; drops examples, then truncates tweets to fit")
+    parser.add_argument("--example_selection", type=str, default="random", choices=EXAMPLE_SELECTIONS, help="How few-shot examples are chosen: uniformly, label-balanced, label-stratified, or the most similar examples per test row")
+    parser.add_argument("--per_row_examples", action="store_true", help="Draw a new example set for every test row")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for drawing few-shot examples")
+    parser.add_argument("--example_sets", type=int, default=None, help="Draw this many example sets once and share them between the test rows")
+    parser.add_argument("--example_set_assignment", type=str, default="rotate", choices=SET_ASSIGNMENTS, help="How test rows are assigned an example set")
+    parser.add_argument("--use_cache", action="store_true", help="Read the dataset files through the parsed-dataset cache")
+    parser.add_argument("--incremental", action="store_true", help="Skip unchanged outputs and re-render only changed rows")
+    parser.add_argument("--index", action="store_true", help="Write a byte-offset index next to a jsonl output for random row access")
+    parser.add_argument("--tokenized", action="store_true", help=f"Also write the token ids of every prompt to <output name>{TOKENS_SUFFIX}")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Number of rows rendered per batch")
+    parser.add_argument("--order", type=str, default="input", choices=ORDERINGS, help="Output row order: input order, grouped by shared prompt prefix, or grouped by prefix and sorted by length bucket")
+    parser.add_argument("--length_bucket", type=int, default=32, help="Width in tweet characters of the length buckets of --order prefix_length")
+    parser.add_argument("--checkpoint_every", type=int, default=None, help=f"Flush the output and write <output file>{CHECKPOINT_SUFFIX} every this many rows")
+    parser.add_argument("--resume", action="store_true", help="Continue the output from its last checkpoint (checkpoints every 100,000 rows unless --checkpoint_every is given)")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage timings, row counts and peak memory")
+    parser.add_argument("--profile_stats", type=str, default=None, help="Write a cProfile dump of the run to this file (implies --profile)")
+    parser.add_argument("--profile_allocations", type=str, default=None, help="Write the largest tracemalloc allocation sites to this file (implies --profile)")
+    parser.add_argument("--list_templates", "--list-templates", action="store_true", help="List the available templates and exit")
 
     args = parser.parse_args()
 
@@ -170,6 +421,32 @@ if __name__ == "__main__":
         output_dir=args.output_dir,
         dataset_name=args.dataset_name,
         model_name=args.model_name,
-        candidate_name=args.candidate_name,
+        candidate_name=args.candidate_name[0] if args.candidate_name and len(args.candidate_name) == 1 else args.candidate_name,
         examples_count=args.examples_count,
+        output_format=args.output_format,
+        compression=args.compression,
+        workers=args.workers,
+        include_shared_prefix=args.shared_prefix,
+        count_tokens=args.count_tokens,
+        tokenizer=args.tokenizer,
+        max_tokens=args.max_tokens,
+        example_selection=args.example_selection,
+        use_cache=args.use_cache,
+        incremental=args.incremental,
+        index=args.index,
+        batch_size=args.batch_size,
+        per_row_examples=args.per_row_examples,
+        seed=args.seed,
+        example_sets=args.example_sets,
+        example_set_assignment=args.example_set_assignment,
+        tokenized=args.tokenized,
+        order=args.order,
+        length_bucket=args.length_bucket,
+        json_encoder=args.json_encoder,
+        checkpoint_every=args.checkpoint_every,
+        resume=args.resume,
+        profile=args.profile,
+        profile_stats=args.profile_stats,
+        profile_allocations=args.profile_allocations,
+        candidate_workers=args.candidate_workers,
     )
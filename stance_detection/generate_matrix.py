@@ -0,0 +1,364 @@
+"""
+Generates every dataset x model x candidate x shot count x seed combination of a sweep in one run.
+
+Each dataset file is read once (through the parsed-dataset cache) and kept in memory, and all
+requested templates are rendered from that single copy. Combinations are rendered in parallel by a
+process pool, each writing its own output file under `<output_dir>/zero_shot` or `<output_dir>/few_shot`
+with the same names as the single-combination scripts.
+
+A sweep spec is a JSON, TOML or YAML file such as:
+
+    {
+        "datasets": ["PStance", "semeval2016"],
+        "models": ["qwen2", "llama2"],
+        "candidates": {"PStance": ["bernie", "biden", "trump"]},
+        "shots": [0, 3],
+        "seeds": [0],
+        "example_selection": "balanced"
+    }
+
+A shot count of 0 means zero-shot. `candidates` may also be a plain list, applied to every dataset
+that has per-candidate files; datasets without an entry use every candidate found in their files (see
+`dataset_catalog.py`). Candidates a dataset has no files for are skipped for that dataset with a
+warning, so one list can be shared by datasets with different candidates. When a sweep has several
+few-shot counts or seeds, few-shot file names get a `_<k>shot` or `_seed<seed>` suffix. `example_selection`
+is "random" (default), "balanced" or "stratified" (see `example_sampling.py`).
+
+Dataset files are decoded as UTF-8. Rows that cannot be used are skipped: invalid test rows are written
+to `<output name>.rejects.jsonl` next to each output, and invalid example rows are counted once per file
+(see `ingestion.py`).
+
+With `incremental`, combinations whose inputs, template, examples and parameters are unchanged since
+the last run are skipped, and outputs whose test files changed re-render only the changed rows (see
+`incremental.py`).
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import functools
+import multiprocessing
+
+from dataset_cache import file_delimiter, read_table
+from example_sampling import SAMPLING_STRATEGIES, LabelBuckets
+from dataset_catalog import find_dataset_files, open_catalog
+from ingestion import REJECTS_SUFFIX, RejectLog, table_records
+from incremental import PATCH, SKIP, Manifest, file_digest, merge_rows, output_key, reusable_rows, row_digest
+from output_writers import OUTPUT_FORMATS, COMPRESSIONS, JSON_ENCODERS, PromptWriter, output_filename
+from parallel import ordered_map, render_rows
+from template_compiler import compile_template
+from template_registry import get_template
+
+
+# Tables shared by all combinations, keyed by path. Set in each worker by `_init_worker`.
+_TABLES = {}
+
+
+def load_sweep_spec(path: str) -> dict:
+    """
+    Loads a sweep spec from a JSON, TOML or YAML file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError(f"Reading '{path}' requires Python 3.11+ or the 'tomli' package.")
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"Reading '{path}' requires the 'PyYAML' package.")
+        with open(path, encoding="utf-8") as f:
+            return yaml.safe_load(f)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def plan_sweep(spec: dict, data_dir: str, output_dir: str, output_format: str = "json", compression: str = None) -> list:
+    """
+    Expands a sweep spec into one job per output file.
+
+    Returns:
+        list: Job dicts with the dataset, model, candidate, shots, seed, input files and output file.
+    """
+    datasets = spec["datasets"]
+    models = spec["models"]
+    shots_list = spec.get("shots", [0])
+    seeds = spec.get("seeds", [None])
+    candidates_spec = spec.get("candidates", {})
+    few_shot_counts = [shots for shots in shots_list if shots > 0]
+
+    # Datasets are scanned once for their splits and candidates
+    catalog = open_catalog(data_dir)
+
+    jobs = []
+    for dataset_name in datasets:
+        dataset_dir = os.path.join(data_dir, dataset_name)
+        discovered = catalog.candidates(dataset_name)
+        if discovered:
+            if isinstance(candidates_spec, dict):
+                requested = candidates_spec.get(dataset_name, discovered)
+            else:
+                requested = candidates_spec
+            # A plain list may name candidates that only some of the sweep's datasets have
+            candidates = [candidate for candidate in requested if candidate in discovered]
+            missing = [candidate for candidate in requested if candidate not in discovered]
+            if missing:
+                print(f"Warning: {dataset_name} has no files for candidate(s) {', '.join(missing)}; skipping them")
+        else:
+            candidates = [None]
+
+        for candidate_name in candidates:
+            example_files, test_files = find_dataset_files(dataset_dir, dataset_name, candidate_name)
+            for model_name in models:
+                for shots in shots_list:
+                    for seed in (seeds if shots > 0 else [None]):
+                        if shots == 0:
+                            name = f"{dataset_name}_{model_name}_{candidate_name}_prompts" if candidate_name \
+                                else f"{dataset_name}_{model_name}_prompts"
+                            base = os.path.join(output_dir, "zero_shot", name)
+                        else:
+                            name = f"{dataset_name}_{model_name}_few_shot_prompts" if dataset_name == "semeval2016" \
+                                else f"{dataset_name}_{model_name}_{candidate_name}_few_shot_prompts"
+                            if len(few_shot_counts) > 1:
+                                name += f"_{shots}shot"
+                            if len(seeds) > 1:
+                                name += f"_seed{seed}"
+                            base = os.path.join(output_dir, "few_shot", name)
+
+                        jobs.append({
+                            "dataset": dataset_name,
+                            "model": model_name,
+                            "candidate": candidate_name,
+                            "shots": shots,
+                            "seed": seed,
+                            "example_file": example_files[0] if shots > 0 else None,
+                            "test_files": test_files,
+                            "output_file": output_filename(base, output_format, compression),
+                            "rejects_file": base + REJECTS_SUFFIX,
+                            "output_format": output_format,
+                            "compression": compression,
+                        })
+    return jobs
+
+
+def _init_worker(tables: dict):
+    global _TABLES
+    _TABLES = tables
+
+
+def _select_examples(job: dict, example_rows: dict, label_buckets: dict, example_selection: str) -> list:
+    rows = example_rows[job["example_file"]]
+    if len(rows) < job["shots"]:
+        raise ValueError(f"{job['example_file']} must have at least {job['shots']} rows.")
+
+    # Same draw as the few-shot script with `--seed seed`
+    selected = label_buckets[job["example_file"]].sample(job["shots"], random.Random(job["seed"]), example_selection)
+    return [rows[i] for i in selected]
+
+
+def _run_job(job: dict):
+    start = time.perf_counter()
+    shot = "few_shot" if job["shots"] > 0 else "zero_shot"
+    prompt_function = get_template(job["dataset"], job["model"], shot)
+    examples = job["examples"]
+
+    with RejectLog(job["rejects_file"]) as rejects:
+        def iter_pairs():
+            for test_file in job["test_files"]:
+                yield from table_records(_TABLES[test_file], test_file, ("tweet", "target"), rejects)
+
+        items, digests, reusable = iter_pairs(), None, {}
+        if job.get("action"):
+            # Reuse unchanged rows of the previous output; it is read before being overwritten
+            items = list(items)
+            digests = [row_digest(item) for item in items]
+            if job["action"] == PATCH:
+                reusable = reusable_rows(job["output_file"], job["output_format"], job["compression"], job["old_rows"],
+                                         len(examples) if examples is not None else None, job["json_encoder"])
+
+        with PromptWriter(job["output_file"], job["output_format"], job["compression"], job["index"],
+                          job["json_encoder"]) as writer:
+            render = functools.partial(
+                render_rows,
+                compile_template(prompt_function, examples),
+                {"dataset": job["dataset"], "model": job["model"], "candidate": job["candidate"]},
+                writer.serialize,
+                False,
+                None,
+                None,
+            )
+            render_map = functools.partial(ordered_map, render, chunk_size=job["batch_size"])
+            results = merge_rows(items, digests, reusable, render_map) if digests is not None else render_map(items)
+            for serialized, _ in results:
+                writer.write_serialized(serialized)
+            rows = writer.count
+
+    return job["output_file"], rows, time.perf_counter() - start, digests, rejects.total
+
+
+def generate_matrix(spec: dict, data_dir: str = "data", output_dir: str = "output", output_format: str = "json",
+                    compression: str = None, workers: int = None, use_cache: bool = True,
+                    incremental: bool = False, index: bool = False, batch_size: int = 1000,
+                    json_encoder: str = "auto") -> dict:
+    """
+    Generates all combinations of a sweep, reading each dataset file once.
+
+    Args:
+        spec (dict): Sweep spec with `datasets`, `models` and optional `candidates`, `shots`, `seeds` and
+            `example_selection`.
+        data_dir (str): Directory holding one sub-directory per dataset (default is "data").
+        output_dir (str): Directory where the `zero_shot` and `few_shot` outputs are written (default is "output").
+        output_format (str): One of `output_writers.OUTPUT_FORMATS` (default is "json").
+        compression (str): Optional. "gzip" or "zstd".
+        workers (int): Number of worker processes rendering combinations in parallel. Defaults to the CPU count.
+        use_cache (bool): Whether to read dataset files through the parsed-dataset cache (default is True).
+        incremental (bool): Whether to skip combinations that are unchanged since the last run and re-render only
+            changed rows of the others, using `<output_dir>/manifest.json` (default is False).
+        index (bool): Whether to write a `.idx` byte-offset index next to each output. Requires the uncompressed
+            "jsonl" format (default is False).
+        batch_size (int): Number of rows rendered per batch (default is 1000).
+        json_encoder (str): JSON encoder of the "json_min" and "jsonl" formats (default is "auto", the fastest installed).
+
+    Returns:
+        dict: `files` (output file to row count), `skipped` (up-to-date output files), `rows`, `rejected`
+            (rejected test rows per output file, for files with any), `seconds` and `rows_per_second`.
+    """
+    start = time.perf_counter()
+    example_selection = spec.get("example_selection", "random")
+    if example_selection not in SAMPLING_STRATEGIES:
+        raise ValueError(f"Unknown example selection '{example_selection}'. Choose one of: {', '.join(SAMPLING_STRATEGIES)}.")
+    jobs = plan_sweep(spec, data_dir, output_dir, output_format, compression)
+
+    # Read every needed file once; all combinations render from these in-memory tables
+    tables = {}
+    for job in jobs:
+        paths = job["test_files"] + ([job["example_file"]] if job["example_file"] else [])
+        for path in paths:
+            if path not in tables:
+                tables[path] = read_table(path, file_delimiter(path), use_cache=use_cache)
+
+    # Valid example rows of each example file, shared by all shot counts and seeds
+    example_rows, label_buckets = {}, {}
+    for path in sorted({job["example_file"] for job in jobs if job["example_file"]}):
+        rejects = RejectLog()
+        example_rows[path] = [
+            {"tweet": tweet, "target": target, "label": label}
+            for tweet, target, label in table_records(tables[path], path, ("tweet", "target", "stance"), rejects)
+        ]
+        rejects.report(path)
+        label_buckets[path] = LabelBuckets([row["label"] for row in example_rows[path]])
+
+    for job in jobs:
+        job["index"] = index
+        job["batch_size"] = batch_size
+        job["json_encoder"] = json_encoder
+        job["examples"] = (
+            _select_examples(job, example_rows, label_buckets, example_selection) if job["shots"] > 0 else None
+        )
+
+    skipped = []
+    if incremental:
+        manifest = Manifest(output_dir)
+        digests = {}
+        for job in jobs:
+            paths = ([job["example_file"]] if job["example_file"] else []) + job["test_files"]
+            for path in paths:
+                if path not in digests:
+                    digests[path] = file_digest(path)
+            job["inputs"] = {path: digests[path] for path in paths}
+            job["key"] = output_key(
+                get_template(job["dataset"], job["model"], "few_shot" if job["shots"] > 0 else "zero_shot"),
+                job["examples"],
+                dataset=job["dataset"], model=job["model"], candidate=job["candidate"], shots=job["shots"],
+                seed=job["seed"], output_format=output_format, compression=compression, index=index,
+            )
+            job["action"], job["old_rows"] = manifest.plan(job["output_file"], job["inputs"], job["key"])
+        skipped = [job["output_file"] for job in jobs if job["action"] == SKIP]
+        jobs = [job for job in jobs if job["action"] != SKIP]
+
+    workers = workers or os.cpu_count() or 1
+    if not jobs:
+        results = []
+    elif workers <= 1:
+        _init_worker(tables)
+        results = [_run_job(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(min(workers, len(jobs)) or 1, initializer=_init_worker, initargs=(tables,)) as pool:
+            results = pool.map(_run_job, jobs, chunksize=1)
+
+    if incremental:
+        for job, (_, _, _, row_digests, _) in zip(jobs, results):
+            manifest.record(job["output_file"], job["inputs"], job["key"], row_digests)
+        manifest.save()
+
+    seconds = time.perf_counter() - start
+    rows = sum(row_count for _, row_count, _, _, _ in results)
+    summary = {
+        "files": {output_file: row_count for output_file, row_count, _, _, _ in results},
+        "skipped": skipped,
+        "rows": rows,
+        "rejected": {output_file: rejected for output_file, _, _, _, rejected in results if rejected},
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else float("inf"),
+    }
+
+    for output_file, row_count, job_seconds, _, rejected in results:
+        rejected_note = f", {rejected} rows rejected" if rejected else ""
+        print(f"{output_file}: {row_count} rows in {job_seconds:.2f}s{rejected_note}")
+    if skipped:
+        print(f"Skipped {len(skipped)} up-to-date files")
+    print(f"Generated {len(results)} files with {rows} rows in {seconds:.2f}s ({summary['rows_per_second']:,.0f} rows/sec)")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Prompts for a Dataset x Model x Candidate Sweep")
+    parser.add_argument("--spec", type=str, default=None, help="Sweep spec file (JSON, TOML or YAML)")
+    parser.add_argument("--datasets", type=str, nargs="+", default=None, help="Datasets (e.g., 'PStance semeval2016')")
+    parser.add_argument("--models", type=str, nargs="+", default=None, help="Models (e.g., 'qwen2 llama2')")
+    parser.add_argument("--candidates", type=str, nargs="+", default=None, help="Candidates for PStance and twitter_stance_kemlm")
+    parser.add_argument("--shots", type=int, nargs="+", default=None, help="Shot counts; 0 means zero-shot")
+    parser.add_argument("--seeds", type=int, nargs="+", default=None, help="Seeds for few-shot example sampling")
+    parser.add_argument("--example_selection", type=str, default=None, choices=SAMPLING_STRATEGIES, help="How few-shot examples are drawn: uniformly, label-balanced or label-stratified")
+    parser.add_argument("--data_dir", type=str, default="data", help="Directory holding one sub-directory per dataset")
+    parser.add_argument("--output_dir", type=str, default="output", help="Directory where the outputs will be saved")
+    parser.add_argument("--output_format", "--format", type=str, default="json", choices=OUTPUT_FORMATS, help="Output layout: indented or minified JSON array, streaming JSON lines, deduplicated compact document, Parquet table or MessagePack stream")
+    parser.add_argument("--json_encoder", type=str, default="auto", choices=JSON_ENCODERS, help="JSON encoder of the json_min and jsonl formats (default: the fastest installed)")
+    parser.add_argument("--compression", type=str, default=None, choices=COMPRESSIONS, help="Optional output compression")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--incremental", action="store_true", help="Skip unchanged outputs and re-render only changed rows")
+    parser.add_argument("--index", action="store_true", help="Write a byte-offset index next to each jsonl output for random row access")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Number of rows rendered per batch")
+    parser.add_argument("--no_cache", action="store_true", help="Parse dataset files without the parsed-dataset cache")
+
+    args = parser.parse_args()
+
+    spec = load_sweep_spec(args.spec) if args.spec else {}
+    for key in ("datasets", "models", "candidates", "shots", "seeds", "example_selection"):
+        if getattr(args, key) is not None:
+            spec[key] = getattr(args, key)
+    if "datasets" not in spec or "models" not in spec:
+        parser.error("Datasets and models must be given with --spec or --datasets and --models.")
+
+    generate_matrix(
+        spec,
+        data_dir=args.data_dir,
+        output_dir=args.output_dir,
+        output_format=args.output_format,
+        compression=args.compression,
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        incremental=args.incremental,
+        index=args.index,
+        batch_size=args.batch_size,
+        json_encoder=args.json_encoder,
+    )
@@ -1,106 +1,254 @@
 import os
-import csv
-import json
+import functools
+import contextlib
 import argparse
-from prompts import * # Import all your functions
+import itertools
+from checkpoints import CHECKPOINT_SUFFIX, Checkpoint, check_checkpointing
+from dataset_cache import file_delimiter
+from ingestion import REJECTS_SUFFIX, RejectLog, iter_records
+from incremental import PATCH, SKIP, Manifest, file_digest, merge_rows, output_key, reusable_rows, row_digest
+from output_writers import OUTPUT_FORMATS, COMPRESSIONS, JSON_ENCODERS, PromptWriter, output_filename
+from parallel import WorkerStats, ordered_map, render_rows
+from profiling import RunProfile
+from prompt_ordering import ORDERINGS, order_items
+from template_registry import get_template, print_templates
+from template_compiler import compile_template
+from tokenization import APPROX_TOKENIZER, TokenCounter, TokenHistogram
+from tokenized_output import TOKENS_SUFFIX, TokenizedWriter
 
 
-def generate_zero_shot_prompts(input_file: str, output_dir: str, dataset_name: str, model_name: str, candidate_name: str = None):
+def generate_zero_shot_prompts(input_file: str, output_dir: str, dataset_name: str, model_name: str, candidate_name: str = None,
+                               output_format: str = "json", compression: str = None, workers: int = 1,
+                               include_shared_prefix: bool = False, count_tokens: bool = False, tokenizer: str = None,
+                               max_tokens: int = None, use_cache: bool = False, incremental: bool = False, index: bool = False,
+                               batch_size: int = 1000, tokenized: bool = False, order: str = "input",
+                               length_bucket: int = 32, json_encoder: str = "auto", checkpoint_every: int = None,
+                               resume: bool = False, profile: bool = False, profile_stats: str = None,
+                               profile_allocations: str = None):
     """
     Generates zero-shot prompts from a dataset file (CSV or TSV) for the specified dataset and model,
     using appropriate template functions, and stores the results in a JSON file.
 
+    The input is decoded as UTF-8. Rows that cannot be used (invalid UTF-8, a missing tweet or target, or a
+    malformed line) are skipped and written to `<output name>.rejects.jsonl` next to the output.
+
     Args:
         input_file (str): Path to the input dataset file (CSV or TSV).
         output_dir (str): Directory where the output JSON file will be saved.
         dataset_name (str): Name of the dataset to use for generating prompts (e.g., "PStance").
         model_name (str): Name of the model to use for generating prompts (e.g., "qwen2").
         candidate_name (str): Optional. Name of the candidate (e.g., "bernie", "biden", "trump").
+        output_format (str): "json" for a single indented JSON array (default), "json_min" for the same array
+            without indentation, "jsonl" for one compact JSON object per line, "compact" for a deduplicated document
+            that stores repeated metadata and prompt text once (see `compact_output.py`), "parquet" for a Parquet
+            table (requires pyarrow), or "msgpack" for one MessagePack map per row (requires msgpack). Rows are
+            streamed to disk as they are rendered, except with "compact". `output_writers.read_rows` reads any of them.
+        compression (str): Optional. "gzip" or "zstd" to compress the output file, or the column chunks of a
+            Parquet file.
+        workers (int): Number of worker processes used to render rows (default is 1). The output
+            is byte-identical to a single-process run.
+        include_shared_prefix (bool): Whether to add a `shared_prefix` field to each row, holding the prompt
+            text before the tweet. It is identical for all rows with the same target and can be cached once
+            by the inference server (default is False).
+        count_tokens (bool): Whether to record `prompt_tokens` for each row and print a token histogram (default is False).
+        tokenizer (str): Optional. Tokenizer used for counting: a `tokenizer.json` file, a Hugging Face model directory/id,
+            or "approx". Defaults to the tokenizer of the model family, loaded offline from the local cache.
+        max_tokens (int): Optional. Token budget per prompt; implies `count_tokens`. Prompts over budget drop
+            few-shot examples, then truncate the tweet, and record `examples_used` and `tweet_truncated`.
+        use_cache (bool): Whether to read the input through the parsed-dataset cache in `<input dir>/.cache/`,
+            which is rebuilt automatically when the input file changes (default is False).
+        incremental (bool): Whether to skip the output if nothing it depends on changed since the last run, and
+            to render only new or changed rows when only the input file changed. What each output was generated
+            from is recorded in `<output_dir>/manifest.json` (default is False).
+        index (bool): Whether to write a `<output_file>.idx` byte-offset index next to the output, so that rows
+            can be read directly with `prompt_index.IndexedPromptFile`. Requires the uncompressed "jsonl" format
+            (default is False).
+        batch_size (int): Number of rows rendered per batch (and sent to a worker at a time) (default is 1000).
+        tokenized (bool): Whether to also write the token ids of every prompt to `<output name>.tokens.npz`, with the
+            tokens of the text shared by all prompts of a target stored once (see `tokenized_output.py`). Uses the
+            `tokenizer` of `count_tokens`, which must not be "approx"; requires numpy (default is False).
+        order (str): Order of the output rows: "input" (default), "prefix" to group rows by the prompt text
+            before the tweet, so that batched inference reuses its prefix cache, or "prefix_length" to also sort
+            each group by length bucket, to reduce padding (see `prompt_ordering.py`). Reordered rows record
+            `row_index`, their position in the input-ordered output.
+        length_bucket (int): Width, in characters of tweet, of the length buckets of "prefix_length" (default is 32).
+        json_encoder (str): JSON encoder of the "json_min" and "jsonl" formats: "auto" (default; the fastest
+            installed), "json" (standard library), "orjson" or "msgspec". All write the same rows.
+        checkpoint_every (int): Optional. Number of rows between checkpoints: the output is flushed to disk and
+            `<output_file>.checkpoint.json` records the rows written (see `checkpoints.py`). Requires an uncompressed
+            "json", "json_min", "jsonl" or "msgpack" output, without `index`, `tokenized` or `incremental`.
+        resume (bool): Whether to continue the output from its last checkpoint, if it has one that matches this
+            run; implies checkpoints, every 100,000 rows unless `checkpoint_every` is given (default is False).
+        profile (bool): Whether to time the stages of the run (read, sample, render, serialize, write), count its
+            rows and measure its peak memory, print them, and return them (default is False; see `profiling.py`).
+        profile_stats (str): Optional. Path of a cProfile dump of the run; implies `profile`.
+        profile_allocations (str): Optional. Path of a tracemalloc report of the largest allocation sites; implies
+            `profile`. Tracing allocations slows the run down considerably.
     
     The input file must contain the following columns:
         - `tweet` or `Tweet`: The tweet text to analyze.
         - `target` or `Target`: The target for stance detection.
+
+    Returns:
+        str: The output file, or with `profile`, a dict with the `output_file`, `total_seconds`, the seconds per
+        stage (`stages`), row counts (`rows`) and `peak_memory_mb`.
     """
-    # Dynamically construct the function name
-    function_name = f"{dataset_name}_{model_name}_zero_shot_template"
+    profile_run = RunProfile(profile, profile_stats, profile_allocations)
+    profile_run.start()
+
+    if order not in ORDERINGS:
+        raise ValueError(f"Unknown ordering '{order}'. Choose one of: {', '.join(ORDERINGS)}.")
+    checkpointing = bool(checkpoint_every or resume)
+    if checkpointing:
+        check_checkpointing(output_format, compression, index, tokenized, incremental)
 
-    # Check if the function exists and get the reference
-    try:
-        prompt_function = globals()[function_name]
-    except KeyError:
-        raise ValueError(f"Function '{function_name}' does not exist. Ensure it is imported correctly.")
+    # Look up the template for this dataset and model
+    prompt_function = get_template(dataset_name, model_name, "zero_shot")
+
+    # Count tokens in batches per chunk of rows when requested; tokenized output uses the same tokenizer
+    counting = bool(count_tokens or max_tokens)
+    token_counter = TokenCounter(model_name, tokenizer) if counting or tokenized else None
+    if tokenized and token_counter.tokenizer == APPROX_TOKENIZER:
+        raise ValueError(f"Tokenized output requires a real tokenizer, not the '{APPROX_TOKENIZER}' estimate.")
 
     # Determine the delimiter based on file extension
-    file_extension = os.path.splitext(input_file)[1].lower()
-    if file_extension == ".tsv":
-        delimiter = "\t"
-    elif file_extension == ".csv":
-        delimiter = ","
-    else:
-        raise ValueError("Unsupported file format. Only CSV and TSV files are supported.")
-
-    # Read the dataset and generate prompts
-    prompts = []
-    with open(input_file, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=delimiter)
-        
-        # Normalize column names
-        field_mapping = {
-            key.lower(): key for key in reader.fieldnames
-        }
-        tweet_col = field_mapping.get('tweet')
-        target_col = field_mapping.get('target')
-
-        if not tweet_col or not target_col:
-            raise ValueError(f"The file '{input_file}' must contain 'tweet' or 'Tweet' and 'target' or 'Target' columns.")
-
-        for row in reader:
-            tweet = row.get(tweet_col)
-            target = row.get(target_col)
-            
-            if not tweet or not target:
-                raise ValueError("Invalid data: Missing tweet or target in a row.")
-            
-            # Generate the prompt
-            prompt = prompt_function(tweet, target)
-            
-            # Add to the prompts list with metadata
-            prompts.append({
-                "dataset": dataset_name,
-                "model": model_name,
-                "candidate": candidate_name,
-                "tweet": tweet,
-                "target": target,
-                "prompt": prompt,
-            })
+    delimiter = file_delimiter(input_file)
 
-    # Determine subdirectory based on the type of prompt
-    prompt_type = "zero_shot" if "zero_shot" in function_name else "few_shot"
-    output_dir = os.path.join(output_dir, prompt_type)
+    manifest = Manifest(output_dir) if incremental else None
 
-    # Ensure the output directory exists
-    os.makedirs(output_dir, exist_ok=True)
+    # Determine subdirectory based on the type of prompt
+    output_dir = os.path.join(output_dir, "zero_shot")
 
     # Construct output file name dynamically
     if candidate_name:
-        output_file = f"{output_dir}/{dataset_name}_{model_name}_{candidate_name}_prompts.json"
+        output_name = f"{output_dir}/{dataset_name}_{model_name}_{candidate_name}_prompts"
     else:
-        output_file = f"{output_dir}/{dataset_name}_{model_name}_prompts.json"
+        output_name = f"{output_dir}/{dataset_name}_{model_name}_prompts"
+    output_file = output_filename(output_name, output_format, compression)
+
+    if incremental or checkpointing:
+        inputs = {input_file: file_digest(input_file)}
+        key = output_key(
+            prompt_function,
+            dataset=dataset_name, model=model_name, candidate=candidate_name,
+            output_format=output_format, compression=compression, shared_prefix=include_shared_prefix,
+            tokenizer=token_counter.tokenizer if token_counter else None, max_tokens=max_tokens, index=index, tokenized=tokenized,
+            order=order, length_bucket=length_bucket,
+        )
+    checkpoint = Checkpoint(output_file, {"inputs": inputs, **key}, checkpoint_every, resume) if checkpointing else None
+    if incremental:
+        action, old_rows = manifest.plan(output_file, inputs, key)
+        if action == SKIP:
+            print(f"{output_file} is up to date")
+            profile_run.report(output_file)
+            return profile_run.result(output_file)
+
+    # Stream the dataset rows, setting aside the ones that cannot be used
+    with RejectLog(output_name + REJECTS_SUFFIX) as rejects:
+        # Rows already written before the checkpoint are skipped
+        ordered = order != "input"
+        skip = checkpoint.rows if checkpoint else 0
+        records = iter_records(input_file, delimiter, ("tweet", "target"), rejects, use_cache)
+        items = profile_run.timed("read", itertools.islice(records, 0 if ordered else skip, None))
+        template = compile_template(prompt_function)
 
-    # Write the prompts to a JSON file
-    with open(output_file, "w", encoding="utf-8") as jsonfile:
-        json.dump(prompts, jsonfile, indent=4, ensure_ascii=False)
+        # Reordering needs all rows up front; each row then records its position in input order
+        if ordered:
+            with profile_run.stage("order"):
+                items = order_items(items, template, order, length_bucket)[skip:]
+        if incremental:
+            # Reuse unchanged rows of the previous output; it is read before being overwritten
+            items = list(items)
+            digests = [row_digest(item[1], item[0]) for item in items] if ordered else [row_digest(item) for item in items]
+            # Reused rows carry no token ids, so tokenized outputs are always rendered in full
+            reusable = reusable_rows(output_file, output_format, compression, old_rows, json_encoder=json_encoder) if action == PATCH and not tokenized else {}
 
+        token_writer = TokenizedWriter(output_name + TOKENS_SUFFIX, token_counter) if tokenized else contextlib.nullcontext()
+        with profile_run.stage("write"), PromptWriter(
+            output_file, output_format, compression, index, json_encoder, checkpoint.resume if checkpoint else None,
+            in_place=checkpointing,
+        ) as writer, token_writer:
+            # Render and serialize each prompt with its metadata, in worker processes if requested
+            render = functools.partial(
+                render_rows,
+                template,
+                {"dataset": dataset_name, "model": model_name, "candidate": candidate_name},
+                writer.serialize,
+                include_shared_prefix,
+                token_counter if counting else None,
+                max_tokens,
+                token_encoder=token_counter if tokenized else None,
+                indexed=ordered,
+            )
+            stats = WorkerStats()
+            histogram = TokenHistogram()
+            render_map = functools.partial(ordered_map, render, workers=workers, chunk_size=batch_size, stats=stats)
+            results = merge_rows(items, digests, reusable, render_map) if incremental else render_map(items)
+            results = profile_run.timed("render", results)
+            for serialized, token_info, *row_tokens in results:
+                writer.write_serialized(serialized)
+                if token_info is not None:
+                    histogram.add(*token_info)
+                if row_tokens:
+                    token_writer.write(*row_tokens)
+                if checkpoint:
+                    checkpoint.update(writer)
+
+        if checkpoint:
+            checkpoint.remove()
+    rejects.report(output_file)
+    profile_run.add_worker_stats(stats, workers)
+    profile_run.count(written=writer.count, rendered=sum(stats.rows.values()), rejected=rejects.total)
+    if workers > 1:
+        stats.report()
+    if counting:
+        histogram.report(output_file)
+    if incremental:
+        manifest.record(output_file, inputs, key, digests)
+        manifest.save()
+        rendered = sum(stats.rows.values())
+        if rendered < len(items):
+            print(f"Reused {len(items) - rendered} unchanged rows of the previous output and rendered {rendered}")
     print(f"Prompts successfully generated and saved to {output_file}")
+    profile_run.report(output_file)
+    return profile_run.result(output_file)
 
 
 if __name__ == "__main__":
+    # Handle --list_templates before the required arguments are enforced
+    list_parser = argparse.ArgumentParser(add_help=False)
+    list_parser.add_argument("--list_templates", "--list-templates", action="store_true")
+    if list_parser.parse_known_args()[0].list_templates:
+        print_templates("zero_shot")
+        raise SystemExit(0)
+
     parser = argparse.ArgumentParser(description="Generate Zero-Shot Prompts")
     parser.add_argument("--input_csv", type=str, required=True, help="Path to the input CSV file")
     parser.add_argument("--output_dir", type=str, required=True, help="Directory where the output JSON will be saved")
     parser.add_argument("--dataset_name", type=str, required=True, help="Name of the dataset (e.g., 'PStance')")
     parser.add_argument("--model_name", type=str, required=True, help="Name of the model (e.g., 'qwen2')")
     parser.add_argument("--candidate_name", type=str, default=None, help="Candidate name (e.g., 'bernie')")
+    parser.add_argument("--output_format", "--format", type=str, default="json", choices=OUTPUT_FORMATS, help="Output layout: indented or minified JSON array, streaming JSON lines, deduplicated compact document, Parquet table or MessagePack stream")
+    parser.add_argument("--json_encoder", type=str, default="auto", choices=JSON_ENCODERS, help="JSON encoder of the json_min and jsonl formats (default: the fastest installed)")
+    parser.add_argument("--compression", type=str, default=None, choices=COMPRESSIONS, help="Optional output compression")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes used to render prompts")
+    parser.add_argument("--shared_prefix", action="store_true", help="Add the prompt text shared by all rows with the same target to each row")
+    parser.add_argument("--count_tokens", action="store_true", help="Record prompt_tokens for each row and print a token histogram")
+    parser.add_argument("--tokenizer", type=str, default=None, help=f"tokenizer.json file, Hugging Face model directory/id, or '{APPROX_TOKENIZER}' (default: the model family's tokenizer)")
+    parser.add_argument("--max_tokens", type=int, default=None, help="Token budget per prompt; drops examples, then truncates tweets to fit")
+    parser.add_argument("--use_cache", action="store_true", help="Read the input through the parsed-dataset cache")
+    parser.add_argument("--incremental", action="store_true", help="Skip unchanged outputs and re-render only changed rows")
+    parser.add_argument("--index", action="store_true", help="Write a byte-offset index next to a jsonl output for random row access")
+    parser.add_argument("--tokenized", action="store_true", help=f"Also write the token ids of every prompt to <output name>{TOKENS_SUFFIX}")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Number of rows rendered per batch")
+    parser.add_argument("--order", type=str, default="input", choices=ORDERINGS, help="Output row order: input order, grouped by shared prompt prefix, or grouped by prefix and sorted by length bucket")
+    parser.add_argument("--length_bucket", type=int, default=32, help="Width in tweet characters of the length buckets of --order prefix_length")
+    parser.add_argument("--checkpoint_every", type=int, default=None, help=f"Flush the output and write <output file>{CHECKPOINT_SUFFIX} every this many rows")
+    parser.add_argument("--resume", action="store_true", help="Continue the output from its last checkpoint (checkpoints every 100,000 rows unless --checkpoint_every is given)")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage timings, row counts and peak memory")
+    parser.add_argument("--profile_stats", type=str, default=None, help="Write a cProfile dump of the run to this file (implies --profile)")
+    parser.add_argument("--profile_allocations", type=str, default=None, help="Write the largest tracemalloc allocation sites to this file (implies --profile)")
+    parser.add_argument("--list_templates", "--list-templates", action="store_true", help="List the available templates and exit")
 
     args = parser.parse_args()
 
@@ -110,4 +258,24 @@ if __name__ == "__main__":
         dataset_name=args.dataset_name,
         model_name=args.model_name,
         candidate_name=args.candidate_name,
+        output_format=args.output_format,
+        compression=args.compression,
+        workers=args.workers,
+        include_shared_prefix=args.shared_prefix,
+        count_tokens=args.count_tokens,
+        tokenizer=args.tokenizer,
+        max_tokens=args.max_tokens,
+        use_cache=args.use_cache,
+        incremental=args.incremental,
+        index=args.index,
+        batch_size=args.batch_size,
+        tokenized=args.tokenized,
+        order=args.order,
+        length_bucket=args.length_bucket,
+        json_encoder=args.json_encoder,
+        checkpoint_every=args.checkpoint_every,
+        resume=args.resume,
+        profile=args.profile,
+        profile_stats=args.profile_stats,
+        profile_allocations=args.profile_allocations,
     )
@@ -0,0 +1,261 @@
+"""
+Incremental regeneration of prompt files.
+
+Every generated file is recorded in `<output_dir>/manifest.json` together with what it was generated
+from: content hashes of its input files, a hash of the template source, the few-shot examples and the
+generation parameters, and one hash per row of the (tweet, target) pairs it was rendered from.
+
+On a rerun, an output is:
+
+    - skipped when its inputs, template, examples and parameters are all unchanged;
+    - patched when only its input files changed: rows whose (tweet, target) pair is already in the old
+      output are taken from it, and only new or changed rows are rendered;
+    - regenerated in full otherwise.
+
+A patched file is still rewritten as a whole, since the JSON layouts and compressed streams cannot be
+edited in place, but the rendering work is limited to the changed rows.
+"""
+
+import os
+import sys
+import json
+import types
+import inspect
+import hashlib
+from collections import deque
+
+from output_writers import read_rows, serialize_row
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+MANIFEST_NAME = "manifest.json"
+# Bump when the layout of generated rows, or the examples drawn for the same seed, change, so that existing
+# outputs are regenerated.
+MANIFEST_VERSION = 2
+
+SKIP, PATCH, FULL = "skip", "patch", "full"
+
+
+def file_digest(path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def template_digest(template) -> str:
+    """
+    Returns a digest of a template's source: the function source for templates in `prompts.py`,
+    or the format strings of a data-file template.
+    """
+    if isinstance(template, types.FunctionType):
+        try:
+            source = inspect.getsource(template)
+        except (OSError, TypeError):
+            source = template.__qualname__
+    elif hasattr(template, "__dict__"):
+        source = json.dumps(vars(template), sort_keys=True, default=repr)
+    else:
+        source = repr(template)
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def value_digest(value) -> str:
+    """
+    Returns a digest of a JSON-serializable value, e.g. a list of few-shot examples.
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def output_key(template, examples: list = None, **params) -> dict:
+    """
+    Returns what an output depends on besides its input files: the template source, the few-shot
+    examples (or None for zero-shot) and the generation parameters.
+    """
+    return {
+        "template": template_digest(template),
+        "examples": value_digest(examples) if examples is not None else None,
+        "params": params,
+    }
+
+
+def row_digest(item: tuple, row_index: int = None) -> str:
+    """
+    Returns a short digest of the `(tweet, target)`, `(tweet, target, example_ids)` or `(tweet, target, set_id)`
+    item a row is rendered from, and of its `row_index` for reordered outputs, whose rows record it.
+    """
+    extra = item[2] if len(item) > 2 else None
+    if extra is not None and not isinstance(extra, int):
+        extra = list(extra)
+    values = [item[0], item[1], extra] if row_index is None else [item[0], item[1], extra, row_index]
+    text = json.dumps(values, ensure_ascii=False)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class Manifest:
+    """
+    Records what each output file in an output directory was generated from.
+
+    Entries are keyed by the output path relative to the output directory. Each entry holds `inputs`
+    (input path to content hash), `key` (template, examples and parameters), `rows` (row digests, in
+    output order) and `size` (the size of the output in bytes, so that an output changed since is regenerated).
+
+    Several processes may update the same manifest, e.g. one per candidate: `save` merges the entries recorded
+    by this instance into the stored manifest under a lock on `manifest.json.lock`, so no entry is lost.
+
+    Args:
+        output_dir (str): Root output directory (the one holding `zero_shot/` and `few_shot/`).
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = self._load()
+        self._recorded = {}
+
+    def _load(self) -> dict:
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            stored = json.load(f)
+        return stored.get("outputs", {}) if stored.get("version") == MANIFEST_VERSION else {}
+
+    def _name(self, output_file: str) -> str:
+        return os.path.relpath(output_file, self.output_dir).replace(os.sep, "/")
+
+    def plan(self, output_file: str, inputs: dict, key: dict):
+        """
+        Decides how to bring `output_file` up to date.
+
+        Args:
+            output_file (str): Path of the output file.
+            inputs (dict): Input file path to `file_digest`.
+            key (dict): Everything else the output depends on: template digest, examples digest and parameters.
+
+        Returns:
+            tuple: `(action, old_rows)`, where `action` is `SKIP`, `PATCH` or `FULL`, and `old_rows` holds the
+                row digests of the existing output when patching (None otherwise).
+        """
+        entry = self.entries.get(self._name(output_file))
+        if entry is None or entry["key"] != key or not os.path.isfile(output_file):
+            return FULL, None
+        # A `jsonl` output is written in place, so a failed run can leave it partly rewritten
+        if entry.get("size") is not None and entry["size"] != os.path.getsize(output_file):
+            return FULL, None
+        if entry["inputs"] == inputs:
+            return SKIP, None
+        return PATCH, entry["rows"]
+
+    def record(self, output_file: str, inputs: dict, key: dict, rows: list):
+        name = self._name(output_file)
+        self.entries[name] = self._recorded[name] = {
+            "inputs": inputs, "key": key, "rows": rows, "size": os.path.getsize(output_file),
+        }
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self.path + ".lock", "a+b") as lock:
+            _lock(lock)
+            try:
+                # Other processes may have saved their entries since this manifest was loaded
+                self.entries = {**self._load(), **self._recorded}
+                temporary_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temporary_path, "w", encoding="utf-8") as f:
+                    json.dump({"version": MANIFEST_VERSION, "outputs": self.entries}, f, ensure_ascii=False, sort_keys=True)
+                os.replace(temporary_path, self.path)
+            finally:
+                _unlock(lock)
+
+
+def _lock(f):
+    """
+    Blocks until this process holds the exclusive lock on an open file. The lock is released if the process dies.
+    """
+    if sys.platform == "win32":
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after 10 seconds
+                continue
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock(f):
+    if sys.platform == "win32":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def read_output_rows(path: str, output_format: str, compression: str = None) -> list:
+    """
+    Reads back the rows of a generated file.
+    """
+    return list(read_rows(path, output_format, compression))
+
+
+def reusable_rows(output_file: str, output_format: str, compression: str, old_rows: list,
+                  examples_count: int = None, json_encoder: str = "auto") -> dict:
+    """
+    Loads the rows of an existing output so they can be reused by `merge_rows`.
+
+    Args:
+        output_file (str): Path of the existing output.
+        output_format (str): Its format (one of `OUTPUT_FORMATS`).
+        compression (str): Its compression.
+        old_rows (list): Row digests recorded in the manifest for the output.
+        examples_count (int): Optional. Number of few-shot examples, used to rebuild the token
+            information of rows whose examples were reduced to fit a token budget.
+        json_encoder (str): JSON encoder the rows are serialized with again, as passed to `PromptWriter`.
+
+    Returns:
+        dict: Row digest to a deque of `(serialized_row, token_info)`. Empty if the output does not
+            match its manifest entry.
+    """
+    try:
+        rows = read_output_rows(output_file, output_format, compression)
+    except (OSError, ValueError, EOFError):
+        return {}
+    if len(rows) != len(old_rows):
+        return {}
+
+    reusable = {}
+    for digest, row in zip(old_rows, rows):
+        token_info = None
+        if "prompt_tokens" in row:
+            # Rows with their own examples may have fewer than `examples_count` (see `SimilarityIndex.query`)
+            row_examples = len(row["example_ids"]) if "example_ids" in row else examples_count
+            examples_used = row.get("examples_used", row_examples)
+            token_info = (row["prompt_tokens"], examples_used != row_examples, row.get("tweet_truncated", False))
+        reusable.setdefault(digest, deque()).append((serialize_row(output_format, row, json_encoder), token_info))
+    return reusable
+
+
+def merge_rows(items: list, digests: list, reusable: dict, render_map):
+    """
+    Yields `(serialized_row, token_info)` for every item, in order, rendering only the items without
+    a reusable row.
+
+    Args:
+        items (list): Items to output, as passed to `parallel.render_rows`.
+        digests (list): `row_digest` of each item.
+        reusable (dict): Rows from `reusable_rows`. Consumed.
+        render_map (callable): Takes an iterable of items and yields their `(serialized_row, token_info)`,
+            e.g. a partial of `parallel.ordered_map`.
+    """
+    reuse = [bool(reusable.get(digest)) and reusable[digest].popleft() for digest in digests]
+    rendered = render_map(item for item, reused in zip(items, reuse) if not reused)
+    for reused in reuse:
+        yield reused if reused else next(rendered)
@@ -0,0 +1,199 @@
+"""
+Streaming, fault-tolerant ingestion of dataset files.
+
+Rows are read one at a time and decoded as UTF-8. A row that cannot be used is not fatal: rows with
+bytes that are not valid UTF-8, with an empty required column, or that the CSV parser cannot read are
+written to a reject file (one JSON object per line, with the file, row number, reason and values) and
+counted, and reading continues with the next row. Only file-level problems, such as a missing required
+column, still raise `ValueError`.
+
+The valid rows are handed to the rendering stage in fixed-size batches by `parallel.ordered_map`.
+"""
+
+import os
+import csv
+import json
+from collections import Counter
+
+from dataset_cache import read_table
+
+
+REJECTS_SUFFIX = ".rejects.jsonl"
+
+
+class RejectLog:
+    """
+    Counts rejected rows by reason and, when `path` is given, writes each of them to `path` as a JSON line.
+
+    Rows are written to a temporary file that replaces `path` on `close()`, so the reject file always
+    matches the last completed run: it is removed when no row was rejected, and left untouched when the
+    log is discarded (e.g. because the output was up to date or the run failed). Used as a context manager,
+    the log is closed when the block completes and discarded when it raises.
+
+    Args:
+        path (str): Optional. Path of the reject file.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.counts = Counter()
+        self._stream = None
+        self._discarded = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, source: str, row_number: int, reason: str, values=None):
+        """
+        Records a rejected row.
+
+        Args:
+            source (str): File the row was read from.
+            row_number (int): 1-based number of the row among the file's data rows.
+            reason (str): Why the row was rejected.
+            values: Optional. The row's values, as read.
+        """
+        self.counts[reason] += 1
+        if self.path is None:
+            return
+        if self._stream is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._stream = open(self.path + ".tmp", "w", encoding="utf-8")
+        # ensure_ascii keeps undecodable bytes (held as surrogates) writable, as \udcXX escapes
+        self._stream.write(json.dumps({"file": source, "row": row_number, "reason": reason, "values": values}) + "\n")
+
+    def close(self):
+        if self.path is None or self._discarded:
+            return
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            os.replace(self.path + ".tmp", self.path)
+        elif os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def discard(self):
+        self._discarded = True
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            os.remove(self.path + ".tmp")
+
+    def report(self, title: str):
+        if not self.total:
+            return
+        reasons = ", ".join(f"{count} {reason}" for reason, count in self.counts.most_common())
+        location = f"; see {self.path}" if self.path else ""
+        print(f"Rejected {self.total} rows of {title} ({reasons}){location}")
+
+
+def _is_valid_utf8(value: str) -> bool:
+    # Undecodable bytes are kept as lone surrogates by the 'surrogateescape' error handler
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _column_indices(fieldnames: list, columns: tuple, path: str) -> list:
+    field_mapping = {name.lower(): i for i, name in enumerate(fieldnames) if name is not None}
+    missing = [column for column in columns if column not in field_mapping]
+    if missing:
+        raise ValueError(f"{path} must contain {', '.join(repr(column) for column in columns)} columns.")
+    return [field_mapping[column] for column in columns]
+
+
+def _check(values: tuple, columns: tuple):
+    """
+    Returns why a row's required values cannot be used, or None if they can.
+    """
+    for column, value in zip(columns, values):
+        if not value:
+            return f"missing {column}"
+        if not value.isascii() and not _is_valid_utf8(value):
+            return "invalid utf-8"
+    return None
+
+
+def table_records(table, path: str, columns: tuple, rejects: RejectLog):
+    """
+    Yields a tuple of the `columns` values for every valid row of a parsed `dataset_cache.Table`.
+    """
+    indices = _column_indices(table.fieldnames, columns, path)
+    malformed = (None,) * len(table.fieldnames)
+    for row_number, row in enumerate(zip(*(table.columns[name] for name in table.fieldnames)), start=1):
+        values = tuple(row[i] for i in indices)
+        if row == malformed:
+            reason = "malformed row"
+        elif None in values:
+            reason = "missing fields"
+        else:
+            reason = _check(values, columns)
+        if reason is None:
+            yield values
+        else:
+            rejects.add(path, row_number, reason, list(row))
+
+
+def iter_records(path: str, delimiter: str, columns: tuple, rejects: RejectLog, use_cache: bool = False):
+    """
+    Streams a CSV/TSV file and yields a tuple of the `columns` values for every valid row.
+
+    Column names are matched case-insensitively (`Tweet` or `tweet`). Invalid rows go to `rejects`.
+
+    Args:
+        path (str): Path of the dataset file.
+        delimiter (str): Field delimiter ("," or "\\t").
+        columns (tuple): Lower-case names of the required columns, e.g. `("tweet", "target")`.
+        rejects (RejectLog): Receives the rejected rows.
+        use_cache (bool): Whether to read the file through the parsed-dataset cache instead of streaming it.
+    """
+    if use_cache:
+        yield from table_records(read_table(path, delimiter, "utf-8"), path, columns, rejects)
+        return
+
+    with open(path, newline="", encoding="utf-8", errors="surrogateescape") as csvfile:
+        reader = csv.reader(csvfile, delimiter=delimiter)
+        indices = _column_indices(next(reader, []), columns, path)
+        width = max(indices) + 1
+
+        row_number = 0
+        while True:
+            line_number = reader.line_num
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as error:
+                row_number += 1
+                rejects.add(path, row_number, "malformed row", str(error))
+                if reader.line_num == line_number:
+                    # The parser cannot move past this point; the rest of the file is unreadable
+                    break
+                continue
+
+            if not row:
+                # Blank lines are not rows, as with `csv.DictReader`
+                continue
+            row_number += 1
+            if len(row) < width:
+                rejects.add(path, row_number, "missing fields", row)
+                continue
+            values = tuple(row[i] for i in indices)
+            reason = _check(values, columns)
+            if reason is None:
+                yield values
+            else:
+                rejects.add(path, row_number, reason, row)
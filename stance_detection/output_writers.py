@@ -0,0 +1,593 @@
+"""
+Streaming writers for generated prompt files.
+
+Rows are written as soon as they are rendered, so memory use stays flat no matter
+how large the input is. Six layouts are supported:
+
+    - `json`:     a single JSON array, formatted exactly like `json.dump(..., indent=4)`.
+    - `json_min`: a single JSON array without indentation or spaces.
+    - `jsonl`:    one compact JSON object per line, readable while the file is still being written.
+    - `compact`:  a deduplicated JSON document that stores repeated metadata and prompt text once
+                  (see `compact_output.py`). It is written when the file is closed.
+    - `parquet`:  a Parquet table with one column per row field, written in row groups of
+                  `PARQUET_ROW_GROUP_SIZE` rows. Requires pyarrow.
+    - `msgpack`:  one MessagePack map per row, back to back. Requires msgpack.
+
+All layouts but `parquet` can optionally be compressed with gzip or zstd; Parquet files compress
+their column chunks with the same codec instead (snappy when no compression is given). Uncompressed
+`jsonl` files can also get a sidecar index, `<file>.idx`, holding the byte offset of every row; see
+`prompt_index.py` for the memory-mapped reader.
+
+The compact JSON of `json_min` and `jsonl` rows is produced by one of `JSON_ENCODERS`: the standard
+library, orjson or msgspec. "auto" picks the fastest one installed. All of them write the same text for
+the strings, integers, booleans and lists of generated rows, so the choice only affects speed. The
+indented `json` layout is always written by the standard library, to keep its exact formatting.
+
+`read_rows` reads any of the layouts back.
+
+Only a completed output replaces an existing file: every layout but `jsonl` is written to `<file>.tmp` and
+moved into place when the writer closes without error. `jsonl` files are written in place so that they can be
+read while they grow, as are outputs that are checkpointed for resuming (see `checkpoints.py`); if the run
+fails, they are left as written, without being finalized.
+"""
+
+import io
+import os
+import sys
+import gzip
+import functools
+import json
+from array import array
+
+
+OUTPUT_FORMATS = ("json", "json_min", "jsonl", "compact", "parquet", "msgpack")
+COMPRESSIONS = ("gzip", "zstd")
+JSON_ENCODERS = ("auto", "json", "orjson", "msgspec")
+
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 10000
+
+# Sidecar offset index: 8-byte magic, then `count + 1` little-endian uint64 byte offsets (row i spans offsets[i]:offsets[i + 1]).
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"SPIDX\x00\x01\x00"
+
+_FORMAT_EXTENSIONS = {
+    "json": ".json",
+    "json_min": ".min.json",
+    "jsonl": ".jsonl",
+    "compact": ".compact.json",
+    "parquet": ".parquet",
+    "msgpack": ".msgpack",
+}
+
+_COMPRESSION_SUFFIXES = {
+    None: "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+
+def output_filename(base_name: str, output_format: str = "json", compression: str = None) -> str:
+    """
+    Appends the extension matching the output format and compression to a base file name.
+
+    Args:
+        base_name (str): File name without extension (e.g., "output/zero_shot/PStance_qwen2_bernie_prompts").
+        output_format (str): One of `OUTPUT_FORMATS`.
+        compression (str): Optional. One of `COMPRESSIONS`.
+
+    Returns:
+        str: The full file name (e.g., "PStance_qwen2_bernie_prompts.jsonl.gz"). Compact files end in `.compact.json`.
+            Parquet files are compressed internally and always end in `.parquet`.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{output_format}'. Choose one of: {', '.join(OUTPUT_FORMATS)}.")
+    if compression not in _COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unsupported compression '{compression}'. Choose one of: {', '.join(COMPRESSIONS)}.")
+
+    if output_format == "parquet":
+        return f"{base_name}{_FORMAT_EXTENSIONS[output_format]}"
+    return f"{base_name}{_FORMAT_EXTENSIONS[output_format]}{_COMPRESSION_SUFFIXES[compression]}"
+
+
+def open_text_output(path: str, compression: str = None):
+    """
+    Opens a UTF-8 text stream for writing, optionally compressed.
+    """
+    if compression is None:
+        return open(path, "w", encoding="utf-8", newline="")
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the 'zstandard' package (pip install zstandard).")
+        return zstandard.open(path, "wt", encoding="utf-8", newline="")
+
+    raise ValueError(f"Unsupported compression '{compression}'. Choose one of: {', '.join(COMPRESSIONS)}.")
+
+
+def open_text_input(path: str, compression: str = None):
+    """
+    Opens a UTF-8 text stream for reading a generated file, optionally compressed.
+    """
+    if compression is None:
+        return open(path, encoding="utf-8", newline="")
+    if compression == "gzip":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the 'zstandard' package (pip install zstandard).")
+        return zstandard.open(path, "rt", encoding="utf-8", newline="")
+
+    raise ValueError(f"Unsupported compression '{compression}'. Choose one of: {', '.join(COMPRESSIONS)}.")
+
+
+def open_binary_output(path: str, compression: str = None):
+    """
+    Opens a binary stream for writing, optionally compressed.
+    """
+    if compression is None:
+        return open(path, "wb")
+    if compression == "gzip":
+        return gzip.open(path, "wb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the 'zstandard' package (pip install zstandard).")
+        return zstandard.open(path, "wb")
+
+    raise ValueError(f"Unsupported compression '{compression}'. Choose one of: {', '.join(COMPRESSIONS)}.")
+
+
+def open_binary_input(path: str, compression: str = None):
+    """
+    Opens a binary stream for reading a generated file, optionally compressed.
+    """
+    if compression is None:
+        return open(path, "rb")
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the 'zstandard' package (pip install zstandard).")
+        return zstandard.open(path, "rb")
+
+    raise ValueError(f"Unsupported compression '{compression}'. Choose one of: {', '.join(COMPRESSIONS)}.")
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("The 'msgpack' output format requires the 'msgpack' package (pip install msgpack).")
+    return msgpack
+
+
+def _parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("The 'parquet' output format requires the 'pyarrow' package (pip install pyarrow).")
+    return pyarrow
+
+
+def _stdlib_json_encoder(row: dict) -> str:
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":"))
+
+
+def _orjson_encoder():
+    import orjson
+    dumps = orjson.dumps
+    return lambda row: dumps(row).decode("utf-8")
+
+
+def _msgspec_encoder():
+    import msgspec
+    encode = msgspec.json.Encoder().encode
+    return lambda row: encode(row).decode("utf-8")
+
+
+_ENCODER_FACTORIES = {
+    "json": lambda: _stdlib_json_encoder,
+    "orjson": _orjson_encoder,
+    "msgspec": _msgspec_encoder,
+}
+
+# Compact JSON encoder per name, created once per process
+_JSON_ENCODERS = {}
+
+
+def resolve_json_encoder(name: str = "auto") -> str:
+    """
+    Returns the name of the JSON encoder to use: `name` itself if it is installed, or for "auto", the first
+    of orjson, msgspec and the standard library that is installed.
+    """
+    if name not in JSON_ENCODERS:
+        raise ValueError(f"Unsupported JSON encoder '{name}'. Choose one of: {', '.join(JSON_ENCODERS)}.")
+    for candidate in (("orjson", "msgspec", "json") if name == "auto" else (name,)):
+        try:
+            if candidate not in _JSON_ENCODERS:
+                _JSON_ENCODERS[candidate] = _ENCODER_FACTORIES[candidate]()
+            return candidate
+        except ImportError:
+            if name != "auto":
+                raise ValueError(f"The '{name}' JSON encoder requires the '{name}' package (pip install {name}).")
+
+
+def json_encoder(name: str = "auto"):
+    """
+    Returns a function that serializes a row as compact JSON text, without spaces and with non-ASCII
+    characters written as is, using the encoder `name` (one of `JSON_ENCODERS`).
+    """
+    return _JSON_ENCODERS[resolve_json_encoder(name)]
+
+
+def serialize_row(output_format: str, row: dict, encoder: str = "auto"):
+    """
+    Serializes a single row the way the writer for `output_format` lays it out on disk.
+
+    This is a module-level function so that worker processes can serialize rows in
+    parallel and hand the finished text to `PromptWriter.write_serialized`. The `compact` and
+    `parquet` layouts store rows by column, so their rows are passed on unchanged, and `msgpack`
+    rows are serialized to bytes. `encoder` is the JSON encoder of the `json_min` and `jsonl` layouts.
+    """
+    if output_format in ("compact", "parquet"):
+        return row
+    if output_format == "jsonl":
+        return json_encoder(encoder)(row) + "\n"
+    if output_format == "json_min":
+        return json_encoder(encoder)(row)
+    if output_format == "msgpack":
+        return _msgpack().packb(row, use_bin_type=True)
+    return json.dumps(row, indent=4, ensure_ascii=False).replace("\n", "\n    ")
+
+
+class JsonArrayWriter:
+    """
+    Writes rows as one JSON array, byte-identical to `json.dump(rows, f, indent=4, ensure_ascii=False)`,
+    or with `indent=False`, to `json.dump(rows, f, ensure_ascii=False, separators=(",", ":"))`.
+    """
+
+    def __init__(self, stream, indent: bool = True, encoder: str = "json"):
+        self.stream = stream
+        self.indent = indent
+        self.encoder = encoder
+        self.count = 0
+
+    def write(self, row: dict):
+        self.write_serialized(serialize_row("json" if self.indent else "json_min", row, self.encoder))
+
+    def write_serialized(self, item: str):
+        if self.indent:
+            self.stream.write(("[\n    " if self.count == 0 else ",\n    ") + item)
+        else:
+            self.stream.write(("[" if self.count == 0 else ",") + item)
+        self.count += 1
+
+    def close(self):
+        if self.indent:
+            self.stream.write("[]" if self.count == 0 else "\n]")
+        else:
+            self.stream.write("[]" if self.count == 0 else "]")
+        self.stream.close()
+
+    def discard(self):
+        self.stream.close()
+
+
+class JsonLinesWriter:
+    """
+    Writes rows as compact JSON lines, flushing every `flush_every` rows so that
+    readers can consume the file while it is being written.
+    """
+
+    def __init__(self, stream, flush_every: int = 1000, encoder: str = "auto"):
+        self.stream = stream
+        self.flush_every = flush_every
+        self.encoder = encoder
+        self.count = 0
+
+    def write(self, row: dict):
+        self.write_serialized(serialize_row("jsonl", row, self.encoder))
+
+    def write_serialized(self, line: str):
+        self.stream.write(line)
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+    def discard(self):
+        self.stream.close()
+
+
+class IndexedJsonLinesWriter:
+    """
+    Writes rows as compact JSON lines to an uncompressed file and records the byte offset of each row.
+
+    The offsets are written to `<path>.idx` when the writer is closed, replacing any previous index only
+    once it is complete.
+    """
+
+    def __init__(self, path: str, flush_every: int = 1000, encoder: str = "auto"):
+        self.path = path
+        self.stream = open(path, "wb")
+        self.flush_every = flush_every
+        self.encoder = encoder
+        self.offsets = array("Q", [0])
+        self.count = 0
+
+    def write(self, row: dict):
+        self.write_serialized(serialize_row("jsonl", row, self.encoder))
+
+    def write_serialized(self, line: str):
+        data = line.encode("utf-8")
+        self.stream.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+        offsets = self.offsets
+        if sys.byteorder != "little":
+            offsets = array("Q", offsets)
+            offsets.byteswap()
+        temporary_path = self.path + INDEX_SUFFIX + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(INDEX_MAGIC)
+            offsets.tofile(f)
+        os.replace(temporary_path, self.path + INDEX_SUFFIX)
+
+    def discard(self):
+        # The previous index no longer matches the file
+        self.stream.close()
+        if os.path.isfile(self.path + INDEX_SUFFIX):
+            os.remove(self.path + INDEX_SUFFIX)
+
+
+class MessagePackWriter:
+    """
+    Writes rows as consecutive MessagePack maps to a binary stream.
+    """
+
+    def __init__(self, stream, flush_every: int = 1000):
+        self.stream = stream
+        self.flush_every = flush_every
+        self.count = 0
+
+    def write(self, row: dict):
+        self.write_serialized(serialize_row("msgpack", row))
+
+    def write_serialized(self, data: bytes):
+        self.stream.write(data)
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+    def discard(self):
+        self.stream.close()
+
+
+class ParquetRowWriter:
+    """
+    Writes rows to a Parquet file, one row group per `row_group_size` rows.
+
+    The schema is inferred from the first row group; the rows of a run all have the same fields.
+    `compression` is the codec of the column chunks ("gzip" or "zstd"; snappy when None).
+    """
+
+    def __init__(self, path: str, compression: str = None, row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        self.pyarrow = _parquet()
+        self.path = path
+        self.compression = compression or "snappy"
+        self.row_group_size = row_group_size
+        self.count = 0
+        self._rows = []
+        self._writer = None
+
+    def write(self, row: dict):
+        self.write_serialized(row)
+
+    def write_serialized(self, row: dict):
+        self._rows.append(row)
+        self.count += 1
+        if len(self._rows) == self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        pyarrow = self.pyarrow
+        schema = self._writer.schema if self._writer is not None else None
+        table = pyarrow.Table.from_pylist(self._rows, schema=schema)
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, table.schema, compression=self.compression)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        if self._writer is None:
+            self.pyarrow.parquet.write_table(self.pyarrow.table({}), self.path, compression=self.compression)
+        else:
+            self._writer.close()
+
+    def discard(self):
+        self._rows = []
+        if self._writer is not None:
+            self._writer.close()
+
+
+def read_rows(path: str, output_format: str, compression: str = None):
+    """
+    Reads back the rows of a generated file, in order, as dicts with the fields that were written.
+
+    Args:
+        path (str): Path of the file.
+        output_format (str): Its format (one of `OUTPUT_FORMATS`).
+        compression (str): Optional. Its compression ("gzip" or "zstd"). Ignored for Parquet files.
+
+    Yields:
+        dict: The rows of the file.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{output_format}'. Choose one of: {', '.join(OUTPUT_FORMATS)}.")
+    if output_format == "compact":
+        from compact_output import CompactPromptFile
+        yield from CompactPromptFile(path, compression)
+    elif output_format == "parquet":
+        parquet_file = _parquet().parquet.ParquetFile(path)
+        for batch in parquet_file.iter_batches():
+            yield from batch.to_pylist()
+    elif output_format == "msgpack":
+        with open_binary_input(path, compression) as f:
+            yield from _msgpack().Unpacker(f, raw=False)
+    else:
+        with open_text_input(path, compression) as f:
+            if output_format == "jsonl":
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from json.load(f)
+
+
+class PromptWriter:
+    """
+    Context manager that streams prompt rows to `path` in the requested format.
+
+    With `index=True`, an uncompressed `jsonl` output also gets a `<path>.idx` byte-offset index.
+    `json_encoder` (one of `JSON_ENCODERS`) encodes the rows of the `json_min` and `jsonl` layouts; the
+    indented `json` layout only supports the standard library encoder, which "auto" falls back to.
+
+    `resume=(rows, offset)` continues an uncompressed `json`, `json_min`, `jsonl` or `msgpack` output that
+    holds `rows` rows in its first `offset` bytes, as recorded by `checkpoint` (see `checkpoints.py`); anything
+    after `offset` is discarded.
+
+    Outputs other than `jsonl` are written to `<path>.tmp` and replace `path` only when the writer closes without
+    error. With `in_place=True` (for checkpointed runs) or `resume`, they are written to `path` directly.
+
+    Example:
+        with PromptWriter("out.jsonl.gz", "jsonl", "gzip") as writer:
+            for row in rows:
+                writer.write(row)
+    """
+
+    def __init__(self, path: str, output_format: str = "json", compression: str = None, index: bool = False,
+                 json_encoder: str = "auto", resume: tuple = None, in_place: bool = False):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format '{output_format}'. Choose one of: {', '.join(OUTPUT_FORMATS)}.")
+        if index and (output_format != "jsonl" or compression is not None):
+            raise ValueError("An offset index requires the uncompressed 'jsonl' output format.")
+        if json_encoder not in JSON_ENCODERS:
+            raise ValueError(f"Unsupported JSON encoder '{json_encoder}'. Choose one of: {', '.join(JSON_ENCODERS)}.")
+        if output_format == "json" and json_encoder not in ("auto", "json"):
+            raise ValueError(f"The indented 'json' layout is written with the standard library; use 'json_min' or "
+                             f"'jsonl' with the '{json_encoder}' encoder.")
+        if resume and (output_format in ("compact", "parquet") or compression is not None or index):
+            raise ValueError("Only uncompressed json, json_min, jsonl and msgpack outputs can be resumed.")
+        if output_format == "parquet":
+            _parquet()
+        elif output_format == "msgpack":
+            _msgpack()
+
+        self.path = path
+        self.output_format = output_format
+        self.compression = compression
+        self.index = index
+        self.resume = resume
+        in_place = in_place or bool(resume) or output_format == "jsonl"
+        self.write_path = path if in_place else path + ".tmp"
+        # Resolved once, so that worker processes use the same encoder as this process
+        self.json_encoder = resolve_json_encoder(json_encoder) if output_format in ("json_min", "jsonl") else "json"
+        self._writer = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self.index:
+            self._writer = IndexedJsonLinesWriter(self.write_path, encoder=self.json_encoder)
+            return self
+        if self.output_format == "compact":
+            from compact_output import CompactWriter
+            self._writer = CompactWriter(self.write_path, self.compression)
+            return self
+        if self.output_format == "parquet":
+            self._writer = ParquetRowWriter(self.write_path, self.compression)
+            return self
+        if self.resume:
+            rows, offset = self.resume
+            raw = open(self.write_path, "r+b")
+            raw.truncate(offset)
+            raw.seek(offset)
+            stream = raw if self.output_format == "msgpack" else io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        elif self.output_format == "msgpack":
+            stream = open_binary_output(self.write_path, self.compression)
+        else:
+            stream = open_text_output(self.write_path, self.compression)
+        if self.output_format == "msgpack":
+            self._writer = MessagePackWriter(stream)
+        elif self.output_format == "jsonl":
+            self._writer = JsonLinesWriter(stream, encoder=self.json_encoder)
+        else:
+            self._writer = JsonArrayWriter(stream, indent=self.output_format == "json", encoder=self.json_encoder)
+        if self.resume:
+            self._writer.count = rows
+        return self
+
+    def write(self, row: dict):
+        self._writer.write(row)
+
+    def write_serialized(self, text):
+        """
+        Writes a row that was already serialized with `self.serialize`.
+        """
+        self._writer.write_serialized(text)
+
+    @property
+    def serialize(self):
+        """
+        Picklable callable that serializes a row for this writer's format and JSON encoder.
+        """
+        return functools.partial(serialize_row, self.output_format, encoder=self.json_encoder)
+
+    @property
+    def count(self) -> int:
+        return self._writer.count if self._writer else 0
+
+    def checkpoint(self) -> int:
+        """
+        Flushes the rows written so far to disk and returns the size of the output in bytes. Only meaningful for
+        the layouts that can be resumed.
+        """
+        stream = self._writer.stream
+        stream.flush()
+        raw = getattr(stream, "buffer", stream)
+        os.fsync(raw.fileno())
+        return raw.tell()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # A failed run is not finalized, and does not replace a previous output
+            self._writer.discard()
+            if self.write_path != self.path and os.path.isfile(self.write_path):
+                os.remove(self.write_path)
+            return False
+        self._writer.close()
+        if self.write_path != self.path:
+            os.replace(self.write_path, self.path)
+        return False
@@ -0,0 +1,229 @@
+"""
+Order-preserving multi-process rendering for the prompt generators.
+
+Input rows are split into fixed-size chunks and rendered by a process pool. Results
+are yielded back in input order, so the output of a run with `workers > 1` is
+byte-identical to a single-process run. Only a bounded number of chunks is in flight
+at any time, which keeps memory flat on large inputs.
+"""
+
+import os
+import time
+import multiprocessing
+from collections import deque
+
+from template_compiler import ExamplePool, ExampleSetPool, compile_template
+from tokenization import fit_to_budget
+from tokenized_output import split_prefix
+
+
+# Function applied to every chunk in a worker process, set once per worker by `_init_worker`.
+_WORKER_FUNCTION = None
+
+# Seconds spent per stage ("render", "serialize") by `render_rows` in this process since the last chunk finished.
+_STAGE_SECONDS = {}
+
+
+def _init_worker(function):
+    global _WORKER_FUNCTION
+    _WORKER_FUNCTION = function
+
+
+def _add_stage_seconds(name: str, seconds: float):
+    _STAGE_SECONDS[name] = _STAGE_SECONDS.get(name, 0.0) + seconds
+
+
+def _take_stage_seconds() -> dict:
+    stages = dict(_STAGE_SECONDS)
+    _STAGE_SECONDS.clear()
+    return stages
+
+
+def _run_chunk(chunk: list):
+    start = time.perf_counter()
+    results = _WORKER_FUNCTION(chunk)
+    return os.getpid(), results, time.perf_counter() - start, _take_stage_seconds()
+
+
+def render_rows(template, metadata: dict, serialize, include_shared_prefix: bool, token_counter, max_tokens: int,
+                items: list, token_encoder=None, indexed: bool = False) -> list:
+    """
+    Renders a chunk of (tweet, target) pairs and serializes each with the row metadata.
+
+    Args:
+        template (CompiledTemplate | ExamplePool | ExampleSetPool): Compiled template used for every row, or an
+            example pool when each row has its own few-shot example set.
+        metadata (dict): Constant row fields (dataset, model, candidate).
+        serialize (callable): Row serializer, e.g. `PromptWriter.serialize`.
+        include_shared_prefix (bool): Whether to add the prompt text shared by all rows with the same target.
+        token_counter (TokenCounter): Optional. Records `prompt_tokens` for each row, tokenizing the chunk in one batch.
+        max_tokens (int): Optional. Token budget; requires `token_counter`. Rows over budget are reduced
+            with `tokenization.fit_to_budget` and record `examples_used` (few-shot) and `tweet_truncated`.
+        items (list): The `(tweet, target)` pairs to render, `(tweet, target, example_ids)` with an example pool,
+            or `(tweet, target, set_id)` with an example set pool. Rows with their own example set record
+            `example_ids`, and `example_set` with an example set pool.
+        token_encoder (TokenCounter): Optional. Tokenizes every prompt for a `tokenized_output.TokenizedWriter`.
+            When it is also the `token_counter`, prompts are tokenized once for both.
+        indexed (bool): Whether `items` are `(row_index, item)` pairs, as returned by `prompt_ordering.order_items`.
+            Rows then record their `row_index` (default is False).
+
+    Returns:
+        list: `(serialized_row, token_info)` pairs, ready for `PromptWriter.write_serialized`.
+            `token_info` is None unless tokens are counted, otherwise `(prompt_tokens, examples_reduced, tweet_truncated)`.
+            With a `token_encoder`, `(serialized_row, token_info, row_tokens)` triples, where `row_tokens` is the
+            `(prefix, suffix_ids)` pair of `tokenized_output.split_prefix`.
+    """
+    start = time.perf_counter()
+    if indexed:
+        row_indices = [pair[0] for pair in items]
+        items = [pair[1] for pair in items]
+    set_pool = isinstance(template, ExampleSetPool)
+    if set_pool or isinstance(template, ExamplePool):
+        row_templates = [template.compiled(item[2]) for item in items]
+        prompts = [row_template.render(item[0], item[1]) for row_template, item in zip(row_templates, items)]
+    else:
+        row_templates = [template] * len(items)
+        render = template.render
+        prompts = [render(item[0], item[1]) for item in items]
+    encoded = token_encoder.encode(prompts) if token_encoder is not None else None
+    if token_counter is None:
+        token_counts = None
+    elif token_counter is token_encoder:
+        token_counts = [len(ids) for ids in encoded]
+    else:
+        token_counts = token_counter.count(prompts)
+
+    # Reduce over-budget prompts in one batched pass per template
+    fitted = {}
+    if max_tokens and token_counts is not None:
+        over_budget = {}
+        for index, tokens in enumerate(token_counts):
+            if tokens > max_tokens:
+                over_budget.setdefault(id(row_templates[index]), []).append(index)
+        for indices in over_budget.values():
+            reduced = fit_to_budget(row_templates[indices[0]], [items[index][:2] for index in indices], token_counter, max_tokens)
+            fitted.update(zip(indices, reduced))
+        if encoded is not None and fitted:
+            for index, ids in zip(fitted, token_encoder.encode([fitted[index][0] for index in fitted])):
+                encoded[index] = ids
+
+    rendered = time.perf_counter()
+    _add_stage_seconds("render", rendered - start)
+    results = []
+    for index, item in enumerate(items):
+        tweet, target = item[0], item[1]
+        row_template = row_templates[index]
+        row = {
+            **metadata,
+            "tweet": tweet,
+            "target": target,
+            "prompt": prompts[index],
+        }
+        if indexed:
+            row["row_index"] = row_indices[index]
+        if set_pool:
+            row["example_set"] = item[2]
+            row["example_ids"] = list(template.example_sets[item[2]])
+        elif len(item) > 2:
+            row["example_ids"] = list(item[2])
+        if include_shared_prefix:
+            row["shared_prefix"] = row_template.prefix_for(target)
+
+        token_info = None
+        if token_counts is not None:
+            examples_count = len(row_template.examples) if row_template.examples is not None else None
+            tokens, examples_used, tweet_truncated = token_counts[index], examples_count, False
+            if index in fitted:
+                row["prompt"], tokens, examples_used, tweet_truncated = fitted[index]
+            row["prompt_tokens"] = tokens
+            if max_tokens:
+                if examples_count is not None:
+                    row["examples_used"] = examples_used
+                row["tweet_truncated"] = tweet_truncated
+            token_info = (tokens, examples_used != examples_count, tweet_truncated)
+
+        if encoded is not None:
+            prefix_template = row_template
+            if index in fitted and row_template.examples is not None and fitted[index][2] != len(row_template.examples):
+                # The prompt was rendered with fewer examples, so it starts with that template's prefix
+                prefix_template = compile_template(row_template.template, row_template.examples[:fitted[index][2]])
+            row_tokens = split_prefix(token_encoder, prefix_template.prefix_for(target), encoded[index])
+            results.append((serialize(row), token_info, row_tokens))
+        else:
+            results.append((serialize(row), token_info))
+    _add_stage_seconds("serialize", time.perf_counter() - rendered)
+    return results
+
+
+class WorkerStats:
+    """
+    Rows processed and busy time per worker process, and the busy time of all workers per stage.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.seconds = {}
+        self.stages = {}
+
+    def add(self, pid: int, rows: int, seconds: float, stages: dict = None):
+        self.rows[pid] = self.rows.get(pid, 0) + rows
+        self.seconds[pid] = self.seconds.get(pid, 0.0) + seconds
+        for name, stage_seconds in (stages or {}).items():
+            self.stages[name] = self.stages.get(name, 0.0) + stage_seconds
+
+    def report(self):
+        for index, pid in enumerate(sorted(self.rows)):
+            rows, seconds = self.rows[pid], self.seconds[pid]
+            rate = rows / seconds if seconds > 0 else float("inf")
+            print(f"Worker {index} (pid {pid}): {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/sec)")
+
+
+def _chunks(items, chunk_size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ordered_map(function, items, workers: int = 1, chunk_size: int = 1000, stats: WorkerStats = None):
+    """
+    Splits `items` into chunks, applies `function` to each chunk and yields the results in input order.
+
+    Args:
+        function (callable): Picklable function (module-level or `functools.partial` of one) that
+            takes a list of items and returns a list with one result per item.
+        items (iterable): Items to process. Consumed lazily.
+        workers (int): Number of worker processes. With 1 (default), chunks are processed in-process.
+        chunk_size (int): Number of items sent to a worker at a time.
+        stats (WorkerStats): Optional. Collects rows and busy time per worker.
+    """
+    if workers <= 1:
+        for chunk in _chunks(items, chunk_size):
+            start = time.perf_counter()
+            results = function(chunk)
+            stages = _take_stage_seconds()
+            if stats is not None:
+                stats.add(os.getpid(), len(chunk), time.perf_counter() - start, stages)
+            yield from results
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(function,)) as pool:
+        pending = deque()
+        for chunk in _chunks(items, chunk_size):
+            pending.append(pool.apply_async(_run_chunk, (chunk,)))
+            # Keep a bounded number of chunks in flight so memory does not grow with the input
+            if len(pending) >= 2 * workers:
+                yield from _collect(pending.popleft(), stats)
+        while pending:
+            yield from _collect(pending.popleft(), stats)
+
+
+def _collect(async_result, stats: WorkerStats):
+    pid, results, seconds, stages = async_result.get()
+    if stats is not None:
+        stats.add(pid, len(results), seconds, stages)
+    return results
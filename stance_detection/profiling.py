@@ -0,0 +1,248 @@
+"""
+Stage timing and profiling of generator runs.
+
+`RunProfile` splits the wall-clock time of a run into stages:
+
+    - `setup`:     template lookup, tokenizer loading, dataset file discovery, the incremental check and
+                   other bookkeeping outside the stages below.
+    - `read`:      reading and validating dataset rows.
+    - `sample`:    choosing few-shot examples (label buckets, draws, similarity lookups).
+    - `order`:     reordering the rows for batched inference (`--order`).
+    - `render`:    rendering prompts, including token counting and budget fitting.
+    - `serialize`: building the output rows and serializing them to text.
+    - `write`:     writing the serialized rows and closing the output file.
+
+The pipeline is lazy, so the stages interleave: rows are read while earlier batches are being rendered
+and written. Time is therefore attributed exclusively, to the innermost stage running at any moment
+(`timed` wraps an iterator so that the time spent producing each item counts towards its stage). With
+`workers > 1`, `render` is the time the main process waits for the workers, and the rendering and
+serialization time spent inside the workers is reported separately as `worker_seconds`.
+
+Peak memory is the peak resident set size of the process (and of its worker processes), where the
+platform reports it. Optionally, a cProfile dump of the main process and a tracemalloc report of its
+largest allocation sites can be written.
+"""
+
+import os
+import sys
+import time
+import contextlib
+
+
+STAGES = ("setup", "read", "sample", "order", "render", "serialize", "write")
+
+# Number of allocation sites listed in the tracemalloc report
+REPORT_LINES = 25
+
+
+def peak_memory_mb(children: bool = False) -> float:
+    """
+    Returns the peak resident set size of this process (or of its finished child processes) in MiB,
+    or None where the platform does not report it.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class RunProfile:
+    """
+    Collects the stage timings, row counts and peak memory of one generator run.
+
+    A disabled profile costs nothing: `stage` and `timed` then do no timing at all.
+
+    Args:
+        enabled (bool): Whether to time the run (default is True).
+        stats_path (str): Optional. Path of a cProfile dump of the run (readable with `pstats` or snakeviz).
+        allocations_path (str): Optional. Path of a text report of the largest allocation sites, from tracemalloc.
+            Tracing allocations slows the run down considerably.
+    """
+
+    def __init__(self, enabled: bool = True, stats_path: str = None, allocations_path: str = None):
+        self.enabled = enabled or stats_path is not None or allocations_path is not None
+        self.stats_path = stats_path
+        self.allocations_path = allocations_path
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.worker_seconds = {}
+        self.rows = {}
+        self._stack = []
+        self._mark = None
+        self._start = None
+        self._total = None
+        self._profiler = None
+        self._traced_peak = None
+
+    def __bool__(self):
+        return self.enabled
+
+    def start(self):
+        """
+        Starts timing (in the `setup` stage) and, if requested, cProfile and tracemalloc.
+        """
+        if not self.enabled:
+            return
+        if self.allocations_path is not None:
+            import tracemalloc
+            tracemalloc.start()
+        if self.stats_path is not None:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start = self._mark = time.perf_counter()
+        self._stack = ["setup"]
+
+    def _switch(self):
+        # Attributes the time since the last switch to the innermost running stage
+        now = time.perf_counter()
+        if self._stack:
+            self.seconds[self._stack[-1]] += now - self._mark
+        self._mark = now
+
+    def _enter(self, name: str):
+        self._switch()
+        self._stack.append(name)
+
+    def _exit(self):
+        self._switch()
+        self._stack.pop()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Attributes the time spent in the `with` block (outside any nested stage) to `name`.
+        """
+        if not self.enabled:
+            yield
+            return
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def timed(self, name: str, iterable):
+        """
+        Returns `iterable`, with the time spent producing each item attributed to `name`.
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed(name, iter(iterable))
+
+    def _timed(self, name: str, iterator):
+        while True:
+            self._enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            yield item
+
+    def add_worker_stats(self, stats, workers: int):
+        """
+        Splits the rendering time using the per-stage seconds that `parallel.ordered_map` collected per chunk.
+
+        Args:
+            stats (parallel.WorkerStats): Statistics of the run's `ordered_map`.
+            workers (int): Number of worker processes of the run.
+        """
+        if not self.enabled:
+            return
+        if workers <= 1:
+            # Chunks were rendered in this process, inside the `render` stage
+            serialize = min(stats.stages.get("serialize", 0.0), self.seconds["render"])
+            self.seconds["serialize"] += serialize
+            self.seconds["render"] -= serialize
+        else:
+            self.worker_seconds = {name: round(seconds, 6) for name, seconds in sorted(stats.stages.items())}
+
+    def count(self, **rows):
+        """
+        Records row counts, e.g. `profile.count(written=100, rejected=2)`.
+        """
+        self.rows.update(rows)
+
+    def stop(self):
+        """
+        Stops timing and writes the cProfile and tracemalloc outputs, if requested.
+        """
+        if not self.enabled or self._total is not None:
+            return
+        self._switch()
+        self._stack = []
+        self._total = time.perf_counter() - self._start
+
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+            self._profiler.dump_stats(self.stats_path)
+        if self.allocations_path is not None:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            self._traced_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            os.makedirs(os.path.dirname(self.allocations_path) or ".", exist_ok=True)
+            with open(self.allocations_path, "w", encoding="utf-8") as f:
+                f.write(f"Peak traced memory: {self._traced_peak / (1024 * 1024):.1f} MiB\n")
+                f.write("Largest allocation sites still held at the end of the run:\n")
+                for statistic in snapshot.statistics("lineno")[:REPORT_LINES]:
+                    f.write(f"{statistic}\n")
+
+    def summary(self, output_file: str) -> dict:
+        """
+        Returns the profile as a dict: the output file, total and per-stage seconds, row counts and peak memory.
+        """
+        self.stop()
+        summary = {
+            "output_file": output_file,
+            "total_seconds": round(self._total, 6),
+            "stages": {name: round(seconds, 6) for name, seconds in self.seconds.items()},
+            "rows": dict(self.rows),
+            "peak_memory_mb": peak_memory_mb(),
+        }
+        if self.worker_seconds:
+            summary["worker_seconds"] = dict(self.worker_seconds)
+            summary["worker_peak_memory_mb"] = peak_memory_mb(children=True)
+        if self._traced_peak is not None:
+            summary["traced_peak_mb"] = round(self._traced_peak / (1024 * 1024), 1)
+        if self.stats_path is not None:
+            summary["stats_file"] = self.stats_path
+        if self.allocations_path is not None:
+            summary["allocations_file"] = self.allocations_path
+        return summary
+
+    def result(self, output_file: str):
+        """
+        Returns what a profiled generator returns: `output_file`, or the `summary` when the profile is enabled.
+        """
+        return self.summary(output_file) if self.enabled else output_file
+
+    def report(self, output_file: str):
+        """
+        Prints the stage timings, row counts and peak memory of the run, if the profile is enabled.
+        """
+        if not self.enabled:
+            return
+        summary = self.summary(output_file)
+        total = summary["total_seconds"]
+        print(f"Profile of {output_file}: {total:.3f}s")
+        for name, seconds in summary["stages"].items():
+            share = 100 * seconds / total if total > 0 else 0.0
+            print(f"    {name:<10} {seconds:>9.3f}s {share:>6.1f}%")
+        for name, seconds in summary.get("worker_seconds", {}).items():
+            print(f"    {name:<10} {seconds:>9.3f}s in worker processes")
+        if summary["rows"]:
+            print("    rows: " + ", ".join(f"{count} {name}" for name, count in summary["rows"].items()))
+        if summary["peak_memory_mb"] is not None:
+            workers = summary.get("worker_peak_memory_mb")
+            workers = f" (largest worker: {workers} MiB)" if workers is not None else ""
+            print(f"    peak memory: {summary['peak_memory_mb']} MiB{workers}")
+        if "traced_peak_mb" in summary:
+            print(f"    peak traced memory: {summary['traced_peak_mb']} MiB; allocation sites in {self.allocations_path}")
+        if self.stats_path is not None:
+            print(f"    cProfile stats in {self.stats_path} (python -m pstats {self.stats_path})")
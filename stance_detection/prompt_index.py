@@ -0,0 +1,116 @@
+"""
+Random access into indexed JSONL prompt files.
+
+A `jsonl` output written with an index (`--index`) has a sidecar `<file>.idx` holding the byte offset
+of every row (see `output_writers.IndexedJsonLinesWriter`). `IndexedPromptFile` memory-maps both files,
+so fetching row N, or a slice of rows, costs two offset lookups and one JSON parse, without reading the
+rest of the file. The maps are read-only and backed by the page cache, so any number of worker processes
+can open the same file without copying it.
+
+Example:
+    with IndexedPromptFile("output/zero_shot/PStance_qwen2_bernie_prompts.jsonl") as prompts:
+        print(len(prompts), prompts[42]["prompt"])
+        batch = prompts[1000:1064]
+"""
+
+import sys
+import mmap
+import json
+from array import array
+
+from output_writers import INDEX_MAGIC, INDEX_SUFFIX
+
+
+def _map_file(path: str):
+    with open(path, "rb") as f:
+        # mmap cannot map empty files; an empty bytes object behaves the same for reading
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b""
+
+
+class IndexedPromptFile:
+    """
+    Read-only, memory-mapped view of an indexed JSONL prompt file.
+
+    Supports `len()`, indexing with ints (returning a row dict) and slices (returning a list of rows),
+    and iteration.
+
+    Args:
+        path (str): Path of the `.jsonl` file. Its index is read from `<path>.idx`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = _map_file(path)
+        self._index = _map_file(path + INDEX_SUFFIX)
+        if self._index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"{path}{INDEX_SUFFIX} is not a prompt offset index.")
+
+        if sys.byteorder == "little":
+            self._offsets = memoryview(self._index)[len(INDEX_MAGIC):].cast("Q")
+        else:
+            self._offsets = array("Q", self._index[len(INDEX_MAGIC):])
+            self._offsets.byteswap()
+
+        if self._offsets[-1] != len(self._data):
+            self.close()
+            raise ValueError(f"{path}{INDEX_SUFFIX} does not match {path}; regenerate the file with its index.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        # The offset view must be released before its map can be closed
+        offsets = getattr(self, "_offsets", None)
+        if isinstance(offsets, memoryview):
+            offsets.release()
+        self._offsets = None
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _position(self, i: int) -> int:
+        count = len(self)
+        if i < 0:
+            i += count
+        if not 0 <= i < count:
+            raise IndexError("Row index out of range.")
+        return i
+
+    def raw(self, i: int) -> bytes:
+        """
+        Returns the serialized JSON line of row `i`, including its trailing newline.
+        """
+        i = self._position(i)
+        return self._data[self._offsets[i]:self._offsets[i + 1]]
+
+    def raw_slice(self, start: int, stop: int) -> bytes:
+        """
+        Returns rows `start` to `stop` (exclusive) as one contiguous block of JSON lines.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return b""
+        return self._data[self._offsets[start]:self._offsets[stop]]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return [json.loads(line) for line in self.raw_slice(start, stop).splitlines()]
+            return [json.loads(self.raw(i)) for i in range(start, stop, step)]
+        return json.loads(self.raw(key))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield json.loads(self.raw(i))
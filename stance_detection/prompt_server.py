@@ -0,0 +1,350 @@
+"""
+Asyncio prompt-rendering API and a small local HTTP server.
+
+`PromptService` renders prompts for `{tweet, target, dataset, model, shot}` requests with the templates
+in `prompts.py` (or data templates, see `template_registry.py`). Requests submitted concurrently are
+collected into micro-batches: the batching task waits at most `max_wait_ms` for up to `max_batch_size`
+prompts, then renders the whole batch in one pass, in a worker thread, so that loading a dataset or rendering
+a large batch does not hold up other clients. Templates are compiled once, and few-shot example sets
+are drawn once per (dataset, candidate) and kept in memory, so a request only costs a template lookup
+and a join.
+
+Few-shot requests for PStance and twitter_stance_kemlm use the examples of their candidate. The candidate
+is taken from the request's `candidate` field, or inferred from the target (e.g. "Donald Trump" -> "trump").
+
+Example:
+    async with PromptService(data_dir="data", seed=0) as service:
+        prompt = await service.render({"tweet": "...", "target": "Atheism", "dataset": "semeval2016",
+                                       "model": "qwen2", "shot": "few_shot"})
+
+The HTTP server accepts `POST /render` with one request object (answered with `{"prompt": ...}`) or a
+list of them (answered with `{"prompts": [...]}`), and `GET /health`. Connections are kept alive. Invalid
+requests are answered with status 400, and failures of the server itself with status 500.
+
+    python stance_detection/prompt_server.py --port 8080 --preload semeval2016 PStance --seed 0
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from dataset_cache import file_delimiter, read_table
+from dataset_catalog import find_dataset_files, open_catalog
+from ingestion import RejectLog, table_records
+from template_compiler import compile_template
+from template_registry import SHOT_TYPES, get_template
+
+
+REQUIRED_FIELDS = ("tweet", "target", "dataset", "model")
+
+_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+                500: "Internal Server Error"}
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+class PromptService:
+    """
+    Renders prompts for requests submitted from asyncio code, in micro-batches.
+
+    Args:
+        data_dir (str): Directory holding one sub-directory per dataset, used for the few-shot examples.
+        examples_count (int): Number of few-shot examples per prompt (default is 3).
+        seed (int): Optional. Seed of the few-shot example draw, so that restarts serve the same examples.
+        max_batch_size (int): Largest number of prompts rendered in one batch (default is 256).
+        max_wait_ms (float): Longest time the first request of a batch waits for more requests (default is 1ms).
+        use_cache (bool): Whether to read example files through the parsed-dataset cache (default is True).
+    """
+
+    def __init__(self, data_dir: str = "data", examples_count: int = 3, seed: int = None, max_batch_size: int = 256,
+                 max_wait_ms: float = 1.0, use_cache: bool = True):
+        self.data_dir = data_dir
+        self.examples_count = examples_count
+        self.seed = seed
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.use_cache = use_cache
+        self.batches = 0
+        self.prompts = 0
+        self._examples = {}
+        self._templates = {}
+        self._queue = None
+        self._task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def examples_for(self, dataset_name: str, candidate_name: str = None) -> list:
+        """
+        Returns the few-shot examples of a dataset (and candidate), drawing them on first use.
+        """
+        key = (dataset_name, candidate_name)
+        if key not in self._examples:
+            example_files, _ = find_dataset_files(os.path.join(self.data_dir, dataset_name), dataset_name, candidate_name)
+            example_file = example_files[0]
+            table = read_table(example_file, file_delimiter(example_file), use_cache=self.use_cache)
+            # Invalid rows are skipped, as in the few-shot script
+            rows = list(table_records(table, example_file, ("tweet", "target", "stance"), RejectLog()))
+            if len(rows) < self.examples_count:
+                raise ValueError(f"{example_file} must have at least {self.examples_count} rows.")
+
+            selected = random.Random(self.seed).sample(range(len(rows)), self.examples_count)
+            self._examples[key] = [
+                {"tweet": rows[i][0], "target": rows[i][1], "label": rows[i][2]} for i in selected
+            ]
+        return self._examples[key]
+
+    def _candidate(self, request: dict):
+        dataset_name = request["dataset"]
+        candidates = open_catalog(self.data_dir).candidates(dataset_name)
+        if not candidates:
+            return None
+        if request.get("candidate"):
+            return request["candidate"]
+        target = request["target"].lower()
+        for candidate_name in candidates:
+            if candidate_name in target:
+                return candidate_name
+        raise ValueError(f"Cannot infer the candidate of target '{request['target']}'; pass 'candidate' for {dataset_name}.")
+
+    def template_for(self, request: dict):
+        """
+        Returns the compiled template serving a request, compiling it on first use.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("Each request must be a JSON object.")
+        missing = [field for field in REQUIRED_FIELDS if not request.get(field)]
+        if missing:
+            raise ValueError(f"Request is missing {', '.join(missing)}.")
+        shot = request.get("shot", "zero_shot")
+        if shot not in SHOT_TYPES:
+            raise ValueError(f"Unknown shot '{shot}'. Choose one of: {', '.join(SHOT_TYPES)}.")
+
+        candidate_name = self._candidate(request) if shot == "few_shot" else None
+        key = (request["dataset"], request["model"], shot, candidate_name)
+        template = self._templates.get(key)
+        if template is None:
+            prompt_function = get_template(request["dataset"], request["model"], shot)
+            examples = self.examples_for(request["dataset"], candidate_name) if shot == "few_shot" else None
+            template = compile_template(prompt_function, examples)
+            self._templates[key] = template
+        return template
+
+    def preload(self, datasets: list, models: list, shots: tuple = SHOT_TYPES):
+        """
+        Draws the few-shot example sets and compiles the templates of the given datasets and models up front.
+        """
+        for dataset_name in datasets:
+            candidates = open_catalog(self.data_dir).candidates(dataset_name) or [None]
+            for model_name in models:
+                for shot in shots:
+                    for candidate_name in (candidates if shot == "few_shot" else [None]):
+                        self.template_for({
+                            "tweet": "-", "target": "-", "dataset": dataset_name, "model": model_name,
+                            "shot": shot, "candidate": candidate_name,
+                        })
+
+    def render_batch(self, requests: list) -> list:
+        """
+        Renders a list of requests synchronously, in the calling thread.
+        """
+        prompts = []
+        for request in requests:
+            prompts.append(self.template_for(request).render(request["tweet"], request["target"]))
+        return prompts
+
+    def _render_outcomes(self, batch: list) -> list:
+        """
+        Renders each list of requests of a batch, returning `(prompts, error)` per list, so that one failing
+        list does not fail the others. Invalid requests give a ValueError; other errors are returned as raised.
+        """
+        outcomes = []
+        for requests in batch:
+            try:
+                outcomes.append((self.render_batch(requests), None))
+            except (ValueError, KeyError) as error:
+                outcomes.append((None, ValueError(str(error))))
+            except Exception as error:
+                outcomes.append((None, error))
+        return outcomes
+
+    async def render(self, request: dict) -> str:
+        """
+        Renders one request. Concurrent calls are batched together.
+        """
+        return (await self.render_many([request]))[0]
+
+    async def render_many(self, requests: list) -> list:
+        """
+        Renders a list of requests, batched with other concurrent calls.
+        """
+        if self._task is None:
+            raise ValueError("PromptService is not started; use 'async with PromptService(...)' or call start().")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((requests, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                if self._queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                batch.append(item)
+                size += len(item[0])
+
+            self.batches += 1
+            self.prompts += size
+            batch = [(requests, future) for requests, future in batch if not future.done()]
+            # Batches are rendered one at a time, so the template and example caches are only used by one thread
+            outcomes = await loop.run_in_executor(None, self._render_outcomes, [requests for requests, _ in batch])
+            for (_, future), (prompts, error) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(prompts)
+                else:
+                    future.set_exception(error)
+
+
+def _response(status: int, payload: dict, keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {_STATUS_TEXT[status]}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+async def _handle_request(service: PromptService, method: str, path: str, body: bytes):
+    if path == "/health":
+        return 200, {"status": "ok", "batches": service.batches, "prompts": service.prompts}
+    if path != "/render":
+        return 404, {"error": f"Unknown path '{path}'."}
+    if method != "POST":
+        return 405, {"error": "Use POST /render."}
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return 400, {"error": "Request body must be JSON."}
+    try:
+        if isinstance(payload, list):
+            return 200, {"prompts": await service.render_many(payload)}
+        if isinstance(payload, dict):
+            return 200, {"prompt": await service.render(payload)}
+    except ValueError as error:
+        return 400, {"error": str(error)}
+    except Exception as error:
+        return 500, {"error": f"{type(error).__name__}: {error}"}
+    return 400, {"error": "Request body must be a JSON object or a list of objects."}
+
+
+async def _handle_connection(service: PromptService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, version = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            keep_alive = headers.get("connection", "").lower() != "close" and version.strip() == "HTTP/1.1"
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_BYTES:
+                writer.write(_response(413, {"error": "Request body is too large."}, False))
+                break
+            body = await reader.readexactly(length) if length else b""
+
+            status, payload = await _handle_request(service, method, path.split("?", 1)[0], body)
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service: PromptService, host: str = "127.0.0.1", port: int = 8080):
+    """
+    Serves `service` over HTTP until cancelled.
+    """
+    async with service:
+        server = await asyncio.start_server(
+            lambda reader, writer: _handle_connection(service, reader, writer), host, port
+        )
+        print(f"Serving prompts on http://{host}:{port} (POST /render, GET /health)", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Prompts over HTTP")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--data_dir", type=str, default="data", help="Directory holding one sub-directory per dataset")
+    parser.add_argument("--examples_count", type=int, default=3, help="Number of examples to use for few-shot prompts")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the few-shot example draw")
+    parser.add_argument("--preload", type=str, nargs="*", default=[], help="Datasets whose templates and example sets are loaded at startup")
+    parser.add_argument("--preload_models", type=str, nargs="+", default=["qwen2", "llama2", "mistral"], help="Models preloaded for --preload")
+    parser.add_argument("--max_batch_size", type=int, default=256, help="Largest number of prompts rendered in one batch")
+    parser.add_argument("--max_wait_ms", type=float, default=1.0, help="Longest time a request waits for a batch to fill")
+
+    args = parser.parse_args()
+
+    prompt_service = PromptService(
+        data_dir=args.data_dir,
+        examples_count=args.examples_count,
+        seed=args.seed,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+    start = time.perf_counter()
+    prompt_service.preload(args.preload, args.preload_models)
+    if args.preload:
+        print(f"Preloaded {len(args.preload)} datasets in {time.perf_counter() - start:.2f}s")
+    try:
+        asyncio.run(serve(prompt_service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,234 @@
+"""
+Similarity-based few-shot example retrieval.
+
+Example tweets are embedded as TF-IDF weighted, L2-normalised vectors of hashed word unigrams
+and bigrams, and stored as a sparse matrix in `<dataset_dir>/.index/<example_file>.npz`. The
+index is rebuilt automatically when the example file, or the index parameters, change.
+
+Test tweets are vectorised the same way and queried in batches: one sparse matrix product
+gives the cosine similarity of every query to every example, and the top-k examples per query
+are selected with `numpy.argpartition`. By default, only examples with the same target as the
+query are considered.
+
+Requires `numpy` and `scipy`.
+"""
+
+import os
+import re
+import json
+import zlib
+
+
+INDEX_DIRNAME = ".index"
+INDEX_VERSION = 1
+DEFAULT_FEATURES = 2 ** 20
+
+_TOKEN_PATTERN = re.compile(r"[#@]?\w+")
+
+
+def _require_scipy():
+    try:
+        import numpy
+        import scipy.sparse
+    except ImportError:
+        raise ValueError("Similarity-based example selection requires the 'numpy' and 'scipy' packages.")
+    return numpy, scipy.sparse
+
+
+def _hashed_features(text: str, n_features: int) -> list:
+    """
+    Returns the hashed word unigram and bigram features of a text.
+
+    `zlib.crc32` is used instead of `hash()` because it is stable across processes and runs.
+    """
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    grams = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    return [zlib.crc32(gram.encode("utf-8")) % n_features for gram in grams]
+
+
+def _term_matrix(texts: list, n_features: int):
+    numpy, sparse = _require_scipy()
+    indptr, indices = [0], []
+    for text in texts:
+        indices.extend(_hashed_features(text, n_features))
+        indptr.append(len(indices))
+    data = numpy.ones(len(indices), dtype=numpy.float32)
+    matrix = sparse.csr_matrix(
+        (data, numpy.asarray(indices, dtype=numpy.int64), numpy.asarray(indptr, dtype=numpy.int64)),
+        shape=(len(texts), n_features),
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+
+def _normalize(matrix):
+    numpy, sparse = _require_scipy()
+    norms = numpy.sqrt(numpy.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).tocsr()
+
+
+class SimilarityIndex:
+    """
+    TF-IDF index of hashed n-grams over the example tweets of a dataset file.
+
+    Args:
+        matrix: L2-normalised TF-IDF matrix of shape (examples, n_features).
+        idf: Inverse document frequency per feature.
+        target_ids: Index into `targets` of each example's target.
+        targets (list): Distinct targets of the examples.
+    """
+
+    def __init__(self, matrix, idf, target_ids, targets: list):
+        self.matrix = matrix
+        self.idf = idf
+        self.target_ids = target_ids
+        self.targets = list(targets)
+        self._target_lookup = {target: i for i, target in enumerate(self.targets)}
+
+    @classmethod
+    def build(cls, tweets: list, targets: list, n_features: int = DEFAULT_FEATURES) -> "SimilarityIndex":
+        numpy, sparse = _require_scipy()
+        counts = _term_matrix(tweets, n_features)
+        document_frequency = numpy.bincount(counts.indices, minlength=n_features)
+        idf = (numpy.log((1 + len(tweets)) / (1 + document_frequency)) + 1).astype(numpy.float32)
+        matrix = _normalize(counts.multiply(idf).tocsr())
+
+        distinct_targets = sorted(set(targets))
+        lookup = {target: i for i, target in enumerate(distinct_targets)}
+        target_ids = numpy.asarray([lookup[target] for target in targets], dtype=numpy.int32)
+        return cls(matrix, idf, target_ids, distinct_targets)
+
+    def query(self, tweets: list, targets: list = None, k: int = 3) -> list:
+        """
+        Returns, for each query tweet, the indices of the `k` most similar examples, most similar first.
+
+        Args:
+            tweets (list): Query tweets.
+            targets (list): Optional. Target of each query; when given, only examples with the same
+                target are returned (falling back to all examples for unknown targets), so a query
+                whose target has fewer than `k` examples gets all of them and no more.
+            k (int): Number of examples per query.
+
+        Returns:
+            list: One tuple of at most `k` example indices per query.
+        """
+        numpy, sparse = _require_scipy()
+        n_examples = self.matrix.shape[0]
+        k = min(k, n_examples)
+        if k == 0:
+            return [() for _ in tweets]
+
+        queries = _normalize(_term_matrix(tweets, self.matrix.shape[1]).multiply(self.idf).tocsr())
+        scores = queries.dot(self.matrix.T).toarray()
+
+        if targets is not None:
+            query_target_ids = numpy.asarray([self._target_lookup.get(target, -1) for target in targets])
+            mismatch = (self.target_ids[None, :] != query_target_ids[:, None]) & (query_target_ids[:, None] >= 0)
+            scores[mismatch] = -numpy.inf
+
+        # Top-k per row; ties are broken by example index so results are deterministic
+        top = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = numpy.take_along_axis(scores, top, axis=1)
+        order = numpy.lexsort((top, -top_scores), axis=1)
+        top = numpy.take_along_axis(top, order, axis=1)
+        if targets is None:
+            return [tuple(int(i) for i in row) for row in top]
+        # Masked examples of other targets can still make up the top-k of a target with fewer than k examples; drop them
+        allowed = numpy.isfinite(numpy.take_along_axis(top_scores, order, axis=1))
+        return [tuple(int(i) for i in row[keep]) for row, keep in zip(top, allowed)]
+
+    def save(self, path: str, meta: dict):
+        numpy, _ = _require_scipy()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = path + ".tmp.npz"
+        numpy.savez(
+            temporary_path,
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            shape=numpy.asarray(self.matrix.shape),
+            idf=self.idf,
+            target_ids=self.target_ids,
+            targets=numpy.asarray(self.targets, dtype=str),
+            meta=numpy.asarray(json.dumps(meta, sort_keys=True)),
+        )
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path: str, meta: dict):
+        """
+        Loads an index from `path`. Returns None if it is missing or was built from different inputs.
+        """
+        numpy, sparse = _require_scipy()
+        if not os.path.isfile(path):
+            return None
+        with numpy.load(path, allow_pickle=False) as stored:
+            if json.loads(str(stored["meta"])) != meta:
+                return None
+            matrix = sparse.csr_matrix(
+                (stored["data"], stored["indices"], stored["indptr"]), shape=tuple(stored["shape"])
+            )
+            return cls(matrix, stored["idf"], stored["target_ids"], stored["targets"].tolist())
+
+
+def index_path(example_file: str) -> str:
+    """
+    Returns where the index of `example_file` is stored: `<dir>/.index/<file name>.npz`.
+    """
+    directory, file_name = os.path.split(os.path.abspath(example_file))
+    return os.path.join(directory, INDEX_DIRNAME, f"{file_name}.npz")
+
+
+def load_or_build_index(example_file: str, tweets: list, targets: list,
+                        n_features: int = DEFAULT_FEATURES) -> SimilarityIndex:
+    """
+    Loads the index of `example_file` from disk, or builds and stores it if it is missing or stale.
+
+    Args:
+        example_file (str): Path of the file the examples were read from. Its size and modification
+            time decide whether a stored index is still valid.
+        tweets (list): Example tweets, in file order.
+        targets (list): Target of each example.
+        n_features (int): Number of hashed features.
+    """
+    stat = os.stat(example_file)
+    meta = {
+        "version": INDEX_VERSION,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "rows": len(tweets),
+        "n_features": n_features,
+    }
+    path = index_path(example_file)
+    index = SimilarityIndex.load(path, meta)
+    if index is None:
+        index = SimilarityIndex.build(tweets, targets, n_features)
+        index.save(path, meta)
+    return index
+
+
+def with_similar_examples(pairs, index: SimilarityIndex, k: int, batch_size: int = 1000, same_target: bool = True):
+    """
+    Attaches the indices of the `k` most similar examples to each (tweet, target) pair.
+
+    Queries are run in batches of `batch_size` rows.
+
+    Yields:
+        tuple: `(tweet, target, example_ids)`.
+    """
+    batch = []
+    for pair in pairs:
+        batch.append(pair)
+        if len(batch) == batch_size:
+            yield from _query_batch(batch, index, k, same_target)
+            batch = []
+    if batch:
+        yield from _query_batch(batch, index, k, same_target)
+
+
+def _query_batch(batch: list, index: SimilarityIndex, k: int, same_target: bool):
+    tweets = [tweet for tweet, _ in batch]
+    targets = [target for _, target in batch] if same_target else None
+    for (tweet, target), example_ids in zip(batch, index.query(tweets, targets, k)):
+        yield tweet, target, example_ids
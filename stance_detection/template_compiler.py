@@ -0,0 +1,244 @@
+"""
+Precompiles prompt templates into static and dynamic segments.
+
+Template functions rebuild their whole instruction block on every call, although only the
+tweet and the target change between rows. `compile_template` renders a template once with
+placeholder values, splits the result into the static text and the positions of `tweet` and
+`target`, and generates a renderer that joins the precomputed segments with the row values.
+For few-shot templates the example block is baked into the static text, so it is no longer
+rebuilt on every row.
+
+Zero-shot template functions are plain f-strings, which CPython already compiles into a single
+string-building instruction. Those keep being called directly, since a join cannot beat them;
+they still get their segments and `shared_prefix` computed.
+
+The static text before the first dynamic field is exposed as `shared_prefix`, so that an
+inference server can reuse its KV cache across all prompts of a template.
+"""
+
+import re
+import uuid
+import types
+from collections import OrderedDict
+
+
+# Placeholder values used to locate the dynamic fields in a rendered template.
+_SENTINELS = {
+    "tweet": "\x00__tweet__\x00",
+    "target": "\x00__target__\x00",
+}
+_SENTINEL_PATTERN = re.compile("|".join(re.escape(value) for value in _SENTINELS.values()))
+_SENTINEL_FIELDS = {value: field for field, value in _SENTINELS.items()}
+
+# Number of compiled (template, example set) pairs kept in memory by `compile_template`.
+COMPILED_CACHE_SIZE = 256
+
+# Values used to check that a compiled template renders exactly like the original function.
+_PROBE = {
+    "tweet": 'Probe tweet with "quotes", {braces} and\nnew lines #probe',
+    "target": "Probe {target}",
+}
+
+
+def _build_renderer(segments: tuple, fields: tuple):
+    """
+    Generates `lambda tweet, target: "".join((s0, target, s1, tweet, s2, ...))` for the given layout.
+    """
+    parts = []
+    for i, segment in enumerate(segments):
+        parts.append(f"_s{i}")
+        if i < len(fields):
+            parts.append(fields[i])
+    namespace = {f"_s{i}": segment for i, segment in enumerate(segments)}
+    return eval(f"lambda tweet, target: ''.join(({', '.join(parts)},))", namespace)
+
+
+class CompiledTemplate:
+    """
+    A template split into static segments and dynamic `tweet`/`target` fields.
+
+    Instances are callable as `(tweet, target)` and render exactly like the original template.
+    Hot loops should call `render` directly, which skips one level of indirection.
+    Templates that do not insert `tweet` and `target` verbatim (e.g. ones that transform them)
+    cannot be split; those fall back to calling the original function on every row.
+
+    Attributes:
+        segments (tuple): Static text between the dynamic fields (one more than `fields`).
+        fields (tuple): Names of the dynamic fields, in order of appearance.
+        shared_prefix (str): Static text before the first dynamic field, shared by every prompt.
+        render (callable): Renders a row as `(tweet, target)`.
+    """
+
+    def __init__(self, template, examples: list = None):
+        self.template = template
+        self.examples = examples
+        self.segments = None
+        self.fields = None
+        self.shared_prefix = ""
+        self._render = None
+        self._target_prefixes = {}
+        self.render = self._call_template
+
+        rendered = self._call_template(_SENTINELS["tweet"], _SENTINELS["target"])
+        segments = _SENTINEL_PATTERN.split(rendered)
+        fields = tuple(_SENTINEL_FIELDS[match] for match in _SENTINEL_PATTERN.findall(rendered))
+
+        renderer = _build_renderer(tuple(segments), fields)
+        if renderer(_PROBE["tweet"], _PROBE["target"]) != self._call_template(_PROBE["tweet"], _PROBE["target"]):
+            return
+
+        self.segments = tuple(segments)
+        self.fields = fields
+        self.shared_prefix = segments[0]
+        self._render = self._select_renderer(renderer)
+        self.render = self._render
+
+    def _select_renderer(self, renderer):
+        if self.examples is None and isinstance(self.template, types.FunctionType):
+            return self.template
+        return renderer
+
+    def _call_template(self, tweet: str, target: str) -> str:
+        if self.examples is None:
+            return self.template(tweet, target)
+        return self.template(tweet, target, self.examples)
+
+    @property
+    def is_compiled(self) -> bool:
+        return self._render is not None
+
+    def __call__(self, tweet: str, target: str) -> str:
+        return self.render(tweet, target)
+
+    def prefix_for(self, target: str) -> str:
+        """
+        Returns the prompt text before the tweet for a given target.
+
+        All prompts with the same target share this prefix, which is at least as long as
+        `shared_prefix` and is the longest span an inference server can cache per target.
+        """
+        if self._render is None:
+            return ""
+        if target not in self._target_prefixes:
+            prefix = []
+            for segment, field in zip(self.segments, self.fields):
+                prefix.append(segment)
+                if field == "tweet":
+                    break
+                prefix.append(target)
+            else:
+                prefix.append(self.segments[-1])
+            self._target_prefixes[target] = "".join(prefix)
+        return self._target_prefixes[target]
+
+    def __getstate__(self):
+        # Generated renderers are not picklable, so they are rebuilt on load
+        state = self.__dict__.copy()
+        state["_render"] = None
+        state["render"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.render = self._call_template
+        if self.segments is not None:
+            self._render = self._select_renderer(_build_renderer(self.segments, self.fields))
+            self.render = self._render
+
+
+_compiled_cache = OrderedDict()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def compile_template(template, examples: list = None, examples_key=None) -> CompiledTemplate:
+    """
+    Compiles a template function (or data template) into static and dynamic segments.
+
+    Results are cached per (template, example set) in a bounded LRU of `COMPILED_CACHE_SIZE`
+    entries, so the few-shot example block is rendered once per example set, even when
+    example sets vary from row to row.
+
+    Args:
+        template (callable): Template taking `(tweet, target)`, or `(tweet, target, examples)` for few-shot.
+        examples (list): Optional. Few-shot examples to bake into the compiled template.
+        examples_key (hashable): Optional. Cheap identifier of the example set, such as the tuple of
+            its row indices. Defaults to a key built from the example contents.
+
+    Returns:
+        CompiledTemplate: Callable as `(tweet, target)`.
+    """
+    if examples_key is None and examples is not None:
+        examples_key = tuple(tuple(example.items()) for example in examples)
+
+    key = (template, examples is not None, examples_key)
+    compiled = _compiled_cache.get(key)
+    if compiled is not None:
+        _compiled_cache.move_to_end(key)
+        _cache_stats["hits"] += 1
+        return compiled
+
+    _cache_stats["misses"] += 1
+    compiled = CompiledTemplate(template, examples)
+    _compiled_cache[key] = compiled
+    if len(_compiled_cache) > COMPILED_CACHE_SIZE:
+        _compiled_cache.popitem(last=False)
+    return compiled
+
+
+class ExamplePool:
+    """
+    Few-shot examples shared by all rows, from which each row uses its own example set.
+
+    Example sets are identified by tuples of indices into `examples`. Their compiled templates
+    come from the `compile_template` cache, keyed by those indices, so each distinct example
+    set is rendered once.
+
+    Args:
+        template (callable): Few-shot template taking `(tweet, target, examples)`.
+        examples (list): All candidate examples, as dicts with `tweet`, `target` and `label`.
+    """
+
+    def __init__(self, template, examples: list):
+        self.template = template
+        self.examples = examples
+        # Identifies this pool in the cache; unlike id(), it survives pickling to worker processes
+        self.key = uuid.uuid4().hex
+
+    def compiled(self, example_ids: tuple) -> CompiledTemplate:
+        return compile_template(
+            self.template, [self.examples[i] for i in example_ids], examples_key=(self.key, example_ids)
+        )
+
+
+class ExampleSetPool:
+    """
+    A fixed pool of few-shot example sets, each compiled once, from which every row uses one set by its index.
+
+    The compiled templates are held by the pool itself rather than the `compile_template` cache, so pools
+    larger than `COMPILED_CACHE_SIZE` never recompile a set, and worker processes receive them already
+    compiled. Rendering a row is then one list lookup and one join.
+
+    Args:
+        template (callable): Few-shot template taking `(tweet, target, examples)`.
+        examples (list): All candidate examples, as dicts with `tweet`, `target` and `label`.
+        example_sets (list): Tuples of indices into `examples`, one per set.
+    """
+
+    def __init__(self, template, examples: list, example_sets: list):
+        self.example_sets = [tuple(example_ids) for example_ids in example_sets]
+        self.templates = [
+            CompiledTemplate(template, [examples[i] for i in example_ids]) for example_ids in self.example_sets
+        ]
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def compiled(self, set_id: int) -> CompiledTemplate:
+        return self.templates[set_id]
+
+
+def compiled_cache_info() -> dict:
+    """
+    Returns hit/miss statistics and the current size of the `compile_template` cache.
+    """
+    return {**_cache_stats, "size": len(_compiled_cache), "max_size": COMPILED_CACHE_SIZE}
@@ -0,0 +1,240 @@
+"""
+Registry of prompt templates keyed by (dataset, model, shot type).
+
+Templates come from two sources:
+
+    - Functions in `prompts.py`, named `<dataset>_<model>_<shot>_template`. The generic
+      templates without a model in their name (e.g. `PStance_zero_shot_template`) are
+      registered under the model name `generic`, and also define the dataset names used to
+      split the other template names into dataset and model.
+    - Data files in the templates directory, named `<dataset>_<model>.toml` (or `.yaml`/`.yml`),
+      declaring format strings instead of Python functions.
+
+Both sources are loaded lazily: `prompts.py` is imported on the first function lookup and a
+data file is only parsed when its (dataset, model) pair is requested, so lookup cost does not
+grow with the number of templates.
+
+A data template file looks like this:
+
+    [zero_shot]
+    template = \"\"\"Tweet: "{tweet}"
+    Stance towards "{target}":\"\"\"
+
+    [few_shot]
+    template = \"\"\"{examples}
+
+    Tweet: "{tweet}"
+    Stance towards "{target}":\"\"\"
+    example = \"\"\"Example {index}:
+    Tweet: "{tweet}"
+    Target: "{target}"
+    Stance: {label}\"\"\"
+    example_separator = "\\n\\n"
+"""
+
+import os
+import importlib
+
+
+SHOT_TYPES = ("zero_shot", "few_shot")
+GENERIC_MODEL = "generic"
+DEFAULT_TEMPLATES_DIR = os.environ.get(
+    "STANCE_TEMPLATES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+)
+_DATA_EXTENSIONS = (".toml", ".yaml", ".yml")
+
+
+class FormatTemplate:
+    """
+    Prompt template declared as format strings in a data file.
+
+    Instances are callable with the same signature as the functions in `prompts.py`:
+    `(tweet, target)` for zero-shot and `(tweet, target, examples)` for few-shot templates.
+    """
+
+    def __init__(self, template: str, example: str = None, example_separator: str = "\n\n"):
+        self.template = template
+        self.example = example
+        self.example_separator = example_separator
+
+    def __call__(self, tweet: str, target: str, examples: list = None) -> str:
+        fields = {"tweet": tweet, "target": target}
+        if self.example is not None:
+            fields["examples"] = self.example_separator.join(
+                self.example.format(index=i + 1, **example) for i, example in enumerate(examples or [])
+            )
+        return self.template.format_map(fields)
+
+
+def _load_data_file(path: str) -> dict:
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError(f"Reading '{path}' requires Python 3.11+ or the 'tomli' package.")
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError(f"Reading '{path}' requires the 'PyYAML' package.")
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def _template_names(prompts) -> list:
+    """
+    Returns `(prefix, shot)` for every `<prefix>_<shot>_template` function in `prompts.py`.
+    """
+    names = []
+    for name in dir(prompts):
+        for shot in SHOT_TYPES:
+            suffix = f"_{shot}_template"
+            if name.endswith(suffix) and callable(getattr(prompts, name)):
+                names.append((name[: -len(suffix)], shot))
+    return names
+
+
+def _split_name(name: str, dataset_names: list) -> tuple:
+    """
+    Splits `<dataset>_<model>` into `(dataset, model)`.
+
+    Dataset names may contain underscores, so `name` is matched against `dataset_names`, longest first;
+    a name without a known dataset is split at its last underscore.
+    """
+    for dataset_name in sorted(dataset_names, key=len, reverse=True):
+        if name.startswith(dataset_name + "_"):
+            return dataset_name, name[len(dataset_name) + 1:]
+    dataset_name, _, model_name = name.rpartition("_")
+    return dataset_name, model_name
+
+
+class TemplateRegistry:
+    """
+    Looks up template callables by (dataset, model, shot type) and lists the available ones.
+
+    Args:
+        templates_dir (str): Directory holding data template files. Defaults to `stance_detection/templates`,
+            or the `STANCE_TEMPLATES_DIR` environment variable when set.
+    """
+
+    def __init__(self, templates_dir: str = DEFAULT_TEMPLATES_DIR):
+        self.templates_dir = templates_dir
+        self._cache = {}
+        self._data_files = {}
+
+    def get(self, dataset_name: str, model_name: str, shot: str):
+        """
+        Returns the template callable for the given combination.
+
+        Raises:
+            ValueError: If no function or data template exists for the combination.
+        """
+        if shot not in SHOT_TYPES:
+            raise ValueError(f"Unknown shot type '{shot}'. Choose one of: {', '.join(SHOT_TYPES)}.")
+
+        key = (dataset_name, model_name, shot)
+        if key not in self._cache:
+            template = self._get_function(*key)
+            if template is None:
+                template = self._get_data_template(*key)
+            if template is None:
+                raise ValueError(
+                    f"Template '{self.function_name(*key)}' does not exist. "
+                    f"Add it to prompts.py or declare it in {self.templates_dir}."
+                )
+            self._cache[key] = template
+        return self._cache[key]
+
+    @staticmethod
+    def function_name(dataset_name: str, model_name: str, shot: str) -> str:
+        if model_name == GENERIC_MODEL:
+            return f"{dataset_name}_{shot}_template"
+        return f"{dataset_name}_{model_name}_{shot}_template"
+
+    def _get_function(self, dataset_name: str, model_name: str, shot: str):
+        prompts = importlib.import_module("prompts")
+        return getattr(prompts, self.function_name(dataset_name, model_name, shot), None)
+
+    def _get_data_template(self, dataset_name: str, model_name: str, shot: str):
+        key = (dataset_name, model_name)
+        if key not in self._data_files:
+            self._data_files[key] = None
+            for extension in _DATA_EXTENSIONS:
+                path = os.path.join(self.templates_dir, f"{dataset_name}_{model_name}{extension}")
+                if os.path.isfile(path):
+                    self._data_files[key] = _load_data_file(path)
+                    break
+
+        spec = (self._data_files[key] or {}).get(shot)
+        if spec is None:
+            return None
+        if "template" not in spec:
+            raise ValueError(f"Data template for '{dataset_name}_{model_name}' is missing '{shot}.template'.")
+        if shot == "few_shot" and "example" not in spec:
+            raise ValueError(f"Data template for '{dataset_name}_{model_name}' is missing 'few_shot.example'.")
+
+        return FormatTemplate(spec["template"], spec.get("example"), spec.get("example_separator", "\n\n"))
+
+    def list(self) -> list:
+        """
+        Lists every available template.
+
+        Returns:
+            list: Sorted `(dataset, model, shot, source)` tuples, where source is `prompts.py`
+            or the path of the data file.
+        """
+        entries = set()
+
+        template_names = _template_names(importlib.import_module("prompts"))
+        # A generic template is named after its dataset alone: a name that extends no other template's name,
+        # and does not end with a model that other datasets have templates for
+        prefixes = {prefix for prefix, _ in template_names}
+        dataset_names = [
+            prefix for prefix in prefixes
+            if not any(prefix.startswith(other + "_") for other in prefixes)
+        ]
+        model_names = {_split_name(prefix, dataset_names)[1] for prefix in prefixes if prefix not in dataset_names}
+        dataset_names = [name for name in dataset_names if name.rpartition("_")[2] not in model_names]
+        for prefix, shot in template_names:
+            if prefix in dataset_names:
+                entries.add((prefix, GENERIC_MODEL, shot, "prompts.py"))
+            else:
+                entries.add(_split_name(prefix, dataset_names) + (shot, "prompts.py"))
+
+        if os.path.isdir(self.templates_dir):
+            known = {entry[:3] for entry in entries}
+            for file_name in os.listdir(self.templates_dir):
+                stem, extension = os.path.splitext(file_name)
+                if extension not in _DATA_EXTENSIONS:
+                    continue
+                path = os.path.join(self.templates_dir, file_name)
+                dataset_name, model_name = _split_name(stem, dataset_names)
+                for shot in SHOT_TYPES:
+                    if shot in _load_data_file(path) and (dataset_name, model_name, shot) not in known:
+                        entries.add((dataset_name, model_name, shot, path))
+
+        return sorted(entries)
+
+
+registry = TemplateRegistry()
+
+
+def get_template(dataset_name: str, model_name: str, shot: str):
+    """
+    Returns the template callable for (dataset, model, shot) from the default registry.
+    """
+    return registry.get(dataset_name, model_name, shot)
+
+
+def print_templates(shot: str = None):
+    """
+    Prints the available templates of the default registry, optionally filtered by shot type.
+    """
+    for dataset_name, model_name, entry_shot, source in registry.list():
+        if shot is None or entry_shot == shot:
+            print(f"{dataset_name:<22} {model_name:<10} {entry_shot:<10} {source}")
@@ -0,0 +1,221 @@
+"""
+Token counting and length-budget enforcement for generated prompts.
+
+Tokenizers are loaded offline, per model family, from a local `tokenizer.json` file, a local
+Hugging Face model directory, or the Hugging Face cache. Counting is batched, so that a chunk of
+rows is tokenized in a single call. The `approx` tokenizer counts words and punctuation and
+needs no extra packages; it is only a rough estimate.
+
+When a prompt exceeds `max_tokens`, `fit_to_budget` first drops few-shot examples from the end,
+and if the prompt still does not fit without examples, truncates the tweet at a word boundary.
+Both steps are deterministic.
+"""
+
+import re
+import bisect
+from collections import Counter
+
+from template_compiler import compile_template
+
+
+# Hugging Face model ids used to find the tokenizer of each model family in the local cache.
+TOKENIZER_FAMILIES = {
+    "qwen2": "Qwen/Qwen2-7B-Instruct",
+    "llama2": "meta-llama/Llama-2-7b-chat-hf",
+    "mistral": "mistralai/Mistral-7B-Instruct-v0.2",
+}
+
+APPROX_TOKENIZER = "approx"
+
+_APPROX_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_WORD_PATTERN = re.compile(r"\S+")
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens in batches for a model family.
+
+    The tokenizer is loaded on construction, so a missing tokenizer is reported before any
+    work starts. It is not pickled; worker processes reload it on first use.
+
+    Args:
+        model_name (str): Model family (e.g., "qwen2"). Used to pick the default tokenizer.
+        tokenizer (str): Optional. Path to a `tokenizer.json` file or a Hugging Face model directory/id,
+            or "approx" for a dependency-free estimate. Defaults to the model family's tokenizer.
+    """
+
+    def __init__(self, model_name: str, tokenizer: str = None):
+        if tokenizer is None:
+            if model_name not in TOKENIZER_FAMILIES:
+                raise ValueError(
+                    f"No default tokenizer for model '{model_name}'. Pass a tokenizer path or '{APPROX_TOKENIZER}'."
+                )
+            tokenizer = TOKENIZER_FAMILIES[model_name]
+
+        self.model_name = model_name
+        self.tokenizer = tokenizer
+        self._encode_batch = self._load()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_encode_batch"] = None
+        return state
+
+    def _load(self):
+        if self.tokenizer == APPROX_TOKENIZER:
+            return lambda texts: [_APPROX_TOKEN_PATTERN.findall(text) for text in texts]
+
+        if self.tokenizer.endswith(".json"):
+            try:
+                from tokenizers import Tokenizer
+            except ImportError:
+                raise ValueError("Loading a tokenizer.json file requires the 'tokenizers' package.")
+            backend = Tokenizer.from_file(self.tokenizer)
+            return lambda texts: [encoding.ids for encoding in backend.encode_batch(texts, add_special_tokens=False)]
+
+        try:
+            from transformers import AutoTokenizer
+        except ImportError:
+            raise ValueError(
+                f"Loading tokenizer '{self.tokenizer}' requires the 'transformers' package. "
+                f"Pass a tokenizer.json file or '{APPROX_TOKENIZER}' instead."
+            )
+        backend = AutoTokenizer.from_pretrained(self.tokenizer, local_files_only=True)
+        return lambda texts: backend(texts, add_special_tokens=False)["input_ids"]
+
+    def encode(self, texts: list) -> list:
+        """
+        Tokenizes a batch of texts and returns one list of tokens (ids, or strings for `approx`) per text.
+        """
+        if self._encode_batch is None:
+            self._encode_batch = self._load()
+        return self._encode_batch(list(texts))
+
+    def count(self, texts: list) -> list:
+        """
+        Returns the number of tokens of each text in the batch.
+        """
+        return [len(tokens) for tokens in self.encode(texts)]
+
+
+def fit_to_budget(template, items: list, counter: TokenCounter, max_tokens: int) -> list:
+    """
+    Renders prompts that fit into `max_tokens`, reducing them deterministically where needed.
+
+    Few-shot examples are dropped from the end first, keeping as many as fit. Rows that do not fit
+    even without examples get their tweet cut after the largest number of words that fits. Every
+    step tokenizes all remaining rows in a single batch.
+
+    Args:
+        template (CompiledTemplate): Compiled template of the rows.
+        items (list): The `(tweet, target)` pairs that are over budget.
+        counter (TokenCounter): Token counter of the model.
+        max_tokens (int): Token budget of a prompt.
+
+    Returns:
+        list: One `(prompt, prompt_tokens, examples_used, tweet_truncated)` tuple per item.
+            `examples_used` is None for zero-shot templates.
+    """
+    results = [None] * len(items)
+    pending = list(range(len(items)))
+
+    examples = template.examples
+    if examples:
+        # Try fewer and fewer examples, re-counting only the rows that still do not fit
+        for examples_used in range(len(examples) - 1, -1, -1):
+            candidate = compile_template(template.template, examples[:examples_used])
+            prompts = [candidate.render(*items[i]) for i in pending]
+            still_pending = []
+            for i, prompt, tokens in zip(pending, prompts, counter.count(prompts)):
+                if tokens <= max_tokens:
+                    results[i] = (prompt, tokens, examples_used, False)
+                else:
+                    still_pending.append(i)
+            pending = still_pending
+            if not pending:
+                return results
+        template = candidate
+
+    # Binary search, for all remaining rows at once, for the longest word prefix of the tweet that fits
+    examples_used = 0 if examples is not None else None
+    word_ends = {i: [match.end() for match in _WORD_PATTERN.finditer(items[i][0])] for i in pending}
+    bounds = {i: (0, len(word_ends[i])) for i in pending}
+    best = {}
+    while bounds:
+        middles = {i: (low + high) // 2 for i, (low, high) in bounds.items()}
+        prompts = [
+            template.render(items[i][0][:word_ends[i][middle - 1]] if middle else "", items[i][1])
+            for i, middle in middles.items()
+        ]
+        for (i, middle), prompt, tokens in zip(middles.items(), prompts, counter.count(prompts)):
+            low, high = bounds[i]
+            if tokens <= max_tokens:
+                best[i] = (prompt, tokens)
+                low = middle + 1
+            else:
+                high = middle - 1
+            bounds[i] = (low, high)
+        bounds = {i: bound for i, bound in bounds.items() if bound[0] <= bound[1]}
+
+    # Rows that do not fit even with an empty tweet keep the shortest prompt so they remain usable
+    missing = [i for i in pending if i not in best]
+    if missing:
+        prompts = [template.render("", items[i][1]) for i in missing]
+        best.update(zip(missing, zip(prompts, counter.count(prompts))))
+
+    for i in pending:
+        results[i] = (*best[i], examples_used, True)
+    return results
+
+
+class TokenHistogram:
+    """
+    Collects prompt token counts of a file and prints a summary histogram.
+    """
+
+    BIN_EDGES = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BIN_EDGES) + 1)
+        self.values = Counter()
+        self.examples_reduced = 0
+        self.tweets_truncated = 0
+
+    def add(self, tokens: int, examples_reduced: bool = False, tweet_truncated: bool = False):
+        self.counts[bisect.bisect_left(self.BIN_EDGES, tokens)] += 1
+        self.values[tokens] += 1
+        self.examples_reduced += examples_reduced
+        self.tweets_truncated += tweet_truncated
+
+    def report(self, title: str):
+        if not self.values:
+            print(f"No prompts counted for {title}")
+            return
+
+        total = sum(self.values.values())
+        ordered = sorted(self.values.items())
+
+        def percentile(p):
+            rank, seen = p / 100 * (total - 1), 0
+            for tokens, count in ordered:
+                seen += count
+                if seen > rank:
+                    return tokens
+
+        mean = sum(tokens * count for tokens, count in ordered) / total
+        print(
+            f"Prompt tokens for {title}: min {ordered[0][0]}, mean {mean:.1f}, "
+            f"p50 {percentile(50)}, p99 {percentile(99)}, max {ordered[-1][0]}"
+        )
+
+        peak = max(self.counts)
+        lower = 0
+        for upper, count in zip(self.BIN_EDGES + (None,), self.counts):
+            if count:
+                label = f"{lower}-{upper}" if upper is not None else f">{lower}"
+                bar = "#" * max(1, round(40 * count / peak))
+                print(f"  {label:>11} | {bar} {count}")
+            lower = upper
+
+        if self.examples_reduced or self.tweets_truncated:
+            print(f"  Budget: {self.examples_reduced} rows with fewer examples, {self.tweets_truncated} tweets truncated")
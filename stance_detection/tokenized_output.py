@@ -0,0 +1,270 @@
+"""
+Pre-tokenized prompt files.
+
+With `--tokenized`, the generators also write the token ids of every prompt next to the output, in
+`<output name>.tokens.npz`, so that inference can load them without tokenizing the prompts again. Row i
+of the file holds the tokens of row i of the output.
+
+All prompts with the same target share the text before the tweet (`CompiledTemplate.prefix_for`). Its
+tokens are stored once, and each row stores only its own suffix tokens and the index of its prefix:
+
+    - `prefix_ids`, `prefix_offsets`: the token ids of all prefixes, concatenated; prefix p spans
+      `prefix_ids[prefix_offsets[p]:prefix_offsets[p + 1]]`.
+    - `suffix_ids`, `suffix_offsets`: the suffix token ids of all rows, concatenated, likewise.
+    - `row_prefix`: the prefix index of every row, or -1 for a row stored whole.
+    - `tokenizer`, `version`: the tokenizer the ids come from and the layout version.
+
+Every prompt is tokenized whole, so the stored ids are exactly those of the full prompt. Tokenizers may
+merge the last tokens of a prefix with the start of the tweet, so the shared part of a prefix is its
+tokens without the last one, and a row only refers to it if its own tokens start with it; otherwise the
+row is stored whole.
+
+The file is an uncompressed `.npz` archive: `np.load` reads it, and `TokenizedPrompts` memory-maps its
+arrays in place. Suffix ids are spooled to a temporary file while rows are written, so writing uses
+little memory however many rows there are.
+"""
+
+import io
+import os
+import sys
+import shutil
+import zipfile
+from array import array
+
+
+TOKENS_SUFFIX = ".tokens.npz"
+TOKENS_VERSION = 1
+
+# Token ids of the shared part of each prefix, per tokenizer and prefix text, computed once per process
+_PREFIX_IDS = {}
+
+# Number of suffix ids buffered in memory before they are appended to the spool file
+_SPOOL_SIZE = 1 << 16
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ValueError("Tokenized output requires the 'numpy' package (pip install numpy).")
+    return numpy
+
+
+def shared_prefix_ids(token_counter, prefix: str) -> list:
+    """
+    Returns the token ids a prefix shares with every prompt starting with it: its tokens without the last one.
+    """
+    key = (token_counter.tokenizer, prefix)
+    ids = _PREFIX_IDS.get(key)
+    if ids is None:
+        ids = _PREFIX_IDS[key] = list(token_counter.encode([prefix])[0][:-1]) if prefix else []
+    return ids
+
+
+def split_prefix(token_counter, prefix: str, ids: list) -> tuple:
+    """
+    Splits the token ids of a prompt into its shared prefix and its own suffix.
+
+    Returns:
+        tuple: `(prefix, suffix_ids)`, or `(None, ids)` when the prompt does not start with the prefix's tokens.
+    """
+    shared = shared_prefix_ids(token_counter, prefix)
+    if not shared or ids[:len(shared)] != shared:
+        return None, ids
+    return prefix, ids[len(shared):]
+
+
+def _write_member(archive, name: str, dtype: str, count: int, write_data):
+    from numpy.lib import format as npy_format
+    numpy = _numpy()
+    with archive.open(name + ".npy", "w", force_zip64=True) as f:
+        npy_format.write_array_header_1_0(
+            f, {"descr": npy_format.dtype_to_descr(numpy.dtype(dtype)), "fortran_order": False, "shape": (count,)}
+        )
+        write_data(f)
+
+
+class TokenizedWriter:
+    """
+    Writes the token ids of an output's rows to `path`, in row order.
+
+    The file replaces `path` only when the writer is closed without error.
+
+    Args:
+        path (str): Path of the `.tokens.npz` file.
+        token_counter (TokenCounter): Tokenizer the ids come from; also tokenizes each distinct prefix once.
+    """
+
+    def __init__(self, path: str, token_counter):
+        self.path = path
+        self.token_counter = token_counter
+        self.prefixes = {}
+        self.prefix_ids = array("i")
+        self.prefix_offsets = array("q", [0])
+        self.row_prefix = array("i")
+        self.suffix_offsets = array("q", [0])
+        self._buffer = array("i")
+        self._spool = None
+
+    def __enter__(self):
+        _numpy()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._spool = open(self.path + ".ids.tmp", "wb")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    @property
+    def count(self) -> int:
+        return len(self.row_prefix)
+
+    def write(self, row_tokens: tuple):
+        """
+        Appends a row, as the `(prefix, suffix_ids)` pair returned by `split_prefix`.
+        """
+        prefix, suffix_ids = row_tokens
+        if prefix is None:
+            self.row_prefix.append(-1)
+        else:
+            index = self.prefixes.get(prefix)
+            if index is None:
+                index = self.prefixes[prefix] = len(self.prefixes)
+                self.prefix_ids.extend(shared_prefix_ids(self.token_counter, prefix))
+                self.prefix_offsets.append(len(self.prefix_ids))
+            self.row_prefix.append(index)
+        self._buffer.extend(suffix_ids)
+        self.suffix_offsets.append(self.suffix_offsets[-1] + len(suffix_ids))
+        if len(self._buffer) >= _SPOOL_SIZE:
+            self._flush()
+
+    def _flush(self):
+        # The spool is copied into the archive as is, so it holds little-endian values like the other members
+        if sys.byteorder != "little":
+            self._buffer.byteswap()
+        self._buffer.tofile(self._spool)
+        self._buffer = array("i")
+
+    def close(self):
+        numpy = _numpy()
+        self._flush()
+        self._spool.close()
+        temporary_path = self.path + ".tmp"
+        try:
+            with zipfile.ZipFile(temporary_path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+                for name, values, dtype in (
+                    ("prefix_ids", self.prefix_ids, "<i4"),
+                    ("prefix_offsets", self.prefix_offsets, "<i8"),
+                    ("row_prefix", self.row_prefix, "<i4"),
+                    ("suffix_offsets", self.suffix_offsets, "<i8"),
+                ):
+                    data = numpy.asarray(values, dtype=dtype)
+                    _write_member(archive, name, dtype, len(data), lambda f: f.write(data.tobytes()))
+                with open(self.path + ".ids.tmp", "rb") as spool:
+                    _write_member(
+                        archive, "suffix_ids", "<i4", self.suffix_offsets[-1], lambda f: shutil.copyfileobj(spool, f)
+                    )
+                for name, value in (("tokenizer", self.token_counter.tokenizer), ("version", TOKENS_VERSION)):
+                    buffer = io.BytesIO()
+                    numpy.save(buffer, numpy.asarray(value), allow_pickle=False)
+                    archive.writestr(name + ".npy", buffer.getvalue())
+            os.replace(temporary_path, self.path)
+        finally:
+            os.remove(self.path + ".ids.tmp")
+
+    def discard(self):
+        self._spool.close()
+        os.remove(self.path + ".ids.tmp")
+
+
+class TokenizedPrompts:
+    """
+    Reads a `.tokens.npz` file, memory-mapping its arrays.
+
+    Example:
+        prompts = TokenizedPrompts("output/zero_shot/semeval2016_qwen2_prompts.tokens.npz")
+        ids = prompts[0]                      # all token ids of row 0
+        prefix, suffix = prompts.split(0)     # shared prefix ids (cacheable) and the row's own ids
+
+    Args:
+        path (str): Path of the file.
+    """
+
+    def __init__(self, path: str):
+        numpy = _numpy()
+        self.path = path
+        with zipfile.ZipFile(path) as archive:
+            arrays = {
+                os.path.splitext(info.filename)[0]: self._map(numpy, archive, info)
+                for info in archive.infolist()
+            }
+        if int(arrays["version"]) != TOKENS_VERSION:
+            raise ValueError(f"{path} has tokenized layout version {int(arrays['version'])}, expected {TOKENS_VERSION}.")
+        self.tokenizer = str(arrays["tokenizer"])
+        self.prefix_ids = arrays["prefix_ids"]
+        self.prefix_offsets = arrays["prefix_offsets"]
+        self.row_prefix = arrays["row_prefix"]
+        self.suffix_ids = arrays["suffix_ids"]
+        self.suffix_offsets = arrays["suffix_offsets"]
+
+    def _map(self, numpy, archive, info):
+        from numpy.lib import format as npy_format
+        with archive.open(info) as f:
+            version = npy_format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = npy_format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = npy_format.read_array_header_2_0(f)
+            header_size = f.tell()
+            if info.compress_type != zipfile.ZIP_STORED or not shape or dtype.hasobject:
+                # Scalars and compressed members are small or cannot be mapped; read them instead
+                return numpy.load(archive.open(info), allow_pickle=False)
+        # Data starts after the member's local file header (30 bytes, its name and its extra field)
+        with open(self.path, "rb") as raw:
+            raw.seek(info.header_offset + 26)
+            name_length, extra_length = int.from_bytes(raw.read(2), "little"), int.from_bytes(raw.read(2), "little")
+        offset = info.header_offset + 30 + name_length + extra_length + header_size
+        if not shape[0]:
+            return numpy.empty(shape, dtype)
+        return numpy.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                            order="F" if fortran_order else "C")
+
+    def __len__(self) -> int:
+        return len(self.row_prefix)
+
+    @property
+    def prefix_count(self) -> int:
+        return len(self.prefix_offsets) - 1
+
+    def prefix(self, p: int):
+        """
+        Returns the shared token ids of prefix `p`.
+        """
+        return self.prefix_ids[self.prefix_offsets[p]:self.prefix_offsets[p + 1]]
+
+    def split(self, i: int) -> tuple:
+        """
+        Returns the token ids of row `i` as `(prefix_ids, suffix_ids)`; the prefix is empty for rows stored whole.
+        """
+        p = self.row_prefix[i]
+        suffix = self.suffix_ids[self.suffix_offsets[i]:self.suffix_offsets[i + 1]]
+        if p < 0:
+            return self.prefix_ids[:0], suffix
+        return self.prefix(p), suffix
+
+    def __getitem__(self, i: int):
+        """
+        Returns all token ids of row `i`.
+        """
+        if not -len(self) <= i < len(self):
+            raise IndexError(f"Row {i} out of range for {len(self)} rows.")
+        if i < 0:
+            i += len(self)
+        prefix, suffix = self.split(i)
+        if not len(prefix):
+            return suffix
+        return _numpy().concatenate((prefix, suffix))
@@ -0,0 +1,74 @@
+import os
+import sys
+import csv
+
+import pytest
+
+# The modules in stance_detection/ import each other as top-level modules, as when run as scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "stance_detection"))
+
+
+TRAIN_ROWS = [
+    ("Build the wall and secure the border #Trump", "Donald Trump", "FAVOR"),
+    ("Great rally tonight, four more years #MAGA", "Donald Trump", "FAVOR"),
+    ("Taxes are finally going down for families", "Donald Trump", "FAVOR"),
+    ("Another lie from the White House today", "Donald Trump", "AGAINST"),
+    ("Impeach him now, enough is enough", "Donald Trump", "AGAINST"),
+    ("The tariffs are hurting farmers in Iowa", "Donald Trump", "AGAINST"),
+]
+
+TEST_ROWS = [
+    ("The border wall is finally being built", "Donald Trump", "FAVOR"),
+    ("He should resign after this scandal", "Donald Trump", "AGAINST"),
+    ("Watching the debate tonight with friends and family, it was a long and loud evening", "Donald Trump", "AGAINST"),
+    ("Four more years for the economy", "Donald Trump", "FAVOR"),
+    ("Farmers deserve better than these tariffs", "Donald Trump", "AGAINST"),
+]
+
+
+def write_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Tweet", "Target", "Stance"])
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def pstance_dir(tmp_path):
+    """
+    A small PStance-style dataset directory with train, validation and test files for `trump`.
+    """
+    dataset_dir = tmp_path / "PStance"
+    dataset_dir.mkdir()
+    write_csv(dataset_dir / "raw_train_trump.csv", TRAIN_ROWS)
+    write_csv(dataset_dir / "raw_val_trump.csv", TRAIN_ROWS[1:])
+    write_csv(dataset_dir / "raw_test_trump.csv", TEST_ROWS)
+    return str(dataset_dir)
+
+
+@pytest.fixture
+def pstance_candidates_dir(pstance_dir):
+    """
+    `pstance_dir` with the same files for `biden` and `bernie`.
+    """
+    for candidate, target in (("biden", "Joe Biden"), ("bernie", "Bernie Sanders")):
+        for split, rows in (("train", TRAIN_ROWS), ("val", TRAIN_ROWS[1:]), ("test", TEST_ROWS)):
+            write_csv(os.path.join(pstance_dir, f"raw_{split}_{candidate}.csv"),
+                      [(tweet, target, stance) for tweet, _, stance in rows])
+    return pstance_dir
+
+
+@pytest.fixture
+def tokenizer_file(tmp_path):
+    """
+    A word-level `tokenizer.json` over the words of the templates and of the dataset above.
+    """
+    tokenizers = pytest.importorskip("tokenizers")
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    trainer = tokenizers.trainers.WordLevelTrainer(special_tokens=["[UNK]"])
+    texts = [" ".join(row) for row in TRAIN_ROWS + TEST_ROWS]
+    tokenizer.train_from_iterator(texts, trainer)
+    path = tmp_path / "tokenizer.json"
+    tokenizer.save(str(path))
+    return str(path)
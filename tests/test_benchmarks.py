@@ -0,0 +1,33 @@
+import os
+import importlib.util
+
+# benchmarks/ is not a package; the suite is loaded from its file, as it is run as a script
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location("run_benchmarks", os.path.join(ROOT_DIR, "benchmarks", "run_benchmarks.py"))
+run_benchmarks = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(run_benchmarks)
+
+
+def test_percentiles():
+    assert run_benchmarks.percentiles([]) == {"p50_us": None, "p99_us": None}
+    assert run_benchmarks.percentiles([i / 1e6 for i in range(100, 0, -1)]) == {"p50_us": 51.0, "p99_us": 100.0}
+
+
+def test_template_benchmark_times_both_variants():
+    results = run_benchmarks.bench_templates(calls=10)
+    names = {result["name"] for result in results}
+    assert "PStance_qwen2_few_shot_template[function]" in names
+    assert "PStance_qwen2_few_shot_template[compiled]" in names
+    assert all(result["calls"] == 10 and result["p50_us"] > 0 for result in results)
+
+
+def test_end_to_end_case_measures_every_row(pstance_dir):
+    case = {"shot": "zero_shot", "arguments": {
+        "input_file": os.path.join(pstance_dir, "raw_test_trump.csv"), "dataset_name": "PStance",
+        "model_name": "qwen2", "candidate_name": "trump",
+    }}
+    result = run_benchmarks.run_case_in_subprocess("bundled", "zero_shot:test", case)
+    assert result["rows"] == 5
+    assert result["output_bytes"] > 0
+    # Rendering is part of the per-row latency
+    assert result["p50_us"] > 0 and result["p99_us"] >= result["p50_us"]
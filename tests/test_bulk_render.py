@@ -0,0 +1,61 @@
+import pytest
+
+from bulk_render import render_column, render_prompts
+from conftest import TEST_ROWS
+from template_registry import get_template
+
+TWEETS = [tweet for tweet, _, _ in TEST_ROWS]
+TARGETS = [target for _, target, _ in TEST_ROWS]
+EXAMPLES = [
+    {"tweet": "Build the wall", "target": "Donald Trump", "label": "FAVOR"},
+    {"tweet": "Impeach him now", "target": "Donald Trump", "label": "AGAINST"},
+]
+
+
+@pytest.mark.parametrize("shot", ["zero_shot", "few_shot"])
+def test_list_column_renders_like_the_template(shot):
+    template = get_template("PStance", "qwen2", shot)
+    examples = EXAMPLES if shot == "few_shot" else None
+    expected = [
+        template(tweet, target, examples) if examples else template(tweet, target)
+        for tweet, target in zip(TWEETS, TARGETS)
+    ]
+
+    assert render_prompts("PStance", "qwen2", TWEETS, TARGETS, shot, examples) == expected
+
+
+def test_column_kinds_render_the_same_prompts():
+    numpy = pytest.importorskip("numpy")
+    pandas = pytest.importorskip("pandas")
+    pyarrow = pytest.importorskip("pyarrow")
+    template = get_template("PStance", "qwen2", "zero_shot")
+    expected = render_column(template, TWEETS, TARGETS)
+
+    prompts = render_column(template, numpy.array(TWEETS, dtype=object), numpy.array(TARGETS, dtype=object))
+    assert isinstance(prompts, numpy.ndarray) and prompts.tolist() == expected
+
+    frame = pandas.DataFrame({"tweet": TWEETS, "target": TARGETS}, index=range(10, 15))
+    series = render_column(template, frame["tweet"], frame["target"])
+    assert series.tolist() == expected and series.index.tolist() == list(range(10, 15))
+
+    arrow = render_column(template, pyarrow.chunked_array([TWEETS[:2], TWEETS[2:]]), pyarrow.array(TARGETS))
+    assert arrow.to_pylist() == expected
+
+
+def test_missing_values_give_missing_prompts():
+    pandas = pytest.importorskip("pandas")
+    pyarrow = pytest.importorskip("pyarrow")
+    template = get_template("PStance", "qwen2", "zero_shot")
+    tweets = [TWEETS[0], None, TWEETS[2]]
+
+    assert render_column(template, tweets, TARGETS[:3])[1] is None
+    assert pandas.isna(render_column(template, pandas.Series(tweets), pandas.Series(TARGETS[:3]))[1])
+    assert render_column(template, pyarrow.array(tweets), pyarrow.array(TARGETS[:3])).to_pylist()[1] is None
+
+
+def test_mismatched_columns_and_missing_examples_raise():
+    template = get_template("PStance", "qwen2", "zero_shot")
+    with pytest.raises(ValueError, match="different lengths"):
+        render_column(template, TWEETS, TARGETS[:2])
+    with pytest.raises(ValueError, match="examples"):
+        render_prompts("PStance", "qwen2", TWEETS, TARGETS, "few_shot")
@@ -0,0 +1,83 @@
+import os
+import json
+
+import pytest
+
+from checkpoints import CHECKPOINT_SUFFIX, Checkpoint
+from example_sampling import RowRandom
+from generate_few_shot_prompts import generate_few_shot_prompts
+from output_writers import output_filename
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _interrupt_after(monkeypatch, rows):
+    update = Checkpoint.update
+
+    def interrupting_update(self, writer):
+        update(self, writer)
+        if writer.count == rows:
+            raise Interrupted()
+
+    monkeypatch.setattr(Checkpoint, "update", interrupting_update)
+
+
+def _generate(pstance_dir, output_dir, **options):
+    return generate_few_shot_prompts(pstance_dir, output_dir, "PStance", "qwen2", "trump", per_row_examples=True,
+                                     **options)
+
+
+@pytest.mark.parametrize("output_format", ["json", "jsonl", "msgpack"])
+def test_resumed_run_matches_an_uninterrupted_run(pstance_dir, tmp_path, monkeypatch, output_format):
+    if output_format == "msgpack":
+        pytest.importorskip("msgpack")
+    output_dir = str(tmp_path / "resumed")
+    with monkeypatch.context() as patch:
+        _interrupt_after(patch, 3)
+        with pytest.raises(Interrupted):
+            _generate(pstance_dir, output_dir, output_format=output_format, checkpoint_every=2)
+
+    output_file = output_filename(os.path.join(output_dir, "few_shot", "PStance_qwen2_trump_few_shot_prompts"), output_format)
+    with open(output_file + CHECKPOINT_SUFFIX, encoding="utf-8") as f:
+        stored = json.load(f)
+    assert stored["rows"] == 2
+
+    # Unseeded, so the resumed run has to take the interrupted run's seed from the checkpoint
+    resumed = _generate(pstance_dir, output_dir, output_format=output_format, checkpoint_every=2, resume=True)
+    expected = _generate(pstance_dir, str(tmp_path / "complete"), output_format=output_format, seed=stored["seed"])
+
+    assert resumed == output_file
+    assert not os.path.exists(output_file + CHECKPOINT_SUFFIX)
+    with open(resumed, "rb") as f, open(expected, "rb") as g:
+        assert f.read() == g.read()
+
+
+def test_mismatched_checkpoint_restarts_the_output(pstance_dir, tmp_path, monkeypatch, capfd):
+    output_dir = str(tmp_path / "output")
+    with monkeypatch.context() as patch:
+        _interrupt_after(patch, 3)
+        with pytest.raises(Interrupted):
+            _generate(pstance_dir, output_dir, seed=0, checkpoint_every=2)
+
+    resumed = _generate(pstance_dir, output_dir, seed=1, resume=True)
+    expected = _generate(pstance_dir, str(tmp_path / "complete"), seed=1)
+
+    assert "does not match this run" in capfd.readouterr().out
+    with open(resumed, "rb") as f, open(expected, "rb") as g:
+        assert f.read() == g.read()
+
+
+def test_checkpoints_reject_compressed_outputs(pstance_dir, tmp_path):
+    with pytest.raises(ValueError, match="uncompressed"):
+        _generate(pstance_dir, str(tmp_path), output_format="jsonl", compression="gzip", checkpoint_every=2)
+
+
+def test_row_random_depends_only_on_seed_and_row():
+    first, second = RowRandom(7), RowRandom(7)
+    draws = [first.for_row(row).random() for row in range(5)]
+
+    assert [second.for_row(row).random() for row in reversed(range(5))] == draws[::-1]
+    assert len(set(draws)) == 5
+    assert RowRandom(8).for_row(0).random() != draws[0]
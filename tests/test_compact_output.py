@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from compact_output import CompactPromptFile, CompactWriter
+from generate_few_shot_prompts import generate_few_shot_prompts
+from output_writers import output_filename, read_rows
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_compact_output_round_trips_the_json_rows(pstance_dir, tmp_path, compression):
+    base = os.path.join(str(tmp_path), "few_shot", "PStance_qwen2_trump_few_shot_prompts")
+    outputs = {}
+    for output_format, output_compression in (("json", None), ("compact", compression)):
+        generate_few_shot_prompts(pstance_dir, str(tmp_path), "PStance", "qwen2", "trump", seed=0,
+                                  per_row_examples=True, output_format=output_format, compression=output_compression,
+                                  tokenizer="approx", max_tokens=150)
+        outputs[output_format] = output_filename(base, output_format, output_compression)
+
+    expected = list(read_rows(outputs["json"], "json"))
+    assert any(row["tweet_truncated"] or row["examples_used"] < 3 for row in expected)
+    assert list(read_rows(outputs["compact"], "compact", compression)) == expected
+    assert os.path.getsize(outputs["compact"]) < os.path.getsize(outputs["json"])
+
+    prompts = CompactPromptFile(outputs["compact"], compression)
+    assert len(prompts) == len(expected)
+    assert prompts[-1] == expected[-1]
+    assert prompts.prompt(2) == expected[2]["prompt"]
+
+
+def test_tweets_that_repeat_template_text_are_rebuilt_exactly(tmp_path):
+    rows = [
+        {"dataset": "d", "tweet": "Tweet", "target": "T", "prompt": "Tweet: Tweet\nTarget: T\n\nAnswer for T"},
+        {"dataset": "d", "tweet": "", "target": "", "prompt": "Tweet: \nTarget: \n\nAnswer for "},
+        {"dataset": "d", "tweet": "x", "target": "y", "prompt": "Tweet: x\nTarget: y\n\nAnswer for y", "prompt_tokens": 9},
+    ]
+    path = str(tmp_path / "prompts.compact.json")
+    writer = CompactWriter(path)
+    for row in rows:
+        writer.write(row)
+    writer.close()
+    rebuilt = list(CompactPromptFile(path))
+    assert [row["prompt"] for row in rebuilt] == [row["prompt"] for row in rows]
+    assert rebuilt[2]["prompt_tokens"] == 9
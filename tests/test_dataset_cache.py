@@ -0,0 +1,35 @@
+from dataset_cache import cache_path, parse_table, read_table
+
+
+def test_cached_table_matches_parsed_table(tmp_path):
+    path = tmp_path / "test.tsv"
+    # Invalid UTF-8 bytes in adjacent values would form a valid character if decoded together
+    path.write_bytes(
+        b"Tweet\tTarget\n"
+        b"caf\xc3\tAtheism\n"
+        b"\xa9t\xc3\xa9\tFeminist Movement\n"
+        b"broken \xff bytes\t\n"
+        b"plain\tHillary Clinton\n"
+    )
+    parsed = parse_table(str(path), "\t")
+
+    first = read_table(str(path), "\t")
+    assert (tmp_path / ".cache").is_dir() and cache_path(str(path)).endswith(".npz")
+    cached = read_table(str(path), "\t")
+
+    for table in (first, cached):
+        assert table.fieldnames == parsed.fieldnames
+        assert table.columns == parsed.columns
+    assert cached.columns["Tweet"][0] == "caf\udcc3"
+    assert cached.columns["Tweet"][1] == "\udca9té"
+
+
+def test_cache_entry_is_rebuilt_when_the_file_changes(tmp_path):
+    path = tmp_path / "test.csv"
+    path.write_text("Tweet,Target\nfirst,Atheism\n", encoding="utf-8")
+    assert read_table(str(path), ",").columns["Tweet"] == ["first"]
+
+    path.write_text("Tweet,Target\nsecond row,Atheism\nthird,\n", encoding="utf-8")
+    table = read_table(str(path), ",")
+    assert table.columns == {"Tweet": ["second row", "third"], "Target": ["Atheism", ""]}
+    assert list(table.rows()) == [{"Tweet": "second row", "Target": "Atheism"}, {"Tweet": "third", "Target": ""}]
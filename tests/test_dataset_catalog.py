@@ -0,0 +1,51 @@
+import os
+import json
+
+import pytest
+
+from conftest import TEST_ROWS, write_csv
+from dataset_catalog import CATALOG_NAME, find_dataset_files, open_catalog
+
+
+def test_catalog_finds_candidates_and_splits(pstance_candidates_dir):
+    data_dir = os.path.dirname(pstance_candidates_dir)
+    catalog = open_catalog(data_dir, refresh=True)
+
+    assert catalog.dataset_names() == ["PStance"]
+    assert catalog.candidates("PStance") == ["bernie", "biden", "trump"]
+    assert catalog.files("PStance", "val", "Biden") == [os.path.join(data_dir, "PStance", "raw_val_biden.csv")]
+    assert catalog.column_mapping("PStance", "raw_test_trump.csv") == {"tweet": "Tweet", "target": "Target", "stance": "Stance"}
+    assert catalog.describe("PStance", "raw_test_trump.csv", count_rows=True)["rows"] == len(TEST_ROWS)
+
+
+def test_find_dataset_files_uses_the_stored_catalog(pstance_candidates_dir):
+    example_files, test_files = find_dataset_files(pstance_candidates_dir, "PStance", "trump")
+
+    assert example_files == [os.path.join(pstance_candidates_dir, "raw_val_trump.csv")]
+    assert test_files == [os.path.join(pstance_candidates_dir, "raw_test_trump.csv")]
+    with open(os.path.join(os.path.dirname(pstance_candidates_dir), CATALOG_NAME), encoding="utf-8") as f:
+        stored = json.load(f)
+    assert stored["datasets"]["PStance"]["candidates"] == ["bernie", "biden", "trump"]
+
+    with pytest.raises(ValueError, match="Candidate name"):
+        find_dataset_files(pstance_candidates_dir, "PStance")
+    with pytest.raises(ValueError, match="warren"):
+        find_dataset_files(pstance_candidates_dir, "PStance", "warren")
+
+
+def test_catalog_rescans_changed_directory(pstance_candidates_dir):
+    data_dir = os.path.dirname(pstance_candidates_dir)
+    catalog = open_catalog(data_dir, refresh=True)
+    assert "warren" not in catalog.candidates("PStance")
+
+    for split in ("train", "val", "test"):
+        write_csv(os.path.join(pstance_candidates_dir, f"raw_{split}_warren.csv"), TEST_ROWS)
+    # "test" is a substring of "contest", not a word of the file name
+    write_csv(os.path.join(pstance_candidates_dir, "contest.csv"), TEST_ROWS)
+    stat = os.stat(pstance_candidates_dir)
+    os.utime(pstance_candidates_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert "warren" in open_catalog(data_dir).candidates("PStance")
+    test_files = catalog.files("PStance", "test")
+    assert os.path.join(pstance_candidates_dir, "raw_test_warren.csv") in test_files
+    assert os.path.join(pstance_candidates_dir, "contest.csv") not in test_files
@@ -0,0 +1,93 @@
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from conftest import TRAIN_ROWS
+from example_sampling import LabelBuckets, with_sampled_examples
+from generate_few_shot_prompts import generate_few_shot_prompts
+from output_writers import read_rows
+from template_compiler import ExampleSetPool
+from template_registry import get_template
+
+LABELS = ["AGAINST"] * 6 + ["FAVOR"] * 3 + ["NONE"] * 1
+
+
+def _label_counts(example_ids):
+    return Counter(LABELS[i] for i in example_ids)
+
+
+def test_balanced_draws_cover_every_label():
+    buckets = LabelBuckets(LABELS)
+    rng = random.Random(0)
+    for _ in range(50):
+        example_ids = buckets.sample(3, rng, "balanced")
+        assert len(set(example_ids)) == 3
+        assert _label_counts(example_ids) == {"AGAINST": 1, "FAVOR": 1, "NONE": 1}
+
+
+def test_balanced_quota_a_label_cannot_fill_goes_to_the_others():
+    buckets = LabelBuckets(LABELS)
+    for _ in range(20):
+        counts = _label_counts(buckets.sample(6, random.Random(), "balanced"))
+        # NONE has a single row; its missing row goes to the label with the most rows left
+        assert counts == {"AGAINST": 3, "FAVOR": 2, "NONE": 1}
+
+
+def test_stratified_draws_follow_the_label_shares():
+    buckets = LabelBuckets(LABELS)
+    assert buckets.quotas(5, "stratified", random.Random(0)) == {"AGAINST": 3, "FAVOR": 2, "NONE": 0}
+    assert _label_counts(buckets.sample(10, random.Random(0), "stratified")) == Counter(LABELS)
+
+
+def test_random_draws_match_random_sample():
+    buckets = LabelBuckets(LABELS)
+    assert buckets.sample(3, random.Random(7)) == tuple(random.Random(7).sample(range(len(LABELS)), 3))
+    with pytest.raises(ValueError):
+        buckets.sample(11, random.Random(0))
+
+
+def test_seeded_per_row_draws_are_reproducible():
+    buckets = LabelBuckets(LABELS)
+    pairs = [(f"tweet {i}", "target") for i in range(20)]
+    first = list(with_sampled_examples(pairs, buckets, 3, "balanced", random.Random(1)))
+    second = list(with_sampled_examples(pairs, buckets, 3, "balanced", random.Random(1)))
+    assert first == second
+    assert len({example_ids for _, _, example_ids in first}) > 1
+
+
+# The validation file of the fixture dataset holds its few-shot examples
+EXAMPLES = [{"tweet": tweet, "target": target, "label": label} for tweet, target, label in TRAIN_ROWS[1:]]
+
+
+def _generate(pstance_dir, output_dir, **options):
+    generate_few_shot_prompts(pstance_dir, output_dir, "PStance", "qwen2", "trump", seed=0, **options)
+    return list(read_rows(os.path.join(output_dir, "few_shot", "PStance_qwen2_trump_few_shot_prompts.json"), "json"))
+
+
+def test_rows_rotate_through_a_pool_of_example_sets(pstance_dir, tmp_path):
+    rows = _generate(pstance_dir, str(tmp_path), example_sets=2, example_set_assignment="rotate")
+    template = get_template("PStance", "qwen2", "few_shot")
+
+    assert [row["example_set"] for row in rows] == [0, 1, 0, 1, 0]
+    sets = {row["example_set"]: tuple(row["example_ids"]) for row in rows}
+    assert all(tuple(row["example_ids"]) == sets[row["example_set"]] for row in rows)
+    for row in rows:
+        examples = [EXAMPLES[i] for i in row["example_ids"]]
+        assert row["prompt"] == template(row["tweet"], row["target"], examples)
+
+
+def test_random_assignment_is_seeded(pstance_dir, tmp_path):
+    first = _generate(pstance_dir, str(tmp_path / "first"), example_sets=3, example_set_assignment="random")
+    second = _generate(pstance_dir, str(tmp_path / "second"), example_sets=3, example_set_assignment="random")
+    assert first == second
+    assert all(0 <= row["example_set"] < 3 for row in first)
+
+
+def test_example_set_pool_compiles_each_set_once():
+    template = get_template("PStance", "qwen2", "few_shot")
+    pool = ExampleSetPool(template, EXAMPLES, [(0, 1, 2), (4, 3, 2)])
+    assert len(pool) == 2
+    assert pool.compiled(1) is pool.compiled(1)
+    assert pool.compiled(1).render("t", "x") == template("t", "x", [EXAMPLES[4], EXAMPLES[3], EXAMPLES[2]])
@@ -0,0 +1,40 @@
+import os
+import json
+
+from generate_matrix import generate_matrix, load_sweep_spec, plan_sweep
+from generate_zero_shot_prompts import generate_zero_shot_prompts
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "data")
+
+
+def test_candidate_list_applies_only_to_datasets_that_have_it(tmp_path, capsys):
+    spec = {"datasets": ["PStance", "semeval2016"], "models": ["qwen2"], "candidates": ["bernie", "obama"]}
+    jobs = plan_sweep(spec, DATA_DIR, str(tmp_path))
+    assert [(job["dataset"], job["candidate"]) for job in jobs] == [("PStance", "bernie"), ("semeval2016", None)]
+    assert "PStance has no files for candidate(s) obama" in capsys.readouterr().out
+
+
+def test_sweep_spec_formats_load_the_same(tmp_path):
+    spec = {"datasets": ["semeval2016"], "models": ["qwen2", "llama2"], "shots": [0, 3], "seeds": [0]}
+    (tmp_path / "sweep.json").write_text(json.dumps(spec), encoding="utf-8")
+    (tmp_path / "sweep.toml").write_text(
+        'datasets = ["semeval2016"]\nmodels = ["qwen2", "llama2"]\nshots = [0, 3]\nseeds = [0]\n', encoding="utf-8"
+    )
+    assert load_sweep_spec(str(tmp_path / "sweep.json")) == spec
+    assert load_sweep_spec(str(tmp_path / "sweep.toml")) == spec
+
+
+def test_matrix_outputs_match_the_single_combination_script(pstance_candidates_dir, tmp_path):
+    data_dir = os.path.dirname(pstance_candidates_dir)
+    spec = {"datasets": ["PStance"], "models": ["qwen2", "llama2"], "candidates": ["trump", "biden"], "shots": [0]}
+    summary = generate_matrix(spec, data_dir, str(tmp_path / "matrix"), workers=2)
+    assert summary["rows"] == 4 * 5
+
+    for model_name in ("qwen2", "llama2"):
+        for candidate_name in ("trump", "biden"):
+            input_file = os.path.join(pstance_candidates_dir, f"raw_test_{candidate_name}.csv")
+            generate_zero_shot_prompts(input_file, str(tmp_path / "single"), "PStance", model_name, candidate_name)
+            name = f"zero_shot/PStance_{model_name}_{candidate_name}_prompts.json"
+            with open(tmp_path / "matrix" / name, "rb") as matrix_file, open(tmp_path / "single" / name, "rb") as single_file:
+                assert matrix_file.read() == single_file.read()
@@ -0,0 +1,67 @@
+import json
+import os
+
+from conftest import TEST_ROWS, write_csv
+from generate_few_shot_prompts import generate_few_shot_prompts
+from generate_zero_shot_prompts import generate_zero_shot_prompts
+from incremental import FULL, MANIFEST_NAME, PATCH, SKIP, Manifest, output_key
+
+
+def test_parallel_candidates_all_recorded_in_manifest(pstance_candidates_dir, tmp_path, capfd):
+    output_dir = str(tmp_path / "output")
+    arguments = dict(dataset_dir=pstance_candidates_dir, output_dir=output_dir, dataset_name="PStance",
+                     model_name="qwen2", candidate_name="all", candidate_workers=3, seed=0, incremental=True)
+    generate_few_shot_prompts(**arguments)
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), encoding="utf-8") as f:
+        outputs = json.load(f)["outputs"]
+    assert sorted(outputs) == [
+        f"few_shot/PStance_qwen2_{candidate}_few_shot_prompts.json" for candidate in ("bernie", "biden", "trump")
+    ]
+
+    capfd.readouterr()
+    generate_few_shot_prompts(**arguments)
+    assert capfd.readouterr().out.count("is up to date") == 3
+
+
+def test_changed_rows_are_rendered_and_the_rest_reused(pstance_dir, tmp_path, capsys):
+    input_file = os.path.join(pstance_dir, "raw_test_trump.csv")
+    output_dir = str(tmp_path / "output")
+    output_file = os.path.join(output_dir, "zero_shot", "PStance_qwen2_trump_prompts.json")
+    generate_zero_shot_prompts(input_file, output_dir, "PStance", "qwen2", "trump", incremental=True)
+    generate_zero_shot_prompts(input_file, output_dir, "PStance", "qwen2", "trump", incremental=True)
+    assert "is up to date" in capsys.readouterr().out
+
+    rows = list(TEST_ROWS)
+    rows[2] = ("A changed tweet", "Donald Trump", "NONE")
+    write_csv(input_file, rows + [("A new tweet", "Donald Trump", "FAVOR")])
+    generate_zero_shot_prompts(input_file, output_dir, "PStance", "qwen2", "trump", incremental=True)
+    assert "Reused 4 unchanged rows of the previous output and rendered 2" in capsys.readouterr().out
+
+    fresh_dir = str(tmp_path / "fresh")
+    generate_zero_shot_prompts(input_file, fresh_dir, "PStance", "qwen2", "trump")
+    fresh_file = os.path.join(fresh_dir, "zero_shot", os.path.basename(output_file))
+    with open(output_file, "rb") as patched, open(fresh_file, "rb") as fresh:
+        assert patched.read() == fresh.read()
+
+
+def test_manifest_plan(tmp_path):
+    output_file = str(tmp_path / "zero_shot" / "out.json")
+    os.makedirs(os.path.dirname(output_file))
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("[]")
+    key = output_key(len, params=1)
+    manifest = Manifest(str(tmp_path))
+    assert manifest.plan(output_file, {"in.csv": "a"}, key) == (FULL, None)
+
+    manifest.record(output_file, {"in.csv": "a"}, key, ["r1", "r2"])
+    manifest.save()
+    manifest = Manifest(str(tmp_path))
+    assert manifest.plan(output_file, {"in.csv": "a"}, key) == (SKIP, None)
+    assert manifest.plan(output_file, {"in.csv": "b"}, key) == (PATCH, ["r1", "r2"])
+    assert manifest.plan(output_file, {"in.csv": "a"}, output_key(len, params=2)) == (FULL, None)
+
+    # An output changed since it was recorded is regenerated
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("[ ]")
+    assert manifest.plan(output_file, {"in.csv": "a"}, key) == (FULL, None)
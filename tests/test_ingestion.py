@@ -0,0 +1,67 @@
+import os
+import json
+
+import pytest
+
+import generate_zero_shot_prompts as zero_shot
+from conftest import TEST_ROWS, write_csv
+from ingestion import REJECTS_SUFFIX, RejectLog, iter_records
+
+
+def _failing_render_rows(*args, **kwargs):
+    raise RuntimeError("rendering failed")
+
+
+def test_failed_run_leaves_no_reject_file(tmp_path, monkeypatch):
+    input_file = str(tmp_path / "raw_test_trump.csv")
+    write_csv(input_file, TEST_ROWS + [("", "Donald Trump", "NONE")])
+    output_dir = str(tmp_path / "output")
+    zero_shot.generate_zero_shot_prompts(input_file, output_dir, "PStance", "qwen2", "trump")
+    rejects_file = os.path.join(output_dir, "zero_shot", "PStance_qwen2_trump_prompts" + REJECTS_SUFFIX)
+    with open(rejects_file, encoding="utf-8") as f:
+        previous = f.read()
+    assert previous.count("\n") == 1
+
+    monkeypatch.setattr(zero_shot, "render_rows", _failing_render_rows)
+    with pytest.raises(RuntimeError):
+        zero_shot.generate_zero_shot_prompts(input_file, output_dir, "PStance", "qwen2", "trump")
+    assert not os.path.exists(rejects_file + ".tmp")
+    with open(rejects_file, encoding="utf-8") as f:
+        assert f.read() == previous
+
+
+INVALID_ROWS = (
+    b"Tweet,Target,Stance\n"
+    b"good tweet,Donald Trump,FAVOR\n"
+    b"bad \xff byte,Donald Trump,AGAINST\n"
+    b",Donald Trump,NONE\n"
+    b"too short\n"
+    b"\n"
+    b"another good tweet,Donald Trump,NONE\n"
+)
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_invalid_rows_are_rejected_and_reading_continues(tmp_path, use_cache):
+    path = tmp_path / "raw_test_trump.csv"
+    path.write_bytes(INVALID_ROWS)
+    rejects = RejectLog(str(tmp_path / "out") + REJECTS_SUFFIX)
+    with rejects:
+        records = list(iter_records(str(path), ",", ("tweet", "target"), rejects, use_cache))
+
+    assert records == [("good tweet", "Donald Trump"), ("another good tweet", "Donald Trump")]
+    assert rejects.counts == {"invalid utf-8": 1, "missing tweet": 1, "missing fields": 1}
+    with open(rejects.path, encoding="utf-8") as f:
+        rejected = [json.loads(line) for line in f]
+    assert [(row["row"], row["reason"]) for row in rejected] == [
+        (2, "invalid utf-8"), (3, "missing tweet"), (4, "missing fields"),
+    ]
+    # Undecodable bytes are kept, escaped, in the reject file
+    assert rejected[0]["values"][0] == "bad \udcff byte"
+
+
+def test_missing_column_is_an_error(tmp_path):
+    path = tmp_path / "test.csv"
+    path.write_text("Text,Target\nhello,Atheism\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="'tweet'"):
+        list(iter_records(str(path), ",", ("tweet", "target"), RejectLog()))
@@ -0,0 +1,86 @@
+import os
+import json
+
+import pytest
+
+from generate_zero_shot_prompts import generate_zero_shot_prompts
+from output_writers import PromptWriter, output_filename, read_rows, resolve_json_encoder, serialize_row
+
+
+def generate(pstance_dir, output_dir, output_format="json", **options):
+    input_file = os.path.join(pstance_dir, "raw_test_trump.csv")
+    generate_zero_shot_prompts(input_file, output_dir, "PStance", "qwen2", "trump", output_format=output_format,
+                               **options)
+    base = os.path.join(output_dir, "zero_shot", "PStance_qwen2_trump_prompts")
+    return output_filename(base, output_format, options.get("compression"))
+
+
+def test_jsonl_output_has_the_rows_of_the_json_output(pstance_dir, tmp_path):
+    json_file = generate(pstance_dir, str(tmp_path), "json")
+    jsonl_file = generate(pstance_dir, str(tmp_path), "jsonl")
+
+    with open(json_file, encoding="utf-8") as f:
+        expected = json.load(f)
+    with open(jsonl_file, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(expected) == 5
+    assert [json.loads(line) for line in lines] == expected
+
+
+def test_compressed_jsonl_round_trip(pstance_dir, tmp_path):
+    expected = list(read_rows(generate(pstance_dir, str(tmp_path), "json"), "json"))
+    gzip_file = generate(pstance_dir, str(tmp_path), "jsonl", compression="gzip")
+    assert gzip_file.endswith(".jsonl.gz")
+    assert list(read_rows(gzip_file, "jsonl", "gzip")) == expected
+
+
+@pytest.mark.parametrize("output_format", ["json", "json_min"])
+def test_failed_run_does_not_replace_the_previous_output(tmp_path, output_format):
+    path = output_filename(str(tmp_path / "prompts"), output_format)
+    with PromptWriter(path, output_format) as writer:
+        writer.write({"prompt": "old"})
+    with open(path, "rb") as f:
+        previous = f.read()
+
+    with pytest.raises(RuntimeError):
+        with PromptWriter(path, output_format) as writer:
+            writer.write({"prompt": "new"})
+            raise RuntimeError("rendering failed")
+
+    assert not os.path.exists(path + ".tmp")
+    with open(path, "rb") as f:
+        assert f.read() == previous
+
+
+_FORMAT_PACKAGES = {"parquet": "pyarrow", "msgpack": "msgpack"}
+
+
+@pytest.mark.parametrize("output_format", ["json_min", "jsonl", "compact", "parquet", "msgpack"])
+def test_every_format_reads_back_the_json_rows(pstance_dir, tmp_path, output_format):
+    if output_format in _FORMAT_PACKAGES:
+        pytest.importorskip(_FORMAT_PACKAGES[output_format])
+    options = {"count_tokens": True, "tokenizer": "approx"}
+    expected = list(read_rows(generate(pstance_dir, str(tmp_path / "json"), "json", **options), "json"))
+    assert all(isinstance(row["prompt_tokens"], int) for row in expected)
+
+    output_file = generate(pstance_dir, str(tmp_path / output_format), output_format, **options)
+    assert list(read_rows(output_file, output_format)) == expected
+
+
+@pytest.mark.parametrize("encoder", ["json", "orjson", "msgspec"])
+@pytest.mark.parametrize("output_format", ["json_min", "jsonl"])
+def test_json_encoders_write_the_same_bytes(pstance_dir, tmp_path, output_format, encoder):
+    if encoder != "json":
+        pytest.importorskip(encoder)
+    expected_file = generate(pstance_dir, str(tmp_path / "json"), output_format, json_encoder="json")
+    output_file = generate(pstance_dir, str(tmp_path / encoder), output_format, json_encoder=encoder)
+
+    with open(expected_file, "rb") as f, open(output_file, "rb") as g:
+        assert g.read() == f.read()
+    row = {"tweet": "Café “quotes” \\ \"escaped\"\n\U0001f600", "example_ids": [3, 1], "tweet_truncated": False}
+    assert serialize_row(output_format, row, encoder) == serialize_row(output_format, row, "json")
+
+
+def test_unknown_json_encoder_raises():
+    with pytest.raises(ValueError, match="Unsupported JSON encoder"):
+        resolve_json_encoder("ujson")
@@ -0,0 +1,36 @@
+import os
+
+from generate_few_shot_prompts import generate_few_shot_prompts
+from generate_zero_shot_prompts import generate_zero_shot_prompts
+from parallel import WorkerStats, ordered_map
+
+
+def _square_chunk(chunk):
+    return [value * value for value in chunk]
+
+
+def test_ordered_map_keeps_input_order():
+    stats = WorkerStats()
+    results = list(ordered_map(_square_chunk, iter(range(50)), workers=3, chunk_size=4, stats=stats))
+    assert results == [value * value for value in range(50)]
+    assert sum(stats.rows.values()) == 50
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_workers_write_the_same_bytes_as_one_process(pstance_dir, tmp_path):
+    input_file = os.path.join(pstance_dir, "raw_test_trump.csv")
+    outputs = []
+    for workers in (1, 3):
+        output_dir = str(tmp_path / f"workers{workers}")
+        generate_zero_shot_prompts(input_file, output_dir, "PStance", "qwen2", "trump", workers=workers, batch_size=2)
+        generate_few_shot_prompts(pstance_dir, output_dir, "PStance", "qwen2", "trump", workers=workers, batch_size=2,
+                                  seed=0, per_row_examples=True)
+        outputs.append([
+            _read(os.path.join(output_dir, "zero_shot", "PStance_qwen2_trump_prompts.json")),
+            _read(os.path.join(output_dir, "few_shot", "PStance_qwen2_trump_few_shot_prompts.json")),
+        ])
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,56 @@
+import os
+import pstats
+
+from generate_few_shot_prompts import generate_few_shot_prompts
+from generate_zero_shot_prompts import generate_zero_shot_prompts
+from profiling import STAGES, RunProfile
+
+
+def test_profiled_run_reports_stages_and_rows(pstance_dir, tmp_path, capfd):
+    plain = generate_few_shot_prompts(pstance_dir, str(tmp_path / "plain"), "PStance", "qwen2", "trump", seed=0)
+    with open(plain, "rb") as f:
+        expected = f.read()
+
+    stats_path = str(tmp_path / "stats" / "run.prof")
+    summary = generate_few_shot_prompts(pstance_dir, str(tmp_path / "profiled"), "PStance", "qwen2", "trump", seed=0,
+                                        profile_stats=stats_path)
+
+    assert set(summary["stages"]) == set(STAGES)
+    assert summary["total_seconds"] >= sum(summary["stages"].values()) - 1e-3
+    assert summary["rows"]["written"] == 5 and summary["rows"]["rejected"] == 0
+    assert summary["stats_file"] == stats_path
+    assert pstats.Stats(stats_path).total_calls > 0
+    assert "Profile of" in capfd.readouterr().out
+    # Profiling does not change the output
+    with open(summary["output_file"], "rb") as f:
+        assert f.read() == expected
+
+
+def test_unprofiled_run_returns_the_output_file(pstance_dir, tmp_path):
+    input_file = os.path.join(pstance_dir, "raw_test_trump.csv")
+    output_file = generate_zero_shot_prompts(input_file, str(tmp_path), "PStance", "qwen2", "trump")
+    assert isinstance(output_file, str) and os.path.isfile(output_file)
+
+    summary = generate_zero_shot_prompts(input_file, str(tmp_path), "PStance", "qwen2", "trump", profile=True)
+    assert summary["output_file"] == output_file and summary["rows"]["written"] == 5
+
+
+def test_time_is_attributed_to_the_innermost_stage(monkeypatch):
+    # Each reading of the fake clock is one second after the previous one
+    clock = iter(range(100))
+    monkeypatch.setattr("profiling.time.perf_counter", lambda: next(clock))
+    profile = RunProfile()
+    profile.start()
+
+    with profile.stage("write"):
+        items = list(profile.timed("read", iter(range(3))))
+    summary = profile.summary("out.json")
+
+    assert items == [0, 1, 2]
+    # Producing the 3 items and the final StopIteration
+    assert summary["stages"]["read"] == 4
+    # From entering the stage to the first item, between items, and from the last item to leaving the stage
+    assert summary["stages"]["write"] == 5
+    assert summary["stages"]["setup"] == 2
+    assert summary["total_seconds"] >= sum(summary["stages"].values())
+    assert not RunProfile(enabled=False) and RunProfile(enabled=False).result("out.json") == "out.json"
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from generate_zero_shot_prompts import generate_zero_shot_prompts
+from output_writers import INDEX_SUFFIX, read_rows
+from prompt_index import IndexedPromptFile
+
+
+def test_index_gives_random_access_to_rows(pstance_dir, tmp_path):
+    input_file = os.path.join(pstance_dir, "raw_test_trump.csv")
+    generate_zero_shot_prompts(input_file, str(tmp_path), "PStance", "qwen2", "trump", output_format="jsonl", index=True)
+    path = os.path.join(str(tmp_path), "zero_shot", "PStance_qwen2_trump_prompts.jsonl")
+    rows = list(read_rows(path, "jsonl"))
+
+    with IndexedPromptFile(path) as prompts:
+        assert len(prompts) == len(rows) == 5
+        assert prompts[3] == rows[3]
+        assert prompts[-1] == rows[-1]
+        assert prompts[1:4] == rows[1:4]
+        assert prompts[::2] == rows[::2]
+        assert list(prompts) == rows
+        with pytest.raises(IndexError):
+            prompts[5]
+
+
+def test_index_of_another_file_is_rejected(pstance_dir, tmp_path):
+    input_file = os.path.join(pstance_dir, "raw_test_trump.csv")
+    generate_zero_shot_prompts(input_file, str(tmp_path), "PStance", "qwen2", "trump", output_format="jsonl", index=True)
+    path = os.path.join(str(tmp_path), "zero_shot", "PStance_qwen2_trump_prompts.jsonl")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("{}\n")
+    with pytest.raises(ValueError, match="does not match"):
+        IndexedPromptFile(path)
+    os.remove(path + INDEX_SUFFIX)
+    with pytest.raises(OSError):
+        IndexedPromptFile(path)
@@ -0,0 +1,47 @@
+import pytest
+
+from generate_few_shot_prompts import generate_few_shot_prompts
+from output_writers import read_rows
+from prompt_ordering import order_items
+from template_compiler import compile_template
+from template_registry import get_template
+
+
+def _rows(pstance_dir, output_dir, **options):
+    output_file = generate_few_shot_prompts(pstance_dir, output_dir, "PStance", "qwen2", "trump", seed=0,
+                                            per_row_examples=True, **options)
+    return list(read_rows(output_file, "json"))
+
+
+@pytest.mark.parametrize("order", ["prefix", "prefix_length"])
+def test_reordered_rows_map_back_to_input_order(pstance_dir, tmp_path, order):
+    expected = _rows(pstance_dir, str(tmp_path / "input"))
+    rows = _rows(pstance_dir, str(tmp_path / order), order=order, length_bucket=16)
+
+    assert sorted(row["row_index"] for row in rows) == list(range(len(expected)))
+    restored = sorted(rows, key=lambda row: row["row_index"])
+    assert [{key: value for key, value in row.items() if key != "row_index"} for row in restored] == expected
+    # Rows with the same examples (and so the same prompt prefix) are adjacent, in example order
+    assert [row["example_ids"] for row in rows] == sorted(row["example_ids"] for row in expected)
+    # Reordering gives the same output with worker processes
+    assert _rows(pstance_dir, str(tmp_path / "workers"), order=order, length_bucket=16, workers=2) == rows
+
+
+def test_order_items_groups_by_prefix_then_length():
+    compiled = compile_template(get_template("semeval2016", "llama2", "zero_shot"))
+    items = [
+        ("a long tweet about atheism and religion", "Atheism"),
+        ("short", "Hillary Clinton"),
+        ("short", "Atheism"),
+        ("a long tweet about the campaign trail", "Hillary Clinton"),
+        ("mid length tweet", "Atheism"),
+    ]
+
+    prefix = [index for index, _ in order_items(items, compiled, "prefix")]
+    prefix_length = [index for index, _ in order_items(items, compiled, "prefix_length", length_bucket=8)]
+
+    assert order_items(items, compiled) == list(enumerate(items))
+    assert prefix == [0, 2, 4, 1, 3]
+    assert prefix_length == [2, 4, 0, 1, 3]
+    with pytest.raises(ValueError, match="Unknown ordering"):
+        order_items(items, compiled, "length")
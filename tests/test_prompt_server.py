@@ -0,0 +1,123 @@
+import json
+import time
+import asyncio
+import threading
+
+import pytest
+
+from prompt_server import PromptService, _handle_connection, _handle_request
+
+
+REQUEST = {"tweet": "Hello", "target": "Atheism", "dataset": "semeval2016", "model": "qwen2"}
+
+
+def test_unexpected_error_fails_only_its_request(monkeypatch):
+    async def scenario():
+        async with PromptService(max_wait_ms=0) as service:
+            render_batch = service.render_batch
+            calls = []
+
+            def failing_once(requests):
+                calls.append(requests)
+                if len(calls) == 1:
+                    raise OSError("example file is unreadable")
+                return render_batch(requests)
+
+            monkeypatch.setattr(service, "render_batch", failing_once)
+            with pytest.raises(OSError):
+                await asyncio.wait_for(service.render(REQUEST), 5)
+            # The batching task is still running, so the next request is served
+            return await asyncio.wait_for(service.render(REQUEST), 5)
+
+    assert "Hello" in asyncio.run(scenario())
+
+
+def test_unexpected_error_is_a_server_error(monkeypatch):
+    async def scenario():
+        async with PromptService(max_wait_ms=0) as service:
+            monkeypatch.setattr(service, "render_batch", lambda requests: 1 / 0)
+            return await _handle_request(service, "POST", "/render", b'{"tweet": "x"}')
+
+    status, payload = asyncio.run(scenario())
+    assert status == 500
+    assert "ZeroDivisionError" in payload["error"]
+
+
+def test_invalid_request_is_a_bad_request():
+    async def scenario():
+        async with PromptService(max_wait_ms=0) as service:
+            return (
+                await _handle_request(service, "POST", "/render", b'["not an object"]'),
+                await _handle_request(service, "POST", "/render", b'{"tweet": "x"}'),
+            )
+
+    (status, payload), (missing_status, _) = asyncio.run(scenario())
+    assert status == 400
+    assert "JSON object" in payload["error"]
+    assert missing_status == 400
+
+
+def test_internal_type_error_is_a_server_error(monkeypatch):
+    async def scenario():
+        async with PromptService(max_wait_ms=0) as service:
+            monkeypatch.setattr(service, "render_batch", lambda requests: len(None))
+            return await _handle_request(service, "POST", "/render", json.dumps(REQUEST).encode("utf-8"))
+
+    status, payload = asyncio.run(scenario())
+    assert status == 500
+    assert "TypeError" in payload["error"]
+
+
+def test_rendering_does_not_block_the_event_loop(monkeypatch):
+    release = threading.Event()
+
+    async def scenario():
+        async with PromptService(max_wait_ms=0) as service:
+            render_batch = service.render_batch
+
+            def slow_render_batch(requests):
+                release.wait(5)
+                return render_batch(requests)
+
+            monkeypatch.setattr(service, "render_batch", slow_render_batch)
+            start = time.perf_counter()
+            pending = asyncio.ensure_future(service.render(REQUEST))
+            await asyncio.sleep(0.05)
+            status, _ = await _handle_request(service, "GET", "/health", b"")
+            elapsed = time.perf_counter() - start
+            release.set()
+            return status, elapsed, await asyncio.wait_for(pending, 5)
+
+    status, elapsed, prompt = asyncio.run(scenario())
+    assert status == 200
+    assert elapsed < 1
+    assert "Hello" in prompt
+
+
+def test_http_requests_share_a_kept_alive_connection():
+    async def scenario():
+        async with PromptService(max_wait_ms=0) as service:
+            server = await asyncio.start_server(
+                lambda reader, writer: _handle_connection(service, reader, writer), "127.0.0.1", 0
+            )
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            responses = []
+            for payload in (REQUEST, [REQUEST, {**REQUEST, "tweet": "Bye"}]):
+                body = json.dumps(payload).encode("utf-8")
+                writer.write(b"POST /render HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+                status = (await reader.readline()).split()[1]
+                headers = {}
+                while (line := await reader.readline()) != b"\r\n":
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.lower()] = value.strip()
+                responses.append((int(status), json.loads(await reader.readexactly(int(headers["content-length"])))))
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return responses
+
+    (status, single), (list_status, batch) = asyncio.run(scenario())
+    assert status == list_status == 200
+    assert "Hello" in single["prompt"]
+    assert len(batch["prompts"]) == 2 and "Bye" in batch["prompts"][1]
@@ -0,0 +1,45 @@
+import os
+
+from generate_few_shot_prompts import generate_few_shot_prompts
+from output_writers import read_rows
+from retrieval import SimilarityIndex, index_path, load_or_build_index
+
+
+TWEETS = ["the border wall", "taxes and the border", "the wall is rising", "healthcare for all"]
+TARGETS = ["Trump", "Trump", "Trump", "Bernie"]
+
+
+def test_target_with_fewer_than_k_examples_gets_only_its_own():
+    index = SimilarityIndex.build(TWEETS, TARGETS, n_features=2 ** 10)
+    # The query is closest to the other target's examples, which must not fill the remaining slots
+    assert index.query(["the border wall"], ["Bernie"], k=3) == [(3,)]
+
+
+def test_unknown_target_falls_back_to_all_examples():
+    index = SimilarityIndex.build(TWEETS, TARGETS, n_features=2 ** 10)
+    assert len(index.query(["the border wall"], ["Biden"], k=3)[0]) == 3
+    assert index.query(["the border wall"], None, k=2) == [(0, 1)]
+
+
+def test_stored_index_is_reused_until_the_example_file_changes(tmp_path):
+    example_file = tmp_path / "examples.csv"
+    example_file.write_text("stand-in for the example file", encoding="utf-8")
+    built = load_or_build_index(str(example_file), TWEETS, TARGETS, n_features=2 ** 10)
+    assert os.path.isfile(index_path(str(example_file)))
+
+    loaded = load_or_build_index(str(example_file), TWEETS, TARGETS, n_features=2 ** 10)
+    assert loaded.query(["the border wall"], ["Trump"], k=2) == built.query(["the border wall"], ["Trump"], k=2)
+
+    example_file.write_text("a different example file", encoding="utf-8")
+    rebuilt = load_or_build_index(str(example_file), ["healthcare for all"], ["Bernie"], n_features=2 ** 10)
+    assert rebuilt.targets == ["Bernie"]
+
+
+def test_similar_examples_come_from_the_row_target(pstance_candidates_dir, tmp_path):
+    output_dir = str(tmp_path / "output")
+    generate_few_shot_prompts(pstance_candidates_dir, output_dir, "PStance", "qwen2", "biden",
+                              example_selection="similar", examples_count=2)
+    rows = list(read_rows(os.path.join(output_dir, "few_shot", "PStance_qwen2_biden_few_shot_prompts.json"), "json"))
+    assert rows and all(len(row["example_ids"]) == 2 for row in rows)
+    # The last test tweet, about tariffs, is closest to the last example tweet
+    assert rows[-1]["example_ids"][0] == 4
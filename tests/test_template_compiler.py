@@ -0,0 +1,59 @@
+import pickle
+
+import pytest
+
+from template_compiler import CompiledTemplate, ExamplePool, compile_template
+from template_registry import registry
+
+EXAMPLES = [
+    {"tweet": "Build the wall", "target": "Donald Trump", "label": "FAVOR"},
+    {"tweet": "Impeach him now", "target": "Donald Trump", "label": "AGAINST"},
+]
+ROWS = [("A tweet with {braces} and \"quotes\"", "Donald Trump"), ("Another one\nover two lines", "Atheism")]
+
+
+@pytest.mark.parametrize("entry", [entry for entry in registry.list() if entry[3] == "prompts.py"],
+                         ids=lambda entry: "_".join(entry[:3]))
+def test_compiled_template_renders_like_the_function(entry):
+    dataset_name, model_name, shot, _ = entry
+    function = registry.get(dataset_name, model_name, shot)
+    examples = EXAMPLES if shot == "few_shot" else None
+    compiled = compile_template(function, examples)
+
+    assert compiled.is_compiled
+    for tweet, target in ROWS:
+        expected = function(tweet, target, examples) if examples else function(tweet, target)
+        prompt = compiled.render(tweet, target)
+        assert prompt == expected
+        assert prompt.startswith(compiled.shared_prefix)
+        assert prompt.startswith(compiled.prefix_for(target))
+        assert tweet not in compiled.prefix_for(target)
+
+
+def test_compiled_template_survives_pickling():
+    function = registry.get("PStance", "qwen2", "few_shot")
+    compiled = pickle.loads(pickle.dumps(compile_template(function, EXAMPLES)))
+    assert compiled.render(*ROWS[0]) == function(*ROWS[0], EXAMPLES)
+
+
+def test_template_that_transforms_the_tweet_falls_back_to_the_function():
+    compiled = CompiledTemplate(lambda tweet, target: f"{tweet.upper()} / {target}")
+    assert not compiled.is_compiled
+    assert compiled.shared_prefix == "" and compiled.prefix_for("x") == ""
+    assert compiled.render("hello", "x") == "HELLO / x"
+
+
+def test_compiled_templates_are_cached_per_example_set():
+    function = registry.get("PStance", "llama2", "few_shot")
+    first = compile_template(function, EXAMPLES)
+    assert compile_template(function, [dict(example) for example in EXAMPLES]) is first
+    assert compile_template(function, EXAMPLES[:1]) is not first
+
+
+def test_example_pool_renders_each_row_with_its_own_examples():
+    function = registry.get("PStance", "llama2", "few_shot")
+    pool = ExamplePool(function, EXAMPLES)
+    tweet, target = ROWS[0]
+    assert pool.compiled((1, 0)).render(tweet, target) == function(tweet, target, [EXAMPLES[1], EXAMPLES[0]])
+    assert pool.compiled((1,)).render(tweet, target) == function(tweet, target, [EXAMPLES[1]])
+    assert pool.compiled((1, 0)) is pool.compiled((1, 0))
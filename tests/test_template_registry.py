@@ -0,0 +1,38 @@
+import pytest
+
+import prompts
+from template_registry import GENERIC_MODEL, TemplateRegistry
+
+
+def _template(tweet, target, examples=None):
+    return tweet
+
+
+def test_datasets_are_derived_from_prompts(monkeypatch, tmp_path):
+    monkeypatch.setattr(prompts, "new_dataset_zero_shot_template", _template, raising=False)
+    monkeypatch.setattr(prompts, "new_dataset_qwen2_zero_shot_template", _template, raising=False)
+    monkeypatch.setattr(prompts, "other_set_llama2_few_shot_template", _template, raising=False)
+    (tmp_path / "new_dataset_phi3.toml").write_text('[zero_shot]\ntemplate = "{tweet}"\n', encoding="utf-8")
+
+    entries = {entry[:3] for entry in TemplateRegistry(str(tmp_path)).list()}
+    assert ("new_dataset", GENERIC_MODEL, "zero_shot") in entries
+    assert ("new_dataset", "qwen2", "zero_shot") in entries
+    assert ("new_dataset", "phi3", "zero_shot") in entries
+    # A dataset without a generic template is still split from a model other datasets have templates for
+    assert ("other_set", "llama2", "few_shot") in entries
+    assert ("PStance", "qwen2", "few_shot") in entries
+
+
+def test_get_data_template_and_missing_template(tmp_path):
+    (tmp_path / "semeval2016_phi3.toml").write_text(
+        '[few_shot]\ntemplate = "{examples}\\nTweet: {tweet}"\nexample = "{index}. {tweet} -> {label}"\n',
+        encoding="utf-8",
+    )
+    registry = TemplateRegistry(str(tmp_path))
+    template = registry.get("semeval2016", "phi3", "few_shot")
+    examples = [{"tweet": "a", "target": "t", "label": "FAVOR"}, {"tweet": "b", "target": "t", "label": "NONE"}]
+    assert template("c", "t", examples) == "1. a -> FAVOR\n\n2. b -> NONE\nTweet: c"
+    assert registry.get("semeval2016", "qwen2", "zero_shot") is prompts.semeval2016_qwen2_zero_shot_template
+
+    with pytest.raises(ValueError, match="semeval2016_phi3_zero_shot_template"):
+        registry.get("semeval2016", "phi3", "zero_shot")
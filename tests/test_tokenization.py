@@ -0,0 +1,62 @@
+import os
+
+from generate_zero_shot_prompts import generate_zero_shot_prompts
+from output_writers import read_rows
+from template_compiler import compile_template
+from tokenization import APPROX_TOKENIZER, TokenCounter, fit_to_budget
+from tokenized_output import TOKENS_SUFFIX, TokenizedPrompts
+
+
+def test_zero_shot_tokenized_output_within_budget(pstance_dir, tokenizer_file, tmp_path):
+    input_file = os.path.join(pstance_dir, "raw_test_trump.csv")
+    generate_zero_shot_prompts(input_file, str(tmp_path), "PStance", "qwen2", "trump", count_tokens=True,
+                               tokenizer=tokenizer_file)
+    output_name = os.path.join(str(tmp_path), "zero_shot", "PStance_qwen2_trump_prompts")
+    full_tokens = [row["prompt_tokens"] for row in read_rows(output_name + ".json", "json")]
+    max_tokens = sorted(full_tokens)[len(full_tokens) // 2]
+
+    generate_zero_shot_prompts(input_file, str(tmp_path), "PStance", "qwen2", "trump", tokenizer=tokenizer_file,
+                               tokenized=True, max_tokens=max_tokens)
+    rows = list(read_rows(output_name + ".json", "json"))
+    tokenized = TokenizedPrompts(output_name + TOKENS_SUFFIX)
+    counter = TokenCounter("qwen2", tokenizer_file)
+
+    assert any(row["tweet_truncated"] for row in rows)
+    assert len(tokenized) == len(rows)
+    for i, row in enumerate(rows):
+        assert "examples_used" not in row
+        assert row["prompt_tokens"] <= max_tokens
+        assert list(tokenized[i]) == counter.encode([row["prompt"]])[0]
+
+
+EXAMPLES = [
+    {"tweet": "one two three four five", "target": "T", "label": "FAVOR"},
+    {"tweet": "six seven eight nine ten", "target": "T", "label": "AGAINST"},
+]
+
+
+def _few_shot(tweet, target, examples):
+    block = "\n".join(f"{example['tweet']} -> {example['label']}" for example in examples)
+    return f"{block}\nTweet: {tweet}\nTarget: {target}"
+
+
+def test_fit_to_budget_drops_examples_before_truncating():
+    counter = TokenCounter("qwen2", APPROX_TOKENIZER)
+    template = compile_template(_few_shot, EXAMPLES)
+    tweet = "a b c d e f g h"
+    full = counter.count([template.render(tweet, "T")])[0]
+
+    (prompt, tokens, examples_used, truncated), = fit_to_budget(template, [(tweet, "T")], counter, full - 5)
+    assert (examples_used, truncated) == (1, False)
+    assert tokens <= full - 5 and prompt == _few_shot(tweet, "T", EXAMPLES[:1])
+
+    without_examples = counter.count([_few_shot(tweet, "T", [])])[0]
+    (prompt, tokens, examples_used, truncated), = fit_to_budget(template, [(tweet, "T")], counter, without_examples - 3)
+    assert (examples_used, truncated) == (0, True)
+    # The longest word prefix of the tweet that fits is kept
+    assert prompt == _few_shot("a b c d e", "T", [])
+    assert tokens == without_examples - 3
+
+
+def test_approx_counts_words_and_punctuation():
+    assert TokenCounter("anything", APPROX_TOKENIZER).count(["Hello, world!", ""]) == [4, 0]